@@ -0,0 +1,31 @@
+from sklearn.datasets import load_breast_cancer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import cross_val_score
+import sherpa
+
+
+parameters = [sherpa.Discrete('n_estimators', [2, 50]),
+              sherpa.Choice('criterion', ['gini', 'entropy']),
+              sherpa.Continuous('max_features', [0.1, 0.9])]
+
+algorithm = sherpa.algorithms.RandomSearch(max_num_trials=100)
+
+X, y = load_breast_cancer(return_X_y=True)
+
+
+def evaluate(trial):
+    clf = RandomForestClassifier(criterion=trial.parameters['criterion'],
+                                 max_features=trial.parameters['max_features'],
+                                 n_estimators=trial.parameters['n_estimators'],
+                                 random_state=0)
+    return cross_val_score(clf, X, y, cv=5).mean()
+
+
+if __name__ == '__main__':
+    study = sherpa.Study(parameters=parameters,
+                         algorithm=algorithm,
+                         lower_is_better=False,
+                         disable_dashboard=True)
+
+    # Evaluates four trials at a time in worker processes.
+    print(study.run(evaluate, max_concurrent=4, executor='process'))
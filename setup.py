@@ -27,7 +27,7 @@ AUTHOR = 'Lars Hertel, Peter Sadowski, and Julian Collado'
 
 REQUIRED = [
     'pandas>=0.20.3',
-    'pymongo>=3.5.1',
+    'pymongo>=3.7',
     'numpy>=1.8.2',
     'scipy>=1.0.0,<=1.4.1',
     'scikit-learn>=0.19.1',
@@ -257,6 +257,35 @@ class RandomSearch(Algorithm):
             self.count += 1
             return {p.name: p.sample() for p in parameters}
 
+    def get_suggestions(self, parameters, n, results=None,
+                        lower_is_better=True):
+        """
+        Samples many parameter configurations at once.
+
+        Each parameter draws all of its values in one call, which makes
+        generating large candidate sets, e.g. for screening or scoring with a
+        surrogate model, fast. The configurations count towards
+        ``max_num_trials``.
+
+        Args:
+            parameters (list[sherpa.Parameter]): the parameters.
+            n (int): number of configurations.
+            results (pandas.DataFrame): all results so far, unused.
+            lower_is_better (bool): unused.
+
+        Returns:
+            pandas.DataFrame: one row per configuration and one column per
+            parameter, or ``AlgorithmState.DONE`` if ``max_num_trials``
+            configurations were already sampled.
+        """
+        n = min(n, self.max_num_trials - self.count)
+        if n <= 0:
+            return AlgorithmState.DONE
+        self.count += n
+        return pandas.DataFrame(collections.OrderedDict(
+            (p.name, p.sample(size=n)) for p in parameters))
+
+
 class Iterate(Algorithm):
     """
     Iterate over a set of fully-specified hyperparameter combinations.
@@ -485,7 +514,13 @@ class StoppingRule(object):
     """
     Abstract class to evaluate whether a trial should stop conditional on all
     results so far.
+
+    Stopping rules that set ``uses_trial_summaries`` are additionally passed
+    the per-trial summaries of ``sherpa.core.Study.get_trial_summaries`` as
+    the keyword argument ``trial_summaries``.
     """
+    uses_trial_summaries = False
+
     def should_trial_stop(self, trial, results, lower_is_better):
         """
         Args:
@@ -522,20 +557,31 @@ class MedianStoppingRule(StoppingRule):
         min_trials (int): the minimum number of comparison trials needed for a
             trial to be stopped.
     """
+    uses_trial_summaries = True
+
     def __init__(self, min_iterations=0, min_trials=1):
         self.min_iterations = min_iterations
         self.min_trials = min_trials
 
-    def should_trial_stop(self, trial, results, lower_is_better):
+    def should_trial_stop(self, trial, results, lower_is_better,
+                          trial_summaries=None):
         """
         Args:
             trial (sherpa.Trial): trial to be stopped.
             results (pandas.DataFrame): all results so far.
             lower_is_better (bool): whether lower objective values are better.
+            trial_summaries (pandas.DataFrame): per-trial best objective and
+                maximum iteration indexed by Trial-ID. If given, the decision
+                is made from these instead of scanning ``results``.
 
         Returns:
             bool: decision.
         """
+        if trial_summaries is not None:
+            return self._should_trial_stop_from_summaries(trial,
+                                                          trial_summaries,
+                                                          lower_is_better)
+
         if len(results) == 0:
             return False
         
@@ -575,6 +621,35 @@ class MedianStoppingRule(StoppingRule):
 
         return decision
 
+    def _should_trial_stop_from_summaries(self, trial, trial_summaries,
+                                          lower_is_better):
+        if trial.id not in trial_summaries.index:
+            return False
+
+        summary = trial_summaries.loc[trial.id]
+        if summary['Iteration'] < self.min_iterations:
+            return False
+
+        trial_obj_val = summary['Objective']
+        if numpy.isnan(trial_obj_val):
+            alglogger.debug("Value {} is NaN for trial {}".format(
+                trial_obj_val, trial.id))
+            return True
+
+        others = trial_summaries.drop(trial.id)
+        comparison_vals = others.loc[
+            ~(others['Iteration'] < self.min_iterations), 'Objective']
+
+        if len(comparison_vals) < self.min_trials:
+            return False
+
+        if lower_is_better:
+            decision = trial_obj_val > numpy.nanmedian(comparison_vals)
+        else:
+            decision = trial_obj_val < numpy.nanmedian(comparison_vals)
+
+        return decision
+
 
 def get_sample_results_and_params():
     """
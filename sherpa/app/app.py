@@ -1,7 +1,9 @@
 import logging
+import math
+import numpy
 import pandas
 from flask import Flask
-from flask import render_template, flash, redirect
+from flask import render_template, flash, redirect, request, jsonify
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -11,18 +13,136 @@ class SherpaApp(Flask):
     def __init__(self, *args, **kwargs):
         Flask.__init__(self, *args, **kwargs)
         self.parameter_types = {}
+        self.lower_is_better = True
+        self._curves = {}  # maps Trial-ID to (count, points, curve).
+        self._curves_generation = None
     
     def set_results_channel(self, results_channel):
         self.results = pandas.DataFrame()
         self.results_channel = results_channel
+        self._curves = {}
 
     def set_stopping_channel(self, stopping_channel):
         self.stopping_channel = stopping_channel
 
     def get_results(self):
-        # while not self.results_channel.empty():
-        #     self.results = self.results_channel.get()
-        return self.results_channel.df
+        return self.results_channel.read()
+
+    def get_results_since(self, generation, cursor, finalized_only=False):
+        return self.results_channel.rows_since(generation, cursor,
+                                               finalized_only=finalized_only)
+
+    def get_summaries(self):
+        """
+        Returns:
+            tuple: column names and one row per trial with its parameters,
+            status, number of intermediate observations, last iteration and
+            best intermediate objective.
+        """
+        with self.results_channel.read_table() as (_, table):
+            parameters = [p for p in self.parameter_types
+                          if p in table.columns]
+            columns = (['Trial-ID', 'Status', 'Count', 'Iteration',
+                        'Objective'] + parameters)
+            rows = []
+            for trial_id, summary in table.trial_summaries().items():
+                first = table.row(table.trial_rows(trial_id)[0])
+                objective, _ = summary.best(self.lower_is_better)
+                rows.append([trial_id, summary.status, summary.count,
+                             summary.max_iteration, objective]
+                            + [first[p] for p in parameters])
+        return columns, rows
+
+    def get_curves(self, points, generation=None, cursor=0):
+        """
+        Learning curves of the trials with observations after row ``cursor``,
+        each downsampled to at most ``points`` points. Curves are cached
+        until their trial has new observations.
+
+        Args:
+            points (int): maximum number of points per curve.
+            generation (int): generation of the caller's curves, as returned
+                by an earlier call. If the results were reset since, all
+                curves are returned.
+            cursor (int): number of rows the caller's curves include.
+
+        Returns:
+            tuple: the current generation, the new cursor and a dict of
+            Trial-ID to a list of (iteration, objective) pairs.
+        """
+        with self.results_channel.read_table() as (current, table):
+            if current != self._curves_generation:
+                self._curves = {}
+                self._curves_generation = current
+            size = len(table)
+            if generation != current:
+                cursor = 0
+            cursor = min(max(cursor, 0), size)
+            if (cursor == size or not all(
+                    c in table.columns
+                    for c in ('Status', 'Iteration', 'Objective'))):
+                return current, size, {}
+            status = table.column('Status')
+            iteration = table.column('Iteration')
+            objective = table.column('Objective')
+            curves = {}
+            for trial_id in pandas.unique(table.column('Trial-ID')[cursor:]):
+                summary = table.trial_summary(trial_id)
+                cached = self._curves.get(trial_id)
+                if cached is None or cached[:2] != (summary.count, points):
+                    rows = numpy.array(table.trial_rows(trial_id))
+                    rows = rows[status[rows] == 'INTERMEDIATE']
+                    x = iteration[rows].astype(float)
+                    y = objective[rows].astype(float)
+                    valid = ~(numpy.isnan(x) | numpy.isnan(y))
+                    x, y = x[valid], y[valid]
+                    order = numpy.argsort(x, kind='mergesort')
+                    x, y = x[order], y[order]
+                    keep = _lttb(x, y, points)
+                    cached = (summary.count, points,
+                              list(zip(x[keep].tolist(), y[keep].tolist())))
+                    self._curves[trial_id] = cached
+                curves[trial_id] = cached[2]
+        return current, size, curves
+
+
+def _lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last point and, from each of ``threshold - 2``
+    buckets in between, the point forming the largest triangle with the
+    previously kept point and the average of the next bucket. This keeps the
+    visual shape of a curve with few points.
+
+    Args:
+        x (numpy.ndarray): sorted x-values.
+        y (numpy.ndarray): y-values.
+        threshold (int): maximum number of points to keep.
+
+    Returns:
+        numpy.ndarray: indices of the points to keep.
+    """
+    n = len(x)
+    if threshold >= n:
+        return numpy.arange(n)
+    if threshold < 3:
+        return numpy.array([0, n - 1][:max(threshold, 1)])
+    num_buckets = threshold - 2
+    bound = lambda i: i * (n - 2) // num_buckets + 1  # start of bucket i.
+    keep = numpy.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(num_buckets):
+        start, end = bound(i), bound(i + 1)
+        next_end = bound(i + 2) if i + 1 < num_buckets else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = numpy.abs((x[a] - avg_x) * (y[start:end] - y[a])
+                         - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(numpy.argmax(area))
+        keep[i + 1] = a
+    return keep
 
 
 app = SherpaApp(__name__)
@@ -42,13 +162,75 @@ def index():
         active_trials = [{'id': i} for i in active_ids]
         return render_template("index.html",
                                active_trials=active_trials,
-                               parameter_types=app.parameter_types,
-                               results=[row.to_dict() for idx, row in results.iterrows()])
+                               parameter_types=app.parameter_types)
     else:
         return render_template("index.html",
                                active_trials=[],
-                               parameter_types=app.parameter_types,
-                               results=[])
+                               parameter_types=app.parameter_types)
+
+
+@app.route('/results')
+def results_since():
+    """
+        Rows added since the client's cursor, as JSON.
+
+        The client passes back the ``generation`` and ``cursor`` of its
+        previous response. All rows are sent if the generation changed, i.e.
+        the results were replaced. Rows are lists of values in the order of
+        ``columns``. With ``finalized=1`` intermediate rows are left out.
+    """
+    generation = request.args.get('generation', default=None, type=int)
+    cursor = request.args.get('cursor', default=0, type=int)
+    finalized_only = request.args.get('finalized', default=0, type=int) == 1
+    generation, cursor, rows = app.get_results_since(
+        generation, cursor, finalized_only=finalized_only)
+    columns = list(rows[0]) if rows else []
+    return jsonify(generation=generation, cursor=cursor, columns=columns,
+                   rows=[[_to_json(value) for value in row.values()]
+                         for row in rows])
+
+
+@app.route('/summaries')
+def summaries():
+    """
+        One row per trial with its parameters, status, number of
+        observations, last iteration and best objective, as JSON.
+    """
+    columns, rows = app.get_summaries()
+    return jsonify(columns=columns,
+                   rows=[[_to_json(value) for value in row] for row in rows])
+
+
+@app.route('/curves')
+def curves():
+    """
+        Learning curves as JSON, each downsampled to at most ``points``
+        (iteration, objective) pairs.
+
+        Like ``/results``, the client passes back the ``generation`` and
+        ``cursor`` of its previous response and only receives the curves of
+        trials with new observations since. All curves are sent if the
+        generation changed.
+    """
+    points = max(request.args.get('points', default=200, type=int), 2)
+    generation = request.args.get('generation', default=None, type=int)
+    cursor = request.args.get('cursor', default=0, type=int)
+    generation, cursor, curves = app.get_curves(points, generation, cursor)
+    return jsonify(generation=generation, cursor=cursor,
+                   curves={str(_to_json(trial_id)):
+                           [[_to_json(x), _to_json(y)] for x, y in curve]
+                           for trial_id, curve in curves.items()})
+
+
+def _to_json(value):
+    """
+        Converts NumPy scalars, NaN and infinity, which JSON cannot represent.
+    """
+    if isinstance(value, numpy.generic):
+        value = value.item()
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    return value
 
 
 
@@ -20,6 +20,7 @@ along with SHERPA.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import absolute_import
 import os
 import sys
+import random
 import numpy
 import pandas
 import collections
@@ -30,8 +31,11 @@ import multiprocessing
 import warnings
 import contextlib
 import shlex
-from .database import _Database
-from .schedulers import _JobStatus
+import threading
+from .database import _Database, _SQLiteDatabase, _BackgroundSender
+from .schedulers import _JobStatus, LocalPoolScheduler
+from .results import (_ResultsTable, _ResultsChannel, _ResultsJournal,
+                      _write_atomically)
 import datetime
 try:
     import cPickle as pickle
@@ -97,7 +101,10 @@ class Study(object):
         self.algorithm = algorithm
         self.stopping_rule = stopping_rule
         self.lower_is_better = lower_is_better
-        self.results = pandas.DataFrame()
+        self._results = _ResultsTable()
+        self._journal = None
+        self._runner_state = None
+        self._runner_journal = (None, 0)  # directory, number of updates.
         self.num_trials = 0
         self._trial_queue = collections.deque()
         self.output_dir = output_dir
@@ -109,15 +116,30 @@ class Study(object):
                 raise EnvironmentError('Dashboard not supported on Windows. Disable the dashboard and save the '
                                        'finalized study instead.')
 
-            self._mgr = multiprocessing.Manager()
-            self._results_channel = self._mgr.Namespace()
-            self._results_channel.df = self.results
+            self._results_channel = _ResultsChannel()
             self._stopping_channel = multiprocessing.Queue()
             dashboard_port = dashboard_port or _port_finder(8880, 9999)
             self.dashboard_process = self._run_web_server(dashboard_port)
         else:
             self.dashboard_process = None
 
+    @property
+    def results(self):
+        """
+        pandas.DataFrame: all observations so far, one row per observation
+        plus one row per finalized trial. The dataframe is built from the
+        underlying columnar store on access and cached until the next change.
+        """
+        return self._results.to_frame()
+
+    @results.setter
+    def results(self, df):
+        self._results = _ResultsTable.from_frame(df)
+        if self._journal is not None:
+            self._journal.invalidate()
+        if self.dashboard_process:
+            self._results_channel.reset(df)
+
     def add_observation(self, trial, objective, iteration=1, context={}):
         """
         Add a single observation of the objective value for a given trial.
@@ -130,9 +152,7 @@ class Study(object):
             context (dict): other metrics or values to record.
         """
         assert isinstance(trial, Trial), "Trial must be sherpa.core.Trial"
-        if not self.results.empty and\
-                ((self.results['Trial-ID'] == trial.id)
-                     & (self.results['Iteration'] == iteration)).any():
+        if self._results.has_observation(trial.id, iteration):
             raise ValueError("Observation for Trial-ID {} at Iteration {} "
                              "already exists.".format(trial.id, iteration))
         if not all(p.name in trial.parameters for p in self.parameters):
@@ -154,12 +174,11 @@ class Study(object):
         row += sorted(context.items(), key=lambda t: t[0])
 
         # Use ordered dict to maintain order
-        row = collections.OrderedDict([(key, [value]) for key, value in row])
-        self.results = self.results.append(pandas.DataFrame.from_dict(row),
-                                           ignore_index=True)
+        row = collections.OrderedDict(row)
+        self._results.append(row)
 
         if self.dashboard_process:
-            self._results_channel.df = self.results
+            self._results_channel.append(row)
 
     def finalize(self, trial, status='COMPLETED'):
         """
@@ -173,31 +192,26 @@ class Study(object):
         assert isinstance(trial, Trial), "Trial must be sherpa.core.Trial"
         assert status in ['COMPLETED', 'FAILED', 'STOPPED']
 
-        try:
-            rows = self.results.loc[self.results['Trial-ID'] == trial.id]
-            if len(rows) == 0:
-                raise KeyError
-        except KeyError:
+        summary = self._results.trial_summary(trial.id)
+        if summary is None:
             raise ValueError("Trial {} does not exist or did not "
                              "submit metrics.".format(trial.id))
 
         # Find best row as minimum or maximum objective
-        best_idx = (rows['Objective'].idxmin() if self.lower_is_better
-                    else rows['Objective'].idxmax())
-        try:
-            best_row = rows.loc[best_idx].copy()
-        except TypeError:
+        _, best_idx = summary.best(self.lower_is_better)
+        if best_idx is None:
             warnings.warn("Could not finalize trial {}. Only NaNs "
                           "encountered.".format(trial.id), RuntimeWarning)
             return
+        best_row = self._results.row(best_idx)
 
         # Set status and append
         best_row['Status'] = status
-        best_row['Iteration'] = rows['Iteration'].max()
-        self.results = self.results.append(best_row, ignore_index=True)
+        best_row['Iteration'] = summary.max_iteration
+        self._results.append(best_row)
 
         if self.dashboard_process:
-            self._results_channel.df = self.results
+            self._results_channel.append(best_row)
 
     def get_suggestion(self):
         """
@@ -243,10 +257,35 @@ class Study(object):
             return True
 
         if self.stopping_rule:
+            if self.stopping_rule.uses_trial_summaries:
+                return self.stopping_rule.should_trial_stop(
+                    trial, self.results, self.lower_is_better,
+                    trial_summaries=self.get_trial_summaries())
             return self.stopping_rule.should_trial_stop(trial, self.results,
                                                         self.lower_is_better)
         else:
             return False
+
+    def get_trial_summaries(self):
+        """
+        Per-trial summaries that are maintained as observations are added.
+
+        Returns:
+            pandas.DataFrame: one row per trial indexed by Trial-ID with the
+            best objective (``Objective``), the largest iteration
+            (``Iteration``), the number of observations (``Count``) and of
+            NaN objectives (``NaN-Count``), and the latest ``Status``.
+        """
+        summaries = self._results.trial_summaries()
+        best = [s.best(self.lower_is_better)[0] for s in summaries.values()]
+        df = pandas.DataFrame(collections.OrderedDict(
+            [('Objective', best),
+             ('Iteration', [s.max_iteration for s in summaries.values()]),
+             ('Count', [s.count for s in summaries.values()]),
+             ('NaN-Count', [s.nan_count for s in summaries.values()]),
+             ('Status', [s.status for s in summaries.values()])]),
+            index=pandas.Index(list(summaries), name='Trial-ID'))
+        return df
         
     def add_trial(self, trial):
         """
@@ -276,6 +315,76 @@ class Study(object):
                                               lower_is_better=
                                               self.lower_is_better)
         
+    def run(self, function, max_concurrent=1, executor='thread'):
+        """
+        Evaluates trials in parallel in this process, without a database or
+        a job scheduler.
+
+        Trials are suggested by the algorithm as usual and passed to
+        ``function`` on a ``concurrent.futures`` pool. Its return value is
+        added as the only observation of the trial, which is then
+        finalized. A trial whose ``function`` raises is logged and skipped.
+        If the study has an output dir it is saved after every trial.
+
+        Args:
+            function (callable): takes a ``sherpa.core.Trial`` and returns
+                the objective, or a tuple of the objective and a dict of
+                context metrics. Needs to be picklable for processes.
+            max_concurrent (int): the number of trials that will be evaluated
+                in parallel.
+            executor (str or concurrent.futures.Executor): ``'thread'`` or
+                ``'process'`` to run trials on a pool of ``max_concurrent``
+                threads or processes, or an executor to submit them to.
+
+        Returns:
+            pandas.DataFrame: row of the best result.
+        """
+        import concurrent.futures
+        if executor == 'thread':
+            pool = concurrent.futures.ThreadPoolExecutor(max_concurrent)
+        elif executor == 'process':
+            pool = concurrent.futures.ProcessPoolExecutor(max_concurrent)
+        else:
+            pool = executor
+
+        running = {}  # future to trial.
+        done = False  # whether the algorithm is done.
+        try:
+            while True:
+                while not done and len(running) < max_concurrent:
+                    trial = self.get_suggestion()
+                    if trial is None or trial == AlgorithmState.DONE:
+                        done = True
+                    elif trial == AlgorithmState.WAIT:
+                        break
+                    else:
+                        running[pool.submit(function, trial)] = trial
+                if not running:
+                    # Nothing is running that could end a wait.
+                    break
+                finished, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    trial = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception:
+                        logger.exception("Trial {} failed.".format(trial.id))
+                        continue
+                    objective, context = (result if isinstance(result, tuple)
+                                          else (result, {}))
+                    self.add_observation(trial=trial, objective=objective,
+                                         context=context)
+                    self.finalize(trial=trial)
+                    if self.output_dir:
+                        self.save(compact=None)
+        finally:
+            if pool is not executor:
+                pool.shutdown(wait=False)
+        if self.output_dir:
+            self.save(export_csv=True)
+        return self.get_best_result()
+
     def _run_web_server(self, port):
         """
         Runs the SHERPA dashboard.
@@ -298,6 +407,7 @@ class Study(object):
             else:
                 param_types[p.name] = 'string'
         app.parameter_types = param_types
+        app.lower_is_better = self.lower_is_better
                 
         app.set_results_channel(self._results_channel)
         app.set_stopping_channel(self._stopping_channel)
@@ -322,13 +432,40 @@ class Study(object):
         proc.start()
         return proc
 
-    def save(self, output_dir=None):
+    def save(self, output_dir=None, compact=True, export_csv=False,
+             runner_state=None, runner_updates=None):
         """
-        Stores results to CSV and attributes to config file.
+        Stores results and attributes to config file.
+
+        Results added since the previous save are appended to
+        ``results.journal`` and synced to disk in one batch. With ``compact``
+        the journal is folded into ``results.npz``, a binary snapshot that
+        keeps column dtypes. With ``compact=None`` this only happens once the
+        journal holds as many rows as the snapshot, which keeps the total
+        amount written linear in the number of results.
+        ``Study.load_dashboard`` reads both files.
+
+        Everything else needed to resume the study with ``Study.load``, i.e.
+        the algorithm, stopping rule, trial queue and random number generator
+        states, is pickled to ``checkpoint.pkl``.
+
+        The state of the ``sherpa.core._Runner`` grows with the number of
+        trials and is stored like the results: ``runner_updates`` are
+        appended to ``runner.journal``, which is folded into ``runner.pkl``
+        once it holds as many updates as the state has entries.
 
         Args:
-            output_dir (str): directory to store CSV to, only needed if Study
-                output_dir is not defined.
+            output_dir (str): directory to store results to, only needed if
+                Study output_dir is not defined.
+            compact (bool): whether to write all results to ``results.npz``.
+            export_csv (bool): whether to also write all results to
+                ``results.csv``.
+            runner_state (dict): state of the ``sherpa.core._Runner``,
+                replaces the stored one.
+            runner_updates (list[tuple]): changes of the runner state since
+                the previous save as ``(key, item, value)`` triples that set
+                ``runner_state[key][item]`` to ``value``, or remove the item
+                if ``value`` is None.
 
         """
         if not output_dir:
@@ -342,8 +479,142 @@ class Study(object):
         with open(os.path.join(d, 'config.pkl'), 'wb') as f:
             pickle.dump(cfg, f)
 
-        self.results.to_csv(os.path.join(self.output_dir or output_dir,
-                                         'results.csv'), index=False)
+        if self._journal is None or self._journal.directory != d:
+            if self._journal is not None:
+                self._journal.close()
+            self._journal = _ResultsJournal(d)
+        self._journal.save(self._results, compact=compact)
+
+        # Written before the checkpoint, so that a crash in between leaves
+        # the runner knowing about trials the algorithm may not.
+        self._save_runner_state(d, runner_state, runner_updates)
+        checkpoint = {'algorithm': self.algorithm,
+                      'stopping_rule': self.stopping_rule,
+                      'trial_queue': list(self._trial_queue),
+                      'sherpa_random_state': rng.get_state(),
+                      'numpy_random_state': numpy.random.get_state(),
+                      'random_state': random.getstate()}
+        try:
+            data = pickle.dumps(checkpoint, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            warnings.warn("Could not pickle algorithm or stopping rule, "
+                          "Study.load will use the ones passed to the "
+                          "study: {}".format(e), RuntimeWarning)
+            checkpoint.update(algorithm=None, stopping_rule=None)
+            data = pickle.dumps(checkpoint, protocol=pickle.HIGHEST_PROTOCOL)
+        _write_atomically(os.path.join(d, 'checkpoint.pkl'), data)
+        if export_csv:
+            self.results.to_csv(os.path.join(d, 'results.csv'), index=False)
+
+    def _save_runner_state(self, d, runner_state, runner_updates):
+        """
+        Applies ``runner_updates`` to the runner state and appends them to
+        the journal, or writes the whole state once the journal is as large
+        as the state, see ``save``.
+        """
+        if runner_state is not None:
+            self._runner_state = runner_state
+        elif runner_updates:
+            if self._runner_state is None:
+                self._runner_state = {}
+            for key, item, value in runner_updates:
+                items = self._runner_state.setdefault(
+                    key, collections.OrderedDict())
+                if value is None:
+                    items.pop(item, None)
+                else:
+                    items[item] = value
+        elif self._runner_journal[0] == d:
+            return
+        if self._runner_state is None:
+            return
+
+        directory, size = self._runner_journal
+        journal = os.path.join(d, 'runner.journal')
+        if (runner_state is None and directory == d
+                and size + len(runner_updates) < max(
+                    1000, sum(len(v) for v in self._runner_state.values()))):
+            with open(journal, 'ab') as f:
+                pickle.dump(runner_updates, f, pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            self._runner_journal = (d, size + len(runner_updates))
+            return
+        _write_atomically(os.path.join(d, 'runner.pkl'),
+                          pickle.dumps(self._runner_state,
+                                       protocol=pickle.HIGHEST_PROTOCOL))
+        open(journal, 'wb').close()
+        self._runner_journal = (d, 0)
+
+    def _load_runner_state(self, d):
+        """
+        Reads ``runner.pkl`` and replays ``runner.journal`` in ``d``.
+        """
+        self._runner_state = None
+        path = os.path.join(d, 'runner.pkl')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                self._runner_state = pickle.load(f)
+        updates = []
+        journal = os.path.join(d, 'runner.journal')
+        if os.path.exists(journal):
+            with open(journal, 'rb') as f:
+                while True:
+                    try:
+                        updates.extend(pickle.load(f))
+                    except EOFError:
+                        break
+                    except Exception:
+                        # Last record cut short by a crash.
+                        break
+        self._runner_journal = (None, 0)
+        if updates:
+            # Folds the journal into a new snapshot. Updates the snapshot
+            # already holds, e.g. after a crash during compaction, set the
+            # same final values again.
+            self._save_runner_state(d, None, updates)
+        else:
+            self._runner_journal = (d, 0)
+
+    def load(self, output_dir=None):
+        """
+        Resumes the study from the last ``Study.save`` in the output dir.
+
+        Results, number of trials, queued trials, the algorithm and stopping
+        rule including their internal state, and the random number generator
+        states are restored. The algorithm and stopping rule passed to the
+        study are replaced by the saved ones, unless they could not be
+        pickled.
+
+        Args:
+            output_dir (str): directory to load from, only needed if Study
+                output_dir is not defined.
+
+        Returns:
+            dict: the state of the ``sherpa.core._Runner`` stored with
+                ``Study.save``, None if there is none.
+        """
+        d = self.output_dir or output_dir
+        assert d, "If no output-directory is specified, a directory needs " \
+                  "to be passed as argument"
+        with open(os.path.join(d, 'config.pkl'), 'rb') as f:
+            cfg = pickle.load(f)
+        with open(os.path.join(d, 'checkpoint.pkl'), 'rb') as f:
+            checkpoint = pickle.load(f)
+
+        self.results = _ResultsJournal.load(d)
+        self.num_trials = cfg['num_trials']
+        if checkpoint['algorithm'] is not None:
+            self.algorithm = checkpoint['algorithm']
+            self.stopping_rule = checkpoint['stopping_rule']
+        self._trial_queue = collections.deque(checkpoint['trial_queue'])
+        rng.set_state(checkpoint['sherpa_random_state'])
+        numpy.random.set_state(checkpoint['numpy_random_state'])
+        random.setstate(checkpoint['random_state'])
+        self._load_runner_state(d)
+        logger.info("Resumed study with {} trials and {} results from "
+                    "{}".format(self.num_trials, len(self._results), d))
+        return self._runner_state
 
     @staticmethod
     def load_dashboard(path):
@@ -364,10 +635,8 @@ class Study(object):
                   lower_is_better=cfg['lower_is_better'],
                   algorithm=None, output_dir=path)
 
-        results_path = os.path.join(path, 'results.csv')
-        s.results = pandas.read_csv(results_path)
+        s.results = _ResultsJournal.load(path)
         s.num_trials = cfg['num_trials']
-        s._results_channel.df = s.results
         return s
 
     def __iter__(self):
@@ -389,7 +658,8 @@ class Study(object):
     def next(self):
         return self.__next__()
 
-    def keras_callback(self, trial, objective_name, context_names=[]):
+    def keras_callback(self, trial, objective_name, context_names=[],
+                       asynchronous=False):
         """
         Keras Callbacks to add observations to study
 
@@ -399,13 +669,39 @@ class Study(object):
                 ``val_loss``, or any of the submitted metrics.
             context_names (list[str]): names of all other metrics to be
                 monitored.
+            asynchronous (bool): if True, observations are added from a
+                background thread so that training does not wait for them,
+                e.g. for the dashboard update. All of them have been added
+                once training ends.
         """
         import keras.callbacks
         send_call = lambda epoch, logs: self.add_observation(trial=trial,
                                                              iteration=epoch,
                                                              objective=logs[objective_name],
                                                              context={n: logs[n] for n in context_names})
-        return keras.callbacks.LambdaCallback(on_epoch_end=send_call)
+        if not asynchronous:
+            return keras.callbacks.LambdaCallback(on_epoch_end=send_call)
+
+        def send(observations, final):
+            for epoch, logs in observations:
+                try:
+                    send_call(epoch, logs)
+                except ValueError as e:
+                    logger.warning(e)
+
+        senders = []  # the sender of the current training run.
+
+        def on_epoch_end(epoch, logs):
+            if not senders:
+                senders.append(_BackgroundSender(send))
+            senders[0].put((epoch, dict(logs)))
+
+        def on_train_end(logs):
+            if senders:
+                senders.pop().close()
+
+        return keras.callbacks.LambdaCallback(on_epoch_end=on_epoch_end,
+                                              on_train_end=on_train_end)
 
 
 class _Runner(object):
@@ -425,27 +721,57 @@ class _Runner(object):
     Args:
         study (sherpa.core.Study): the study that is run.
         scheduler (sherpa.schedulers.Scheduler): a scheduler object.
-        database (sherpa.database._Database): the database.
+        database (sherpa.database._Storage): the database.
         max_concurrent (int): how many trials to run in parallel.
         command (list[str]): components of the command that runs a trial script
             e.g. ["python", "train_nn.py"].
         resubmit_failed_trials (bool): whether a failed trial should be
             resubmitted.
+        min_wait (float): seconds to wait between loop iterations after an
+            iteration in which something changed.
+        max_wait (float): the wait doubles for every iteration in which
+            nothing changed, up to this many seconds. Setting ``min_wait``
+            equal to ``max_wait`` gives a fixed polling interval.
+        submit_workers (int): number of threads that enqueue and submit new
+            trials while the next suggestions are computed. With 0,
+            suggesting and submitting happen one after the other in the
+            loop.
+        prefetch (int): number of suggestions computed ahead of free slots.
+            Prefetched suggestions do not see results that arrive while
+            they wait for a slot.
         
     """
     def __init__(self, study, scheduler, database, max_concurrent,
-                 command, resubmit_failed_trials=False):
+                 command, resubmit_failed_trials=False, min_wait=0.1,
+                 max_wait=5., submit_workers=2, prefetch=0):
         self.max_concurrent = max_concurrent
         self.command = command
         self.resubmit_failed_trials = resubmit_failed_trials
         self.scheduler = scheduler
         self.database = database
         self.study = study
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.prefetch = prefetch
+        self._wakeup = threading.Event()  # set by scheduler/database events.
+        self._study_lock = threading.RLock()  # study is shared with suggester.
+        if submit_workers:
+            import concurrent.futures
+            self._suggester = concurrent.futures.ThreadPoolExecutor(1)
+            self._submitter = concurrent.futures.ThreadPoolExecutor(
+                submit_workers)
+        else:
+            self._suggester = self._submitter = _InlineExecutor()
+        self._suggesting = None  # future of the running suggestion task.
+        self._suggestions = collections.deque()  # trials to be submitted.
+        self._submitting = []  # futures and trials being submitted.
+        self._algorithm_done = False  # whether the algorithm is done.
 
         self._done = False  # whether optimization is done.
         self._active_trials = []  # ids of trials that are active.
         self._queued_for_stopping = set()  # trials that need to be stopped.
         self._all_trials = {}  # maps trial id to Trial object, process ID.
+        self._state_updates = []  # changes to checkpoint with the next save.
         self._trial_status = {_JobStatus.finished: 'COMPLETED',
                               _JobStatus.killed: 'STOPPED',
                               _JobStatus.failed: 'FAILED',
@@ -455,6 +781,9 @@ class _Runner(object):
         """
         Get rows from database and check if anything new needs to be added to
         the results-table.
+
+        Returns:
+            int: the number of observations added.
         """
         results = self.database.get_new_results()
         if results != [] and self._all_trials == {}:
@@ -463,25 +792,21 @@ class _Runner(object):
                              "(1)\toutput_dir is empty\n"
                              "(2)\tno other database is running on this port.")
 
+        num_added = 0
+
         for r in results:
-            try:
-                # Check if trial has already been collected.
-                new_trial = (r.get('trial_id') not in
-                             set(self.study.results['Trial-ID']))
-            except KeyError:
-                new_trial = True
-
-            if not new_trial:
-                trial_idxs = self.study.results['Trial-ID'] == r.get('trial_id')
-                trial_rows = self.study.results[trial_idxs]
-                new_observation = (r.get('iteration') not in
-                                   set(trial_rows['Iteration']))
-            else:
-                new_observation = True
+            # Check if observation has already been collected.
+            new_observation = not self.study._results.has_observation(
+                r.get('trial_id'), r.get('iteration'))
 
-            if new_trial or new_observation:
+            if new_observation:
                 # Retrieve the Trial object
                 tid = r.get('trial_id')
+                if tid not in self._all_trials:
+                    # Submitted after the checkpoint the runner resumed from.
+                    logger.warning("Ignoring results of unknown Trial "
+                                   "{}.".format(tid))
+                    continue
                 tdict = self._all_trials[tid]
                 t = tdict.get('trial')
 
@@ -489,15 +814,23 @@ class _Runner(object):
                                            iteration=r.get('iteration'),
                                            objective=r.get('objective'),
                                            context=r.get('context'))
+                num_added += 1
+        return num_added
 
     def update_active_trials(self):
         """
         Update active trials, finalize any completed/stopped/failed trials.
+
+        Returns:
+            int: the number of trials that are no longer active.
         """
+        num_ended = 0
+        logger.debug('Updating active trials.')
+        statuses = self.scheduler.get_statuses(
+            [self._all_trials[tid].get('job_id') for tid in self._active_trials])
         for i in reversed(range(len(self._active_trials))):
             tid = self._active_trials[i]
-            logger.debug('Updating active trials.')
-            status = self.scheduler.get_status(self._all_trials[tid].get('job_id'))
+            status = statuses[self._all_trials[tid].get('job_id')]
 
             if status in [_JobStatus.finished, _JobStatus.failed,
                           _JobStatus.killed, _JobStatus.other]:
@@ -507,8 +840,6 @@ class _Runner(object):
                 try:
                     self.study.finalize(trial=self._all_trials[tid].get('trial'),
                                         status=self._trial_status[status])
-                    self.study.save()
-
                 except ValueError as e:
                     warn_msg = str(e)
                     warn_msg += ("\nRelevant results not found in database."
@@ -522,6 +853,11 @@ class _Runner(object):
                         logger.info("Resubmitting Trial {}.".format(tid))
                         self.study.add_trial(self._all_trials[tid].get('trial'))
                 self._active_trials.pop(i)
+                self._state_updates.append(('active_trials', tid, None))
+                num_ended += 1
+        if num_ended:
+            self.save()
+        return num_ended
 
     def stop_bad_performers(self):
         """
@@ -538,51 +874,206 @@ class _Runner(object):
 
     def submit_new_trials(self):
         """
-        Get new trial and submit it to the job scheduler.
+        Get new trials and submit them to the job scheduler.
+
+        Submission is a pipeline whose stages overlap: suggestions are
+        computed in a background thread, and ``submit_workers`` threads
+        enqueue them in the database and submit them with
+        ``Scheduler.submit_jobs``, e.g. as one array job on a cluster. All
+        suggestions available when a slot is free are submitted together.
+        This method starts these stages and records the trials whose
+        submission completed.
+
+        Returns:
+            int: the number of trials handed to the scheduler.
+        """
+        free = (self.max_concurrent - len(self._active_trials)
+                - sum(len(trials) for _, trials in self._submitting))
+        wanted = free + self.prefetch - len(self._suggestions)
+        if (not self._algorithm_done and not self._is_suggesting()
+                and wanted > 0):
+            self._suggesting = self._suggester.submit(self._suggest, wanted)
+
+        new_trials = []
+        while self._suggestions and len(new_trials) < free:
+            new_trials.append(self._suggestions.popleft())
+        for trial in new_trials:
+            # Known before the submission ends, results may arrive earlier.
+            self._all_trials[trial.id] = {'trial': trial, 'job_id': None}
+            self._state_updates.append(
+                ('all_trials', trial.id, self._all_trials[trial.id]))
+        if new_trials:
+            self._submitting.append(
+                (self._submitter.submit(self._submit, new_trials), new_trials))
+
+        num_submitted = 0
+        for future, trials in list(self._submitting):
+            if not future.done():
+                continue
+            self._submitting.remove((future, trials))
+            for trial, job_id in zip(trials, future.result()):
+                self._all_trials[trial.id]['job_id'] = job_id
+                self._active_trials.append(trial.id)
+                self._state_updates += [
+                    ('all_trials', trial.id, self._all_trials[trial.id]),
+                    ('active_trials', trial.id, True)]
+                num_submitted += 1
+        if num_submitted:
+            self.save()
+
+        if (self._algorithm_done and not self._is_suggesting()
+                and not self._suggestions and not self._submitting
+                and not self._done):
+            logger.info("Optimization Algorithm finished.")
+            self._done = True
+        return num_submitted + len(new_trials)
+
+    def _is_suggesting(self):
+        """
+        Whether the suggestion task is running. Raises errors of the
+        algorithm once it has ended.
         """
-        while len(self._active_trials) < self.max_concurrent:
-            next_trial = self.study.get_suggestion()
+        if self._suggesting is not None and self._suggesting.done():
+            future, self._suggesting = self._suggesting, None
+            future.result()
+        return self._suggesting is not None
 
+    def _suggest(self, num_trials):
+        """
+        Gets up to ``num_trials`` suggestions from the study, stopping early
+        if the algorithm is done or asks to wait.
+        """
+        for _ in range(num_trials):
+            with self._study_lock:
+                next_trial = self.study.get_suggestion()
             # Check if algorithm is done.
             if next_trial is None or next_trial == AlgorithmState.DONE:
-                logger.info("Optimization Algorithm finished.")
-                self._done = True
+                self._algorithm_done = True
                 break
-
             if next_trial == AlgorithmState.WAIT:
                 break
-            
-            submit_msg = "\n" + "-"*55 + "\n" + "Submitting Trial {}:\n".format(next_trial.id)
-            for pname, pval in next_trial.parameters.items():
+            self._suggestions.append(next_trial)
+        self._wakeup.set()
+
+    def _submit(self, new_trials):
+        """
+        Enqueues trials in the database and submits them to the scheduler.
+
+        Returns:
+            list: the job IDs of the trials.
+        """
+        envs = []
+        for trial in new_trials:
+            submit_msg = "\n" + "-"*55 + "\n" + "Submitting Trial {}:\n".format(trial.id)
+            for pname, pval in trial.parameters.items():
                 submit_msg += "\t{0:15}={1:>31}\n".format(str(pname), str(pval))
             submit_msg += "-"*55 + "\n"
             logger.info(submit_msg)
 
-            self.database.enqueue_trial(next_trial)
-            pid = self.scheduler.submit_job(command=self.command,
-                                            env={'SHERPA_TRIAL_ID': str(next_trial.id),
-                                                 'SHERPA_DB_HOST': socket.gethostname(),
-                                                 'SHERPA_DB_PORT': str(self.database.port),
-                                                 'SHERPA_OUTPUT_DIR': self.study.output_dir},
-                                            job_name='trial_' + str(next_trial.id))
-            self._all_trials[next_trial.id] = {'trial': next_trial,
-                                              'job_id': pid}
-            self._active_trials.append(next_trial.id)
+            self.database.enqueue_trial(trial)
+            env = {'SHERPA_TRIAL_ID': str(trial.id),
+                   'SHERPA_OUTPUT_DIR': self.study.output_dir}
+            env.update(self.database.client_env())
+            envs.append(env)
+        job_ids = self.scheduler.submit_jobs(
+            command=self.command, envs=envs,
+            job_names=['trial_' + str(trial.id) for trial in new_trials])
+        self._wakeup.set()
+        return job_ids
+
+    def save(self):
+        """
+        Checkpoints the study together with the submitted trials and their
+        job IDs so that ``optimize(load=True)`` can resume from it. Only the
+        changes since the previous save are written.
+        """
+        updates, self._state_updates = self._state_updates, []
+        self.study.save(compact=None, runner_updates=updates)
+
+    def load(self, state):
+        """
+        Restores the submitted trials from a checkpoint.
+
+        Trials that were active are monitored again if the scheduler still
+        knows their job, e.g. a job on a cluster that kept running while
+        the optimization was down. Otherwise they are resubmitted, as are
+        trials whose submission had not completed.
+
+        Args:
+            state (dict): runner state returned by ``Study.load``.
+        """
+        self._all_trials = dict(state.get('all_trials', {}))
+        active = list(state.get('active_trials', []))
+        for tid, tdict in self._all_trials.items():
+            if tid in active or tdict.get('job_id') is not None:
+                continue
+            logger.info("Resubmitting Trial {}.".format(tid))
+            self.study.add_trial(tdict.get('trial'))
+        for tid in active:
+            try:
+                self.scheduler.get_status(self._all_trials[tid].get('job_id'))
+            except ValueError:
+                logger.info("Resubmitting Trial {}.".format(tid))
+                self.study.add_trial(self._all_trials[tid].get('trial'))
+            else:
+                self._active_trials.append(tid)
 
     def run_loop(self):
         """
         Run the optimization loop.
+
+        Between iterations the loop waits until the scheduler reports a job
+        status change, the database reports a new result, or a timeout
+        passes. The timeout backs off from ``min_wait`` to ``max_wait`` while
+        nothing changes, so event sources that are not available are polled.
         """
-        while not self._done or self._active_trials:
-            self.update_results()
+        sources = []
+        if self.scheduler.notify_on_status_change(self._wakeup) is True:
+            sources.append('scheduler')
+        if self.database.notify_on_new_results(self._wakeup) is True:
+            sources.append('database')
+        logger.debug("Runner waking on events from: {}".format(
+            ', '.join(sources) or 'none, polling only'))
+
+        wait = self.min_wait
+        try:
+            while not self._done or self._active_trials:
+                # Cleared before looking, so that events arriving while the
+                # loop is busy or right after a timeout still wake it.
+                self._wakeup.clear()
+                with self._study_lock:
+                    num_changes = self.update_results()
+
+                    num_changes += self.update_active_trials()
+
+                    self.stop_bad_performers()
 
-            self.update_active_trials()
+                    num_changes += self.submit_new_trials()
 
-            self.stop_bad_performers()
+                wait = (self.min_wait if num_changes
+                        else min(2 * wait, self.max_wait))
+                self._wakeup.wait(wait)
+        finally:
+            self._suggester.shutdown(wait=False)
+            self._submitter.shutdown(wait=False)
 
-            self.submit_new_trials()
 
-            time.sleep(5)
+class _InlineExecutor(object):
+    """
+    Stands in for a ``concurrent.futures`` executor and runs each call right
+    away in the calling thread.
+    """
+    def submit(self, fn, *args):
+        import concurrent.futures
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
 
 
 def optimize(parameters, algorithm, lower_is_better,
@@ -593,7 +1084,8 @@ def optimize(parameters, algorithm, lower_is_better,
              max_concurrent=1,
              db_port=None, stopping_rule=None,
              dashboard_port=None, resubmit_failed_trials=False, verbose=1,
-             load=False, mongodb_args={}, disable_dashboard=False):
+             load=False, mongodb_args={}, disable_dashboard=False,
+             storage='mongodb'):
     """
     Runs a Study with a scheduler and automatically runs a database in the
     background.
@@ -603,7 +1095,8 @@ def optimize(parameters, algorithm, lower_is_better,
             parameter set.
         parameters (list[sherpa.core.Parameter]): parameters being optimized.
         lower_is_better (bool): whether lower objective values are better.
-        command (str): the command to run for the trial script.
+        command (str): the command to run for the trial script, not needed
+            with a ``sherpa.schedulers.LocalPoolScheduler``.
         filename (str): the filename of the script to run. Will be run as
             "python <filename>".
         output_dir (str): where scheduler and database files will be stored.
@@ -616,9 +1109,14 @@ def optimize(parameters, algorithm, lower_is_better,
         dashboard_port (int): port to run the dashboard web-server on.
         resubmit_failed_trials (bool): whether to resubmit a trial if it failed.
         verbose (int, default=1): whether to print submit messages (0=no, 1=yes).
-        load (bool): option to load study, currently not fully implemented.
+        load (bool): whether to resume the study saved in ``output_dir``,
+            see ``Study.load``. Finished trials are not run again.
         mongodb_args (dict[str, any]): arguments to MongoDB beyond port, dir,
             and log-path. Keys are the argument name without "--".
+        storage (str): ``'mongodb'`` to store trials and results in a MongoDB
+            server started for the study, or ``'sqlite'`` to use an embedded
+            SQLite file in ``output_dir``. SQLite needs no database server but
+            all trials must run on the same machine.
     """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -642,24 +1140,40 @@ def optimize(parameters, algorithm, lower_is_better,
         runner_command = shlex.split(command)
     elif filename:
         runner_command = ['python', filename]
+    elif isinstance(scheduler, LocalPoolScheduler):
+        runner_command = []  # the workers call the trial function.
     else:
         raise ValueError("Need to provide either command or filename.")
 
-    if load:
-        study.load()
-
-    if not db_port:
-        db_port = _port_finder(27001, 27050)
+    runner_state = study.load() if load else None
+
+    # When resuming, results stored after the checkpoint are read again,
+    # the runner skips the ones the study already has.
+    if storage == 'sqlite':
+        database = _SQLiteDatabase(path=os.path.join(output_dir, 'sherpa.db'))
+    elif storage == 'mongodb':
+        if not db_port:
+            db_port = _port_finder(27001, 27050)
+        database = _Database(db_dir=output_dir, port=db_port,
+                             mongodb_args=mongodb_args)
+    else:
+        raise ValueError("Unknown storage {}, use 'mongodb' or "
+                         "'sqlite'.".format(storage))
 
-    with _Database(db_dir=output_dir, port=db_port,
-                   reinstantiated=load, mongodb_args=mongodb_args) as db:
+    with database as db:
         runner = _Runner(study=study,
                          scheduler=scheduler,
                          database=db,
                          max_concurrent=max_concurrent,
                          command=runner_command,
                          resubmit_failed_trials=resubmit_failed_trials)
-        runner.run_loop()
+        if runner_state:
+            runner.load(runner_state)
+        try:
+            runner.run_loop()
+        finally:
+            scheduler.close()
+    study.save(export_csv=True)
     return study.get_best_result()
 
 
@@ -716,7 +1230,34 @@ class Parameter(object):
         assert isinstance(range, list), "Parameter-Range needs to be a list."
         self.name = name
         self.range = range
-        
+
+    def sample(self, size=None):
+        """
+        Draws random values from the parameter range.
+
+        Args:
+            size (int): number of values to draw. If None a single value is
+                returned, otherwise a numpy array of ``size`` values.
+
+        Returns:
+            a single value or numpy.ndarray: the sampled values.
+        """
+        raise NotImplementedError("Parameter class is not usable itself.")
+
+    def _choose(self, size):
+        i = rng.randint(low=0, high=len(self.range), size=size)
+        if size is None:
+            return self.range[i]
+        types = set(type(v) for v in self.range)
+        if len(types) == 1 and not types & {list, tuple, dict}:
+            values = numpy.asarray(self.range)
+        else:
+            # Mixed or nested values are kept as they are.
+            values = numpy.empty(len(self.range), dtype=object)
+            for j, v in enumerate(self.range):
+                values[j] = v
+        return values[i]
+
     @staticmethod
     def from_dict(config):
         """
@@ -792,13 +1333,15 @@ class Continuous(Parameter):
             assert all(r > 0. for r in range), "Range parameters must be " \
                                               "positive for log scale."
 
-    def sample(self):
+    def sample(self, size=None):
         try:
             if self.scale == 'log':
                 return 10**rng.uniform(low=numpy.log10(self.range[0]),
-                                                high=numpy.log10(self.range[1]))
+                                       high=numpy.log10(self.range[1]),
+                                       size=size)
             else:
-                return rng.uniform(low=self.range[0], high=self.range[1])
+                return rng.uniform(low=self.range[0], high=self.range[1],
+                                   size=size)
         except ValueError as e:
             raise ValueError("{} causes error {}".format(self.name, e))
 
@@ -815,13 +1358,16 @@ class Discrete(Parameter):
             assert all(r > 0 for r in range), "Range parameters must be " \
                                               "positive for log scale."
 
-    def sample(self):
+    def sample(self, size=None):
         try:
             if self.scale == 'log':
-                return int(10**rng.uniform(low=numpy.log10(self.range[0]),
-                                                high=numpy.log10(self.range[1])))
+                values = 10**rng.uniform(low=numpy.log10(self.range[0]),
+                                         high=numpy.log10(self.range[1]),
+                                         size=size)
+                return int(values) if size is None else values.astype(int)
             else:
-                return rng.randint(low=self.range[0], high=self.range[1])
+                return rng.randint(low=self.range[0], high=self.range[1],
+                                   size=size)
         except ValueError as e:
             raise ValueError("{} causes error {}".format(self.name, e))
 
@@ -834,9 +1380,8 @@ class Choice(Parameter):
         super(Choice, self).__init__(name, range)
         self.type = type(self.range[0])
 
-    def sample(self):
-        i = rng.randint(low=0, high=len(self.range))
-        return self.range[i]
+    def sample(self, size=None):
+        return self._choose(size)
 
 
 class Ordinal(Parameter):
@@ -847,9 +1392,8 @@ class Ordinal(Parameter):
         super(Ordinal, self).__init__(name, range)
         self.type = type(self.range[0])
 
-    def sample(self):
-        i = rng.randint(low=0, high=len(self.range))
-        return self.range[i]
+    def sample(self, size=None):
+        return self._choose(size)
 
 
 class AlgorithmState(object):
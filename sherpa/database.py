@@ -17,15 +17,24 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with SHERPA.  If not, see <http://www.gnu.org/licenses/>.
 """
+import atexit
+import json
 import logging
 import numpy
 import pymongo
 from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
 import subprocess
 import time
 import os
 import socket
+import sqlite3
+import threading
 import warnings
+try:
+    import queue  # python 3
+except ImportError:
+    import Queue as queue
 try:
     from subprocess import DEVNULL # python 3
 except ImportError:
@@ -37,32 +46,230 @@ import sherpa
 dblogger = logging.getLogger(__name__)
 
 
-class _Database(object):
+class _BackgroundSender(object):
+    """
+    Hands items to a callable from a daemon thread so that the caller does
+    not wait for it.
+
+    Items are put on an in-process queue. The thread takes whatever is queued
+    (up to ``max_batch_size`` items) and passes it to ``send`` in one call.
+    Calls failing with one of ``retry_exceptions`` are retried with
+    exponential backoff; a batch that still fails or fails with any other
+    exception is logged and dropped.
+
+    Args:
+        send (callable): called as ``send(batch, final)`` with a list of items
+            and whether this is the last batch before the sender closes.
+        retry_exceptions (tuple): exception types on which to retry.
+        max_retries (int): number of retries per batch.
+        backoff (float): seconds to wait before the first retry. Doubles with
+            every further retry.
+        max_batch_size (int): largest number of items passed in one call.
+    """
+    _CLOSE = object()
+
+    def __init__(self, send, retry_exceptions=(), max_retries=5, backoff=0.1,
+                 max_batch_size=1000):
+        self.send = send
+        self.retry_exceptions = tuple(retry_exceptions)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, item):
+        """
+        Queues ``item`` and returns immediately.
+        """
+        if self._closed:
+            raise RuntimeError("Sender is closed.")
+        self._queue.put(item)
+
+    def flush(self):
+        """
+        Blocks until every queued item has been handled.
+        """
+        self._queue.join()
+
+    def close(self, timeout=None):
+        """
+        Handles the remaining items and stops the thread.
+
+        Args:
+            timeout (float): seconds to wait for the thread, forever if None.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._CLOSE)
+        self._thread.join(timeout)
+
+    def _run(self):
+        done = False
+        while not done:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch_size and batch[-1] is not self._CLOSE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = batch[-1] is self._CLOSE
+            items = batch[:-1] if done else batch
+            try:
+                if items or done:
+                    self._send(items, final=done)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _send(self, items, final):
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.send(items, final)
+                return
+            except self.retry_exceptions as e:
+                if attempt == self.max_retries:
+                    dblogger.error("Dropping {} item(s) after {} retries: "
+                                   "{}".format(len(items), attempt, e))
+                    return
+                dblogger.debug("Sending failed ({}), retrying in {:.2f}s."
+                               "".format(e, delay))
+                time.sleep(delay)
+                delay *= 2
+            except Exception as e:
+                dblogger.error("Dropping {} item(s): {}".format(len(items), e))
+                return
+
+
+class _Storage(object):
+    """
+    Stores the trials of a Study for trial scripts to get and collects their
+    results. The runner talks to the storage only through this interface.
+
+    Storages are used as context managers, ``start`` is called on enter and
+    ``close`` on exit.
+    """
+    def start(self):
+        """
+        Makes the storage ready for use.
+        """
+        pass
+
+    def close(self):
+        """
+        Releases all resources of the storage.
+        """
+        pass
+
+    def check_db_status(self):
+        """
+        Raises an error if the storage is no longer available.
+        """
+        pass
+
+    def client_env(self):
+        """
+        Returns:
+            dict: environment variables that let a ``sherpa.Client`` in a
+            trial script connect to this storage.
+        """
+        return {}
+
+    def get_new_results(self):
+        """
+        Returns:
+            list[dict]: results added since the previous call, each with
+            ``trial_id``, ``iteration``, ``objective``, ``context`` and
+            ``parameters``.
+        """
+        return []
+
+    def notify_on_new_results(self, event):
+        """
+        Registers an event that is set whenever a result is added.
+
+        Args:
+            event (threading.Event): the event to set.
+
+        Returns:
+            bool: whether notifications are supported.
+        """
+        return False
+
+    def enqueue_trial(self, trial):
+        """
+        Puts a new trial in the queue for trial scripts to get.
+
+        Args:
+            trial (sherpa.core.Trial): the trial.
+        """
+        pass
+
+    def add_for_stopping(self, trial_id):
+        """
+        Adds a trial for stopping.
+
+        Args:
+            trial_id (int): the ID of the trial to stop.
+        """
+        pass
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _Database(_Storage):
     """
     Manages a Mongo-DB for storing metrics and delivering parameters to trials.
 
     The Mongo-DB contains one database that serves as a queue of future trials
     and one to store results of active and finished trials.
 
+    Results are stored in a capped collection, which keeps documents in
+    insertion order. They are read through a tailable cursor so that every
+    call to ``get_new_results`` only transfers documents inserted since the
+    previous call. If the cursor dies it is reopened after the last result
+    that was read, found by its ``_id`` in insertion order.
+
     Attributes:
         dbpath (str): the path where Mongo-DB stores its files.
         port (int): the port on which the Mongo-DB should run.
         reinstantiated (bool): whether an instance of the MongoDB is being loaded.
         mongodb_args (dict): keyword arguments to MongoDB
+        results_size (int): maximum size in bytes of the results collection.
+            Once it is full the oldest results are overwritten, which is
+            logged as an error if it happens before they were read.
+        start_timeout (float): seconds to wait for MongoDB to accept
+            connections.
     """
     def __init__(self, db_dir, port=27010, reinstantiated=False,
-                 mongodb_args={}):
+                 mongodb_args={}, results_size=2**30, start_timeout=30.):
         self.client = MongoClient(port=port)
         self.db = self.client.sherpa
-        self.collected_results = set()
+        self.results_size = results_size
+        self.start_timeout = start_timeout
+        self._results_cursor = None
+        self._last_result_id = None  # _id of the last result read.
         self.mongo_process = None
         self.dir = db_dir
         self.port = port
         self.reinstantiated = reinstantiated
         self.mongodb_args = mongodb_args
+        self._change_stream = None
 
     def close(self):
         print('Closing MongoDB!')
+        if self._change_stream is not None:
+            self._change_stream.close()
         self.mongo_process.terminate()
 
     def start(self):
@@ -99,15 +306,75 @@ class _Database(object):
         
         dblogger.debug("Starting MongoDB using command:{}".format(str(cmd)))
 
+        start = time.time()
         try:
             self.mongo_process = subprocess.Popen(cmd)
         except FileNotFoundError as e:
             raise FileNotFoundError(str(e) + "\nCheck that MongoDB is installed and in PATH.")
-        time.sleep(1)
-        self.check_db_status()
+        self._wait_until_ready(start + self.start_timeout)
+        dblogger.info("MongoDB ready after {:.3f}s".format(time.time() - start))
+        self._create_results_collection()
+        self._create_indexes()
         if self.reinstantiated:
             self.get_new_results()
 
+    def _wait_until_ready(self, deadline):
+        """
+        Pings MongoDB with exponential backoff until the process that was
+        started answers.
+
+        The process ID of the answering server is checked so that a MongoDB
+        already running on the port is not mistaken for this one.
+        """
+        probe = MongoClient(port=self.port, serverSelectionTimeoutMS=100,
+                            connectTimeoutMS=100)
+        delay = 0.005
+        try:
+            while True:
+                status = self.mongo_process.poll()
+                if status is not None:
+                    raise EnvironmentError(
+                        "Database exited with code {}".format(status))
+                try:
+                    pid = probe.admin.command('serverStatus').get('pid')
+                    if pid == self.mongo_process.pid:
+                        return
+                except pymongo.errors.PyMongoError:
+                    pass
+                if time.time() >= deadline:
+                    raise EnvironmentError(
+                        "Database did not accept connections on port {} "
+                        "within {} seconds".format(self.port,
+                                                   self.start_timeout))
+                time.sleep(delay)
+                delay = min(2 * delay, 0.25)
+        finally:
+            probe.close()
+
+    def _create_results_collection(self):
+        """
+        Creates the results collection as a capped collection, or converts an
+        existing one, so that it can be read with a tailable cursor.
+        """
+        if 'results' not in self.db.list_collection_names():
+            self.db.create_collection('results', capped=True,
+                                      size=self.results_size)
+        elif not self.db.results.options().get('capped'):
+            # Converting truncates results that do not fit.
+            size = self.db.command('collStats', 'results')['size']
+            self.db.command('convertToCapped', 'results',
+                            size=max(self.results_size, 2 * size))
+
+    def _create_indexes(self):
+        """
+        Indexes the fields that trials and the runner look documents up by.
+        Does nothing for indexes that already exist.
+        """
+        self.db.trials.create_index('trial_id')
+        self.db.results.create_index([('trial_id', pymongo.ASCENDING),
+                                      ('iteration', pymongo.ASCENDING)])
+        self.db.stop.create_index('trial_id')
+
     def check_db_status(self):
         """
         Checks whether database is still running.
@@ -116,6 +383,10 @@ class _Database(object):
         if status:
             raise EnvironmentError("Database exited with code {}".format(status))
 
+    def client_env(self):
+        return {'SHERPA_DB_HOST': socket.gethostname(),
+                'SHERPA_DB_PORT': str(self.port)}
+
     def get_new_results(self):
         """
         Checks database for new results.
@@ -124,15 +395,88 @@ class _Database(object):
             (list[dict]) where each dict is one row from the DB.
         """
         self.check_db_status()
+        if self._results_cursor is None or not self._results_cursor.alive:
+            # A tailable cursor dies if the collection was empty when it was
+            # opened, or if its position was overwritten.
+            self._results_cursor = self._open_results_cursor()
         new_results = []
-        for entry in self.db.results.find():
-            result = entry
-            mongo_id = result.pop('_id')
-            if mongo_id not in self.collected_results:
+        try:
+            for result in self._results_cursor:
                 new_results.append(result)
-                self.collected_results.add(mongo_id)
+        except pymongo.errors.OperationFailure as e:
+            # E.g. CappedPositionLost, the cursor is reopened on the next
+            # call, which reports whether results were lost.
+            dblogger.warning("Results cursor failed: {}".format(e))
+            self._results_cursor = None
+        if new_results:
+            self._last_result_id = new_results[-1]['_id']
+        for result in new_results:
+            del result['_id']
         return new_results
 
+    def _open_results_cursor(self):
+        """
+        Opens a tailable cursor on the results after the last one read.
+
+        The position of the last result read is looked up by its ``_id`` in
+        insertion order, since results can be overwritten once the
+        collection is full and counts are not stable.
+        """
+        if self._last_result_id is None:
+            return self.db.results.find(
+                cursor_type=pymongo.CursorType.TAILABLE)
+        ids = self.db.results.find(projection={'_id': True},
+                                   sort=[('$natural', pymongo.ASCENDING)])
+        for position, doc in enumerate(ids):
+            if doc['_id'] == self._last_result_id:
+                break
+        else:
+            dblogger.error(
+                "Results were overwritten before they were read and are "
+                "lost. Increase results_size to keep more results.")
+            self._last_result_id = None
+            return self._open_results_cursor()
+        cursor = self.db.results.find(cursor_type=pymongo.CursorType.TAILABLE,
+                                      skip=position)
+        last = next(cursor, None)
+        if last is None or last['_id'] != self._last_result_id:
+            # Results were overwritten since the position was looked up.
+            cursor.close()
+            return self._open_results_cursor()
+        return cursor
+
+    def notify_on_new_results(self, event):
+        """
+        Sets ``event`` whenever a result is inserted.
+
+        Uses a MongoDB change stream, which is only available if MongoDB runs
+        as a replica set e.g. via ``mongodb_args={'replSet': 'rs0'}``.
+
+        Args:
+            event (threading.Event): the event to set.
+
+        Returns:
+            bool: whether notifications are supported.
+        """
+        try:
+            self._change_stream = self.db.results.watch(
+                [{'$match': {'operationType': 'insert'}}])
+        except pymongo.errors.PyMongoError as e:
+            dblogger.debug("Change streams not available: {}".format(e))
+            return False
+
+        def listen():
+            try:
+                for _ in self._change_stream:
+                    event.set()
+            except pymongo.errors.PyMongoError:
+                # Stream was closed or the database went away.
+                pass
+        thread = threading.Thread(target=listen)
+        thread.daemon = True
+        thread.start()
+        return True
+
     def enqueue_trial(self, trial):
         """
         Puts a new trial in the queue for trial scripts to get.
@@ -167,12 +511,168 @@ class _Database(object):
         dblogger.debug("Adding {} to DB".format({'trial_id': trial_id}))
         self.db.stop.insert_one({'trial_id': trial_id}).inserted_id
 
-    def __enter__(self):
-        self.start()
-        return self
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.close()
+class _SQLiteDatabase(_Storage):
+    """
+    Stores trials and results in an embedded SQLite database file.
+
+    Needs no database server, so a Study starts without delay. The file is
+    used in WAL mode so that the runner can read while trial processes write
+    concurrently; writers wait for each other for up to ``timeout`` seconds.
+    Since SQLite relies on file locking the file should be on a local disk,
+    i.e. all trials need to run on the same machine.
+
+    Trial scripts connect via ``sherpa.Client``, which reads the path from
+    the ``SHERPA_DB_PATH`` environment variable.
+
+    Attributes:
+        path (str): the database file.
+        reinstantiated (bool): whether an existing database is being loaded.
+            Results already in it are not returned by ``get_new_results``.
+        timeout (float): seconds to wait for a lock held by another process.
+    """
+    def __init__(self, path, reinstantiated=False, timeout=30.):
+        self.path = path
+        self.reinstantiated = reinstantiated
+        self.timeout = timeout
+        self._connection = None
+        self._lock = threading.Lock()  # connection is shared with threads.
+        self._last_result_id = 0  # id of the last result read.
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                               check_same_thread=False)
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+        return self._connection
+
+    def start(self):
+        """
+        Creates the database file and its tables if they do not exist.
+        """
+        dblogger.debug("Using SQLite database {}".format(self.path))
+        with self._lock:
+            connection = self._connect()
+            connection.execute('PRAGMA journal_mode=WAL')
+            with connection:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS trials '
+                    '(trial_id INTEGER PRIMARY KEY, parameters TEXT NOT NULL)')
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS results '
+                    '(id INTEGER PRIMARY KEY, trial_id INTEGER, iteration, '
+                    'document TEXT NOT NULL)')
+                connection.execute(
+                    'CREATE INDEX IF NOT EXISTS results_trial_id_iteration '
+                    'ON results (trial_id, iteration)')
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS stop (trial_id INTEGER)')
+                connection.execute(
+                    'CREATE INDEX IF NOT EXISTS stop_trial_id '
+                    'ON stop (trial_id)')
+        if self.reinstantiated:
+            self.get_new_results()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def client_env(self):
+        return {'SHERPA_DB_PATH': os.path.abspath(self.path)}
+
+    def get_new_results(self):
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT id, document FROM results WHERE id > ? ORDER BY id',
+                (self._last_result_id,)).fetchall()
+        if rows:
+            self._last_result_id = rows[-1][0]
+        return [json.loads(document) for _, document in rows]
+
+    def enqueue_trial(self, trial):
+        parameters = json.dumps(trial.parameters, default=_json_default)
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO trials (trial_id, parameters) '
+                    'VALUES (?, ?)', (trial.id, parameters))
+
+    def add_for_stopping(self, trial_id):
+        dblogger.debug("Adding {} to DB".format({'trial_id': trial_id}))
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute('INSERT INTO stop (trial_id) VALUES (?)',
+                                   (trial_id,))
+
+    def find_trial(self, trial_id):
+        """
+        Returns:
+            dict: ``trial_id`` and ``parameters`` of the trial, or None if it
+            has not been enqueued.
+        """
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT trial_id, parameters FROM trials WHERE trial_id = ?',
+                (trial_id,)).fetchone()
+        if row is None:
+            return None
+        return {'trial_id': row[0], 'parameters': json.loads(row[1])}
+
+    def insert_results(self, results):
+        """
+        Adds results in one transaction.
+
+        Args:
+            results (list[dict]): result documents as sent by the client.
+        """
+        rows = [(_builtin(r['trial_id']), _builtin(r['iteration']),
+                 json.dumps(r, default=_json_default)) for r in results]
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    'INSERT INTO results (trial_id, iteration, document) '
+                    'VALUES (?, ?, ?)', rows)
+
+
+def _builtin(value):
+    """
+    Converts NumPy scalars to the equivalent Python type.
+    """
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, numpy.generic):
+        return value.item()
+    raise TypeError("{!r} is not JSON serializable".format(value))
+
+
+_open_clients = []  # Clients that buffer or queue metrics until closed.
+
+
+def _close_clients():
+    """
+    Closes all Clients that buffer or queue metrics, so that their metrics
+    are stored.
+    """
+    error = None
+    while _open_clients:
+        try:
+            _open_clients[-1].close()
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+
+
+atexit.register(_close_clients)
 
 
 class Client(object):
@@ -186,8 +686,13 @@ class Client(object):
             environment variable or 'localhost' in that order.
         port (int): port that database is running on. Passed port, port set via
             environment variable or 27010 in that order.
+        path (str): the SQLite database file if the study stores its results
+            with SQLite instead of MongoDB. Passed path or path set via
+            environment variable, unless host or port are passed.
     """
-    def __init__(self, host=None, port=None, test_mode=False, **mongo_client_args):
+    def __init__(self, host=None, port=None, test_mode=False, batch_size=1,
+                 flush_interval=None, acknowledge=True, asynchronous=False,
+                 path=None, **mongo_client_args):
         """
         Args:
             host (str): the host that runs the database. Generally not needed since
@@ -197,18 +702,67 @@ class Client(object):
             test_mode (bool): mock the client, that is, get_trial returns a trial
                 that is empty, keras_send_metrics accepts calls but does not do any-
                 thing, as does send_metrics. Useful for trial script debugging.
+            batch_size (int): number of observations to buffer before they are
+                written to the database in one ``insert_many``. The default of
+                1 writes every observation immediately.
+            flush_interval (float): if set, the buffer is also written once
+                its oldest observation is this many seconds old. Checked when
+                metrics are sent.
+            acknowledge (bool): whether the database acknowledges buffered
+                writes. Unacknowledged writes do not wait for the database.
+                The write on ``close`` or at interpreter exit is always
+                acknowledged and journaled; without acknowledgement the
+                latest observation is held back for it.
+            asynchronous (bool): if True, ``send_metrics`` only queues the
+                observation and returns. A background thread writes
+                everything queued in one acknowledged ``insert_many`` and
+                retries with exponential backoff if the connection fails.
+                ``batch_size``, ``flush_interval`` and ``acknowledge`` are
+                ignored. The queue is drained on ``close`` or at interpreter
+                exit.
+            path (str): SQLite database file of the study. Generally not
+                needed since the scheduler passes it as an environment
+                variable.
         """
         self.test_mode = test_mode
+        self.batch_size = max(int(batch_size), 1)
+        self.flush_interval = flush_interval
+        self.acknowledge = acknowledge
+        self.asynchronous = asynchronous
+        self._buffered = not asynchronous and (self.batch_size > 1
+                                               or flush_interval is not None
+                                               or not acknowledge)
+        self._buffer = []
+        self._buffer_since = None  # time the oldest buffered entry was added.
+        self._sender = None
+        self._sqlite = None
+        if not host and not port:
+            path = path or os.environ.get('SHERPA_DB_PATH')
+        self.path = path
         if not self.test_mode:
-            host = host or os.environ.get('SHERPA_DB_HOST') or 'localhost'
-            port = port or os.environ.get('SHERPA_DB_PORT') or 27010
-            self.client = MongoClient(host, int(port), **mongo_client_args)
-            self.db = self.client.sherpa
-
-    def get_trial(self):
+            if path:
+                self._sqlite = _SQLiteDatabase(path)
+            else:
+                host = host or os.environ.get('SHERPA_DB_HOST') or 'localhost'
+                port = port or os.environ.get('SHERPA_DB_PORT') or 27010
+                self.client = MongoClient(host, int(port), **mongo_client_args)
+                self.db = self.client.sherpa
+                self._results = self.db.results
+                if not acknowledge:
+                    self._results = self.db.results.with_options(
+                        write_concern=WriteConcern(w=0))
+
+    def get_trial(self, timeout=60.):
         """
         Returns the next trial from a Sherpa Study.
 
+        If the trial has not been enqueued yet this blocks until it is, using
+        a change stream on the trials collection where MongoDB supports it
+        and polling with exponential backoff otherwise.
+
+        Args:
+            timeout (float): seconds to wait for the trial.
+
         Returns:
             sherpa.core.Trial: The trial to run.
         """
@@ -217,16 +771,56 @@ class Client(object):
         
         assert os.environ.get('SHERPA_TRIAL_ID'), "Environment-variable SHERPA_TRIAL_ID not found. Scheduler needs to set this variable in the environment when submitting a job"
         trial_id = int(os.environ.get('SHERPA_TRIAL_ID'))
-        for _ in range(5):
-            g = (entry for entry in self.db.trials.find({'trial_id': trial_id}))
-            t = next(g)
-            if t:
-                break
-            time.sleep(10)
-        if not t:
+        t = self._find_trial(trial_id)
+        if t is None:
+            t = self._wait_for_trial(trial_id, time.time() + timeout)
+        if t is None:
             raise RuntimeError("No Trial Found!")
         return sherpa.Trial(id=t.get('trial_id'), parameters=t.get('parameters'))
 
+    def _find_trial(self, trial_id):
+        if self._sqlite is not None:
+            return self._sqlite.find_trial(trial_id)
+        return self.db.trials.find_one(
+            {'trial_id': trial_id},
+            projection={'_id': False, 'trial_id': True, 'parameters': True})
+
+    def _wait_for_trial(self, trial_id, deadline):
+        """
+        Waits until ``trial_id`` is enqueued or ``deadline`` passes.
+
+        Returns:
+            dict: the trial document or None.
+        """
+        stream = None
+        if self._sqlite is None:
+            try:
+                stream = self.db.trials.watch(
+                    [{'$match': {'operationType': 'insert',
+                                 'fullDocument.trial_id': trial_id}}],
+                    max_await_time_ms=1000)
+            except pymongo.errors.PyMongoError as e:
+                dblogger.debug("Change streams not available: {}".format(e))
+
+        if stream is not None:
+            with stream:
+                # The trial may have been enqueued before the stream opened.
+                t = self._find_trial(trial_id)
+                while t is None and time.time() < deadline:
+                    change = stream.try_next()
+                    if change is not None:
+                        t = change['fullDocument']
+                return t
+
+        delay = 0.01
+        while time.time() < deadline:
+            time.sleep(max(min(delay, deadline - time.time()), 0))
+            delay = min(2 * delay, 1.)
+            t = self._find_trial(trial_id)
+            if t is not None:
+                return t
+        return None
+
     def send_metrics(self, trial, iteration, objective, context={}):
         """
         Sends metrics for a trial to database.
@@ -251,7 +845,111 @@ class Client(object):
             if type(v) == numpy.float32:
                 context[k] = numpy.float64(v)
 
-        self.db.results.insert_one(result)
+        if self.asynchronous:
+            if self._sender is None:
+                self._sender = _BackgroundSender(
+                    self._insert,
+                    retry_exceptions=(pymongo.errors.ConnectionFailure,
+                                      sqlite3.OperationalError))
+                _open_clients.append(self)
+            self._sender.put(result)
+            return
+        if not self._buffered:
+            if self._sqlite is not None:
+                self._sqlite.insert_results([result])
+            else:
+                self._results.insert_one(result)
+            return
+
+        if not self._buffer:
+            self._buffer_since = time.time()
+            if self not in _open_clients:
+                _open_clients.append(self)
+        self._buffer.append(result)
+        if (len(self._buffer) >= self.batch_size
+                or (self.flush_interval is not None
+                    and time.time() - self._buffer_since
+                    >= self.flush_interval)):
+            self.flush()
+
+    def flush(self, final=False):
+        """
+        Writes all buffered metrics to the database.
+
+        Args:
+            final (bool): whether to wait until the write is acknowledged and
+                journaled by the database, regardless of ``acknowledge``.
+        """
+        if self._sender is not None:
+            self._sender.flush()
+            return
+        if self.test_mode or not self._buffer:
+            return
+        if self._sqlite is not None:
+            # SQLite writes are always acknowledged.
+            buffer, self._buffer = self._buffer, []
+            self._sqlite.insert_results(buffer)
+            return
+        if final:
+            results = self.db.results.with_options(
+                write_concern=WriteConcern(w=1, j=True))
+            buffer, self._buffer = self._buffer, []
+        elif self.acknowledge:
+            results = self._results
+            buffer, self._buffer = self._buffer, []
+        else:
+            # Keep the latest entry so that close has one to write
+            # acknowledged.
+            results = self._results
+            buffer, self._buffer = self._buffer[:-1], self._buffer[-1:]
+            self._buffer_since = time.time()
+            if not buffer:
+                return
+        results.insert_many(buffer, ordered=True)
+
+    def _insert(self, results, final):
+        """
+        Writes a batch for the background sender, journaled if it is the
+        last one.
+        """
+        if not results:
+            return
+        if self._sqlite is not None:
+            self._sqlite.insert_results(results)
+            return
+        collection = self.db.results
+        if final:
+            collection = collection.with_options(
+                write_concern=WriteConcern(w=1, j=True))
+        try:
+            collection.insert_many(results, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            # A retried batch may have been partly written before the
+            # connection failed; those entries come back as duplicate keys.
+            errors = e.details.get('writeErrors', [])
+            if (e.details.get('writeConcernErrors')
+                    or any(error.get('code') != 11000 for error in errors)):
+                raise
+
+    def close(self):
+        """
+        Writes any buffered or queued metrics and waits for the database to
+        store them. Called automatically at interpreter exit, and after each
+        trial in a ``sherpa.schedulers.LocalPoolScheduler`` worker.
+        """
+        if self in _open_clients:
+            _open_clients.remove(self)
+        if self._sender is not None:
+            sender, self._sender = self._sender, None
+            sender.close()
+            return
+        self.flush(final=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def keras_send_metrics(self, trial, objective_name, context_names=[]):
         """
@@ -269,4 +967,5 @@ class Client(object):
                                                           iteration=epoch,
                                                           objective=logs[objective_name],
                                                           context={n: logs[n] for n in context_names})
-        return keras.callbacks.LambdaCallback(on_epoch_end=send_call)
+        return keras.callbacks.LambdaCallback(on_epoch_end=send_call,
+                                              on_train_end=lambda logs: self.close())
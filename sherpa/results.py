@@ -0,0 +1,816 @@
+"""
+SHERPA is a Python library for hyperparameter tuning of machine learning models.
+Copyright (C) 2018  Lars Hertel, Peter Sadowski, and Julian Collado.
+
+This file is part of SHERPA.
+
+SHERPA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+SHERPA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SHERPA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import atexit
+import collections
+import contextlib
+import io
+import json
+import multiprocessing
+import numbers
+import os
+import tempfile
+import threading
+import numpy
+import pandas
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class _ResultsTable(object):
+    """
+    Append-optimized, columnar store for the results of a Study.
+
+    Every column (Trial-ID, Status, Iteration, parameters, Objective and
+    context) is kept in its own preallocated NumPy buffer. Buffers grow
+    geometrically so that appending a row is amortized constant time. A
+    ``pandas.DataFrame`` is only built when it is requested via ``to_frame``
+    and is cached until the next append.
+
+    Column dtypes follow what ``pandas.DataFrame.append`` would produce:
+    integer columns are upcast to float when a float or a missing value
+    shows up and any column receiving non-numeric values is stored as object.
+
+    The table also keeps a hash index from Trial-ID to the iterations and row
+    positions of that trial so that duplicate checks and per-trial lookups
+    do not need to scan the table, and a running ``_TrialSummary`` of the
+    intermediate observations of every trial.
+
+    Args:
+        capacity (int): number of rows to preallocate.
+    """
+    def __init__(self, capacity=1024):
+        self._columns = collections.OrderedDict()
+        self._size = 0
+        self._capacity = max(int(capacity), 1)
+        self._frame = None
+        self._rows_by_trial = {}  # maps Trial-ID to list of row positions.
+        self._iterations_by_trial = {}  # maps Trial-ID to set of iterations.
+        self._summaries = collections.OrderedDict()  # Trial-ID to summary.
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def append(self, row):
+        """
+        Appends one row.
+
+        Args:
+            row (collections.OrderedDict): column-name, value pairs. Columns
+                not in the table yet are added in the order they appear in.
+
+        Returns:
+            int: the position of the new row.
+        """
+        if self._size == self._capacity:
+            self._grow()
+        i = self._size
+        for key, value in row.items():
+            column = self._columns.get(key)
+            if column is None:
+                column = self._new_column(value)
+            elif not self._fits(column, value):
+                column = self._upcast(column, value)
+            self._columns[key] = column
+            column[i] = numpy.nan if value is None else value
+        if len(row) != len(self._columns):
+            for key, column in self._columns.items():
+                if key not in row:
+                    if column.dtype.kind not in 'fO':
+                        column = self._upcast(column, numpy.nan)
+                        self._columns[key] = column
+                    column[i] = numpy.nan
+        self._size += 1
+        self._frame = None
+        self._index_row(i, row.get('Trial-ID'), row.get('Iteration'),
+                        row.get('Status'), row.get('Objective'))
+        return i
+
+    def has_trial(self, trial_id):
+        """
+        Returns whether any row for ``trial_id`` exists.
+        """
+        return trial_id in self._rows_by_trial
+
+    def has_observation(self, trial_id, iteration):
+        """
+        Returns whether a row for ``trial_id`` at ``iteration`` exists.
+        """
+        return iteration in self._iterations_by_trial.get(trial_id, ())
+
+    def trial_rows(self, trial_id):
+        """
+        Returns:
+            list[int]: positions of all rows of ``trial_id`` in table order.
+        """
+        return list(self._rows_by_trial.get(trial_id, ()))
+
+    def trial_summary(self, trial_id):
+        """
+        Returns:
+            sherpa.results._TrialSummary: running summary of the trial, or
+            ``None`` if the trial has no rows.
+        """
+        return self._summaries.get(trial_id)
+
+    def trial_summaries(self):
+        """
+        Returns:
+            collections.OrderedDict: Trial-ID to ``_TrialSummary`` in order of
+            first observation.
+        """
+        return self._summaries
+
+    def row(self, i):
+        """
+        Returns row ``i`` as an ordered dictionary.
+        """
+        if not 0 <= i < self._size:
+            raise IndexError("Row {} out of range.".format(i))
+        return collections.OrderedDict(
+            (key, column[i]) for key, column in self._columns.items())
+
+    def column(self, key):
+        """
+        Returns a read-only view of the filled part of column ``key``.
+        """
+        view = self._columns[key][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def to_frame(self):
+        """
+        Returns:
+            pandas.DataFrame: the results table.
+        """
+        if self._frame is None:
+            if self._size == 0:
+                self._frame = pandas.DataFrame()
+            else:
+                self._frame = pandas.DataFrame(
+                    collections.OrderedDict(
+                        (key, column[:self._size])
+                        for key, column in self._columns.items()),
+                    columns=list(self._columns))
+        return self._frame
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Builds a table from an existing results dataframe, e.g. one that was
+        loaded from disk.
+
+        Args:
+            df (pandas.DataFrame): results table.
+
+        Returns:
+            sherpa.results._ResultsTable: the table.
+        """
+        table = cls(capacity=max(2 * len(df), 1024))
+        n = len(df)
+        for key in df.columns:
+            values = df[key].values
+            if values.dtype.kind not in 'iufbO':
+                values = values.astype(object)
+            column = numpy.empty(table._capacity, dtype=values.dtype)
+            column[:n] = values
+            table._columns[key] = column
+        table._size = n if len(df.columns) else 0
+        table._reindex()
+        return table
+
+    def to_npz(self, f):
+        """
+        Writes the table to an uncompressed NumPy ``.npz`` archive with one
+        array per column, so that dtypes are kept and loading needs no
+        parsing.
+
+        Columns of Python objects, e.g. strings or mixed types, are stored
+        as integer codes plus their distinct values encoded as JSON, so that
+        the archive can be read without unpickling.
+
+        Args:
+            f (file): file object opened for binary writing.
+        """
+        arrays = {}
+        for i, column in enumerate(self._columns.values()):
+            values = column[:self._size]
+            if values.dtype == object:
+                try:
+                    codes, labels = pandas.factorize(values)
+                except TypeError:  # unhashable values, e.g. lists.
+                    codes, labels = pandas.factorize(
+                        numpy.array([_to_json(v) for v in values]))
+                    labels = [json.loads(label) for label in labels]
+                arrays['l{}'.format(i)] = _to_json_array(labels)
+                values = codes.astype(numpy.min_scalar_type(-len(labels) - 1))
+            arrays['c{}'.format(i)] = values
+        numpy.savez(f, columns=_to_json_array(self._columns), **arrays)
+
+    @classmethod
+    def from_npz(cls, f):
+        """
+        Reads a table written by ``to_npz``.
+
+        Args:
+            f (str or file): the archive.
+
+        Returns:
+            sherpa.results._ResultsTable: the table.
+        """
+        with numpy.load(f, allow_pickle=False) as data:
+            names = _from_json_array(data['columns'])
+            arrays = []
+            for i in range(len(names)):
+                values = data['c{}'.format(i)]
+                if 'l{}'.format(i) in data:
+                    labels = _from_json_array(data['l{}'.format(i)])
+                    # Code -1 marks missing values.
+                    lookup = numpy.empty(len(labels) + 1, dtype=object)
+                    for j, label in enumerate(labels):
+                        lookup[j] = label
+                    lookup[-1] = numpy.nan
+                    values = lookup[values]
+                arrays.append(values)
+        n = len(arrays[0]) if arrays else 0
+        table = cls(capacity=max(2 * n, 1024))
+        for name, values in zip(names, arrays):
+            column = numpy.empty(table._capacity, dtype=values.dtype)
+            column[:n] = values
+            table._columns[name] = column
+        table._size = n
+        table._reindex()
+        return table
+
+    def _reindex(self):
+        """
+        Rebuilds the trial index and summaries from the columns.
+        """
+        n = self._size
+        if not n or 'Trial-ID' not in self._columns:
+            return
+        trial_ids = self._columns['Trial-ID'][:n]
+        if trial_ids.dtype.kind not in 'iu':
+            # Row by row for unusual IDs, e.g. missing or of mixed types.
+            keys = ['Trial-ID', 'Iteration', 'Status', 'Objective']
+            columns = [self._columns[key][:n] if key in self._columns
+                       else [None] * n for key in keys]
+            for i, values in enumerate(zip(*columns)):
+                self._index_row(i, *values)
+            return
+
+        order = numpy.argsort(trial_ids, kind='mergesort')
+        starts = numpy.append(
+            0, numpy.flatnonzero(numpy.diff(trial_ids[order])) + 1)
+        groups = numpy.split(order, starts[1:])
+        status = self._columns.get('Status')
+        iteration = self._columns.get('Iteration')
+        if iteration is not None and iteration.dtype.kind not in 'iuf':
+            # Row by row for unusual iterations, e.g. of mixed types.
+            for i, values in enumerate(zip(
+                    trial_ids, iteration[:n],
+                    status[:n] if status is not None else [None] * n,
+                    self._columns['Objective'][:n]
+                    if 'Objective' in self._columns else [None] * n)):
+                self._index_row(i, *values)
+            return
+        objective = pandas.to_numeric(
+            pandas.Series(self._columns['Objective'][:n])
+            if 'Objective' in self._columns else pandas.Series(
+                numpy.full(n, numpy.nan)), errors='coerce').values
+
+        # Aggregates over the intermediate rows of each trial, with rows
+        # sorted by trial and, within a trial, by position.
+        intermediate = (numpy.ones(n, dtype=bool) if status is None
+                        else status[order] == 'INTERMEDIATE')
+        counts = numpy.add.reduceat(intermediate, starts)
+        objectives = objective[order]
+        valid = intermediate & ~numpy.isnan(objectives)
+        nan_counts = counts - numpy.add.reduceat(valid, starts)
+        min_rows = self._first_rows(order, starts, valid, objectives,
+                                    numpy.minimum, numpy.inf)
+        max_rows = self._first_rows(order, starts, valid, objectives,
+                                    numpy.maximum, -numpy.inf)
+        if iteration is not None:
+            iterations = iteration[order]
+            has_iteration = intermediate.copy()
+            if iterations.dtype.kind == 'f':
+                has_iteration &= ~numpy.isnan(iterations)
+                lowest = -numpy.inf
+            else:
+                lowest = numpy.iinfo(iterations.dtype).min
+            max_iterations = numpy.maximum.reduceat(
+                numpy.where(has_iteration, iterations, lowest), starts)
+            has_max_iteration = numpy.add.reduceat(has_iteration, starts) > 0
+
+        # Groups are indexed in order of first appearance of their trial.
+        group_ids = trial_ids[order[starts]].tolist()
+        for k in numpy.argsort(order[starts], kind='mergesort').tolist():
+            rows = groups[k]
+            trial_id = group_ids[k]
+            self._rows_by_trial[trial_id] = rows.tolist()
+            self._iterations_by_trial[trial_id] = set(
+                iteration[rows].tolist() if iteration is not None else [None])
+            summary = self._summaries[trial_id] = _TrialSummary()
+            if status is not None:
+                summary.status = status[rows[-1]]
+            summary.count = int(counts[k])
+            summary.nan_count = int(nan_counts[k])
+            if iteration is not None and has_max_iteration[k]:
+                summary.max_iteration = max_iterations[k]
+            if min_rows[k] >= 0:
+                summary.min_row = int(min_rows[k])
+                summary.min_objective = float(objective[summary.min_row])
+                summary.max_row = int(max_rows[k])
+                summary.max_objective = float(objective[summary.max_row])
+
+    @staticmethod
+    def _first_rows(order, starts, valid, values, ufunc, identity):
+        """
+        Returns the position of the first row reaching the ``ufunc``
+        aggregate of ``values`` among ``valid`` rows of each group, or -1
+        for groups without valid rows.
+        """
+        values = numpy.where(valid, values, identity)
+        best = ufunc.reduceat(values, starts)
+        sizes = numpy.diff(numpy.append(starts, len(values)))
+        hits = numpy.flatnonzero(valid & (values == numpy.repeat(best, sizes)))
+        group_of_hit = numpy.searchsorted(starts, hits, side='right') - 1
+        groups, first = numpy.unique(group_of_hit, return_index=True)
+        rows = numpy.full(len(starts), -1)
+        rows[groups] = order[hits[first]]
+        return rows
+
+    def _index_row(self, i, trial_id, iteration, status, objective):
+        if trial_id is None:
+            return
+        self._rows_by_trial.setdefault(trial_id, []).append(i)
+        self._iterations_by_trial.setdefault(trial_id, set()).add(iteration)
+        summary = self._summaries.get(trial_id)
+        if summary is None:
+            summary = self._summaries[trial_id] = _TrialSummary()
+        summary.update(i, iteration, status, objective)
+
+    def _grow(self):
+        self._capacity *= 2
+        for key, column in self._columns.items():
+            new_column = numpy.empty(self._capacity, dtype=column.dtype)
+            new_column[:self._size] = column[:self._size]
+            self._columns[key] = new_column
+
+    def _new_column(self, value):
+        """
+        Creates a buffer for a column first seen at the current row. Earlier
+        rows are filled with NaN.
+        """
+        kind = _value_kind(value)
+        if self._size > 0 and kind in 'ib':
+            kind = 'f' if kind == 'i' else 'O'
+        column = numpy.empty(self._capacity, dtype=_DTYPES[kind])
+        if self._size > 0:
+            column[:self._size] = numpy.nan
+        return column
+
+    @staticmethod
+    def _upcast(column, value):
+        if column.dtype.kind in 'iu' and _value_kind(value) in 'if':
+            dtype = numpy.float64
+        else:
+            dtype = object
+        return column.astype(dtype)
+
+    @staticmethod
+    def _fits(column, value):
+        kind = column.dtype.kind
+        if kind == 'O':
+            return True
+        value_kind = _value_kind(value)
+        if kind == 'f':
+            return value_kind in 'if'
+        elif kind in 'iu':
+            return value_kind == 'i'
+        elif kind == 'b':
+            return value_kind == 'b'
+        return False
+
+
+def _to_json_array(values):
+    """
+    Encodes values as a NumPy array of JSON strings, which can be saved
+    without pickling.
+    """
+    return numpy.array([_to_json(v) for v in values], dtype=str)
+
+
+def _to_json(value):
+    """
+    Encodes a value as JSON. NumPy scalars become Python numbers, other
+    objects that JSON cannot represent become their string.
+    """
+    return json.dumps(value, default=_json_default)
+
+
+def _json_default(value):
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return str(value)
+
+
+def _from_json_array(array):
+    """
+    Decodes an array written by ``_to_json_array`` to a list of values.
+    """
+    return [json.loads(v) for v in array.tolist()]
+
+
+class _ResultsChannel(object):
+    """
+    Passes the results of a Study to the dashboard process.
+
+    The study writes every new row once, as a pickled record appended to a
+    file, and then publishes the number of bytes written through a shared
+    counter. The dashboard process reads only the records it has not seen
+    yet into its own ``_ResultsTable``. Adding an observation therefore costs
+    the study one small write regardless of the size of the study, and
+    dashboard refreshes cost the study nothing.
+
+    Only the process that created the channel writes to it and removes the
+    file at exit. Threads of a reading process, e.g. the dashboard's request
+    handlers, share its table under a lock.
+
+    Args:
+        path (str): file for the records, a temporary file if None.
+    """
+    _APPEND, _RESET = 0, 1
+
+    def __init__(self, path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='sherpa-results-')
+            os.close(fd)
+        self.path = path
+        self._committed = multiprocessing.Value('l', 0)  # bytes written.
+        self._owner = os.getpid()
+        self._writer = None
+        self._reader = None
+        self._offset = 0  # bytes read by this process.
+        self._table = _ResultsTable()
+        self._generation = 0  # number of resets read by this process.
+        self._lock = threading.Lock()  # guards the reader and the table.
+        atexit.register(self.close)
+
+    def append(self, row):
+        """
+        Publishes a row that was appended to the study's results.
+        """
+        self._write((self._APPEND, row))
+
+    def reset(self, df):
+        """
+        Publishes a results dataframe that replaces all previous rows.
+        """
+        self._write((self._RESET, df))
+
+    def _write(self, record):
+        if self._writer is None:
+            self._writer = open(self.path, 'ab')
+        pickle.dump(record, self._writer, pickle.HIGHEST_PROTOCOL)
+        self._writer.flush()
+        self._committed.value = self._writer.tell()
+
+    def read(self):
+        """
+        Returns:
+            pandas.DataFrame: the results table including all published rows.
+        """
+        with self._lock:
+            self._sync()
+            return self._table.to_frame()
+
+    @contextlib.contextmanager
+    def read_table(self):
+        """
+        Context manager that holds the channel's lock while the table of
+        this process is read.
+
+        Yields:
+            tuple: the current generation and the ``_ResultsTable`` of this
+            process, including all published rows. The table must not be
+            modified or used after the context exits.
+        """
+        with self._lock:
+            self._sync()
+            yield self._generation, self._table
+
+    def rows_since(self, generation, cursor, finalized_only=False):
+        """
+        Returns the rows that a reader holding ``cursor`` rows has not seen.
+
+        Args:
+            generation (int): generation of the reader's rows, as returned by
+                an earlier call. If the results were reset since, all rows
+                are returned.
+            cursor (int): number of rows the reader has.
+            finalized_only (bool): whether to skip intermediate rows. The
+                cursor still counts them.
+
+        Returns:
+            tuple: the current generation, the new cursor and a list of rows
+            as ordered dictionaries.
+        """
+        with self._lock:
+            self._sync()
+            size = len(self._table)
+            if generation != self._generation:
+                cursor = 0
+            cursor = min(max(cursor, 0), size)
+            positions = range(cursor, size)
+            if (finalized_only and size > cursor
+                    and 'Status' in self._table.columns):
+                status = self._table.column('Status')[cursor:]
+                positions = cursor + numpy.flatnonzero(
+                    status != 'INTERMEDIATE')
+            return (self._generation, size,
+                    [self._table.row(i) for i in positions])
+
+    def _sync(self):
+        # Called with the lock held.
+        committed = self._committed.value
+        if committed > self._offset:
+            if self._reader is None:
+                self._reader = open(self.path, 'rb')
+            self._reader.seek(self._offset)
+            data = io.BytesIO(self._reader.read(committed - self._offset))
+            while data.tell() < committed - self._offset:
+                kind, payload = pickle.load(data)
+                if kind == self._RESET:
+                    self._table = _ResultsTable.from_frame(payload)
+                    self._generation += 1
+                else:
+                    self._table.append(payload)
+            self._offset = committed
+
+    def __getstate__(self):
+        # File objects are reopened by the process that receives the channel.
+        state = self.__dict__.copy()
+        state['_writer'] = state['_reader'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def close(self):
+        for f in (self._writer, self._reader):
+            if f is not None:
+                f.close()
+        self._writer = self._reader = None
+        if os.getpid() == self._owner and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _ResultsJournal(object):
+    """
+    Persists a results table as a snapshot plus an append-only journal.
+
+    ``results.npz`` holds a snapshot of the first rows of the table, see
+    ``_ResultsTable.to_npz``, and ``results.journal`` the rows added since,
+    as pickled ``(position, row)`` records. Saving appends only the new rows
+    and syncs them to disk in one batch. The journal is compacted into a new
+    snapshot once it holds as many rows as the snapshot, so the total amount
+    written stays linear in the number of rows.
+
+    Compaction replaces the snapshot atomically before the journal is
+    truncated. Records the snapshot already contains, and a last record cut
+    short by a crash, are skipped when loading.
+
+    Args:
+        directory (str): where to store the files.
+        min_compact_rows (int): journal size below which automatic
+            compaction is not worthwhile.
+    """
+    SNAPSHOT = 'results.npz'
+    CSV_SNAPSHOT = 'results.csv'  # written by earlier versions.
+    JOURNAL = 'results.journal'
+
+    def __init__(self, directory, min_compact_rows=1000):
+        self.directory = directory
+        self.min_compact_rows = min_compact_rows
+        self._file = None
+        self._snapshot_rows = None  # rows in the snapshot, None if unknown.
+        self._num_rows = 0  # rows in the snapshot and journal.
+
+    def save(self, table, compact=None):
+        """
+        Persists the rows of ``table`` that were added since the last save.
+
+        Args:
+            table (sherpa.results._ResultsTable): the results.
+            compact (bool): whether to write a new snapshot. If None, a
+                snapshot is written when the journal is large enough or the
+                table is not the continuation of what was saved before.
+        """
+        if self._snapshot_rows is None or len(table) < self._num_rows:
+            compact = True
+        if compact:
+            self._compact(table)
+            return
+        if len(table) > self._num_rows:
+            if self._file is None:
+                self._file = open(self._path(self.JOURNAL), 'ab')
+            for i in range(self._num_rows, len(table)):
+                pickle.dump((i, table.row(i)), self._file,
+                            pickle.HIGHEST_PROTOCOL)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._num_rows = len(table)
+        if (compact is None and self._num_rows - self._snapshot_rows
+                >= max(self._snapshot_rows, self.min_compact_rows)):
+            self._compact(table)
+
+    def invalidate(self):
+        """
+        Marks the saved rows as outdated, e.g. because the table was
+        replaced. The next save writes a new snapshot.
+        """
+        self._snapshot_rows = None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _compact(self, table):
+        snapshot = self._path(self.SNAPSHOT)
+        with open(snapshot + '.tmp', 'wb') as f:
+            table.to_npz(f)
+            f.flush()
+            os.fsync(f.fileno())
+        _replace(snapshot + '.tmp', snapshot)
+        self.close()
+        with open(self._path(self.JOURNAL), 'wb') as f:
+            os.fsync(f.fileno())
+        self._snapshot_rows = self._num_rows = len(table)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Reads the snapshot and replays the journal in ``directory``.
+
+        Returns:
+            pandas.DataFrame: the results table.
+        """
+        snapshot = os.path.join(directory, cls.SNAPSHOT)
+        csv_snapshot = os.path.join(directory, cls.CSV_SNAPSHOT)
+        if os.path.exists(snapshot):
+            table = _ResultsTable.from_npz(snapshot)
+        elif os.path.exists(csv_snapshot):
+            try:
+                table = _ResultsTable.from_frame(pandas.read_csv(csv_snapshot))
+            except ValueError:  # empty file.
+                table = _ResultsTable()
+        else:
+            table = _ResultsTable()
+        journal = os.path.join(directory, cls.JOURNAL)
+        if os.path.exists(journal):
+            with open(journal, 'rb') as f:
+                while True:
+                    try:
+                        i, row = pickle.load(f)
+                    except EOFError:
+                        break
+                    except Exception:
+                        # Last record cut short by a crash.
+                        break
+                    if i > len(table):
+                        break
+                    if i == len(table):
+                        table.append(row)
+        return table.to_frame()
+
+
+def _replace(src, dst):
+    """
+    Atomically replaces ``dst`` with ``src``.
+    """
+    try:
+        os.replace(src, dst)
+    except AttributeError:  # python 2
+        os.rename(src, dst)
+
+
+def _write_atomically(path, data):
+    """
+    Writes ``data`` to a temporary file, syncs it and moves it to ``path``.
+    """
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    _replace(path + '.tmp', path)
+
+
+class _TrialSummary(object):
+    """
+    Running aggregates over the intermediate observations of one trial.
+
+    Attributes:
+        count (int): number of observations.
+        nan_count (int): number of observations with a NaN objective.
+        max_iteration: largest iteration observed.
+        min_objective (float): lowest non-NaN objective, NaN if none.
+        min_row (int): row position of ``min_objective``, None if none.
+        max_objective (float): highest non-NaN objective, NaN if none.
+        max_row (int): row position of ``max_objective``, None if none.
+        status (str): status of the last row of the trial.
+    """
+    __slots__ = ('count', 'nan_count', 'max_iteration', 'min_objective',
+                 'min_row', 'max_objective', 'max_row', 'status')
+
+    def __init__(self):
+        self.count = 0
+        self.nan_count = 0
+        self.max_iteration = None
+        self.min_objective = numpy.nan
+        self.min_row = None
+        self.max_objective = numpy.nan
+        self.max_row = None
+        self.status = None
+
+    def update(self, i, iteration, status, objective):
+        self.status = status
+        if status is not None and status != 'INTERMEDIATE':
+            return
+        self.count += 1
+        if iteration is not None and (self.max_iteration is None
+                                      or iteration > self.max_iteration):
+            self.max_iteration = iteration
+        try:
+            objective = float(objective)
+        except (TypeError, ValueError):
+            objective = numpy.nan
+        if numpy.isnan(objective):
+            self.nan_count += 1
+            return
+        if self.min_row is None or objective < self.min_objective:
+            self.min_objective, self.min_row = objective, i
+        if self.max_row is None or objective > self.max_objective:
+            self.max_objective, self.max_row = objective, i
+
+    def best(self, lower_is_better):
+        """
+        Returns:
+            tuple: best objective and its row position.
+        """
+        if lower_is_better:
+            return self.min_objective, self.min_row
+        return self.max_objective, self.max_row
+
+
+_DTYPES = {'b': numpy.bool_, 'i': numpy.int64, 'f': numpy.float64, 'O': object}
+_KINDS = {type(None): 'f'}  # caches the kind of each value type.
+
+
+def _value_kind(value):
+    """
+    Classifies a value as bool ('b'), integer ('i'), real ('f') or other
+    ('O'). None counts as real since it is stored as NaN.
+    """
+    try:
+        return _KINDS[type(value)]
+    except KeyError:
+        if isinstance(value, (bool, numpy.bool_)):
+            kind = 'b'
+        elif isinstance(value, numbers.Integral):
+            kind = 'i'
+        elif isinstance(value, numbers.Real):
+            kind = 'f'
+        else:
+            kind = 'O'
+        _KINDS[type(value)] = kind
+        return kind
@@ -18,14 +18,30 @@ You should have received a copy of the GNU General Public License
 along with SHERPA.  If not, see <http://www.gnu.org/licenses/>.
 """
 import subprocess
+import collections
+import contextlib
+import functools
+import importlib
+import multiprocessing
 import re
+import shutil
 import sys
 import os
 import logging
+import threading
+import time
+import traceback
+try:
+    import queue  # python 3
+except ImportError:
+    import Queue as queue
 
 
 logger = logging.getLogger(__name__)
 
+# Sets the CPU affinity of a command before it runs.
+_TASKSET = shutil.which('taskset') if hasattr(shutil, 'which') else None
+
 
 class _JobStatus(object):
     """
@@ -63,6 +79,25 @@ class Scheduler(object):
         """
         pass
 
+    def submit_jobs(self, command, envs, job_names):
+        """
+        Submits several jobs that run the same command.
+
+        Schedulers that can submit many jobs at once more cheaply than one
+        at a time override this.
+
+        Args:
+            command (list[str]): components to the command to run by the
+                scheduler e.g. ``["python", "train.py"]``
+            envs (list[dict]): environment variables to pass to each job.
+            job_names (list[str]): name of each job and its output file.
+
+        Returns:
+            list[str]: the job IDs in the order of ``envs``.
+        """
+        return [self.submit_job(command, env=env, job_name=job_name)
+                for env, job_name in zip(envs, job_names)]
+
     def get_status(self, job_id):
         """
         Obtains the current status of the job.
@@ -76,6 +111,21 @@ class Scheduler(object):
         """
         pass
 
+    def get_statuses(self, job_ids):
+        """
+        Obtains the current statuses of several jobs.
+
+        Schedulers that can query many jobs at once more cheaply than one
+        at a time override this.
+
+        Args:
+            job_ids (list[str]): identifiers returned when submitting the jobs.
+
+        Returns:
+            dict: maps each job ID to its sherpa.schedulers._JobStatus.
+        """
+        return {job_id: self.get_status(job_id) for job_id in job_ids}
+
     def kill_job(self, job_id):
         """
         Kills a given job.
@@ -85,70 +135,525 @@ class Scheduler(object):
         """
         pass
 
+    def notify_on_status_change(self, event):
+        """
+        Registers an event that the scheduler sets whenever one of its jobs
+        may have changed status, so that callers can wait on it instead of
+        polling ``get_status``.
+
+        Args:
+            event (threading.Event): the event to set.
+
+        Returns:
+            bool: whether the scheduler supports status notifications.
+        """
+        return False
+
+    def close(self):
+        """
+        Releases connections the scheduler holds, e.g. to a cluster.
+        """
+        pass
+
 
 class LocalScheduler(Scheduler):
     """
     Runs jobs locally as a subprocess.
 
+    A job starts as soon as the resources it needs are free and waits in a
+    queue otherwise. The resources are given back as soon as its process
+    exits, and the next queued job is started right away.
+
     Args:
         submit_options (str): options appended before the command.
         resources (list[str]): list of resources that will be passed as
-            SHERPA_RESOURCE environment variable. If no resource is 
-            available '' will be passed.
+            SHERPA_RESOURCE environment variable, e.g. GPU IDs. If None
+            '' will be passed.
+        resources_per_trial (int): number of entries of ``resources`` each
+            job gets, passed comma separated.
+        cores (list[int]): CPU cores that jobs may run on, defaults to all
+            cores available to this process.
+        cores_per_trial (int): number of cores each job gets. Jobs are
+            pinned to their cores with CPU affinity, set before the job's
+            command runs, and the cores are passed comma separated as
+            SHERPA_CORES. With 0, jobs are not pinned.
+        memory (float): memory budget shared by all jobs, in any unit.
+        memory_per_trial (float): memory each job reserves from ``memory``,
+            passed as SHERPA_MEMORY. This is for accounting only, jobs are
+            not limited to it.
     """
-    def __init__(self, submit_options='', output_dir='', resources=None):
+    def __init__(self, submit_options='', output_dir='', resources=None,
+                 resources_per_trial=1, cores=None, cores_per_trial=0,
+                 memory=None, memory_per_trial=0):
         self.output_dir = output_dir
-        self.jobs = {}
-        self.resources = resources
+        self.jobs = {}  # job ID to process of started jobs.
+        self.resources = resources  # free resources.
+        self.resources_per_trial = resources_per_trial
         self.resource_by_job = {}
+        if cores is None and cores_per_trial:
+            cores = (sorted(os.sched_getaffinity(0))
+                     if hasattr(os, 'sched_getaffinity')
+                     else list(range(multiprocessing.cpu_count())))
+        self.cores = cores  # free cores.
+        self.cores_per_trial = cores_per_trial
+        self.cores_by_job = {}
+        self.memory = memory  # free memory.
+        self.memory_per_trial = memory_per_trial
+        self.memory_by_job = {}
         self.output_files = {}
         self.submit_options = submit_options
         self.decode_status = {0: _JobStatus.finished,
                               -15: _JobStatus.killed}
-        self.output_dir = output_dir
+        self._status_event = None
+        self._lock = threading.RLock()  # also taken by watcher threads.
+        self._count = 0
+        self._queue = collections.deque()  # jobs waiting for resources.
+        self._exit_codes = {}  # exit codes of jobs killed while queued.
+        if resources is not None and resources_per_trial > len(resources):
+            raise ValueError("Fewer resources than resources_per_trial.")
+        if cores_per_trial and cores_per_trial > len(cores):
+            raise ValueError("Fewer cores than cores_per_trial.")
+        if memory is not None and memory_per_trial > memory:
+            raise ValueError("Less memory than memory_per_trial.")
 
     def submit_job(self, command, env={}, job_name=''):
         outdir = os.path.join(self.output_dir, 'jobs')
         if not os.path.isdir(outdir):
             os.mkdir(outdir)
-            
+
         env.update(os.environ.copy())
-        if self.resources is not None:
-            env['SHERPA_RESOURCE'] = str(self.resources.pop())
-        else:
-            env['SHERPA_RESOURCE'] = ''
-            
-        f = open(os.path.join(outdir, '{}.out'.format(job_name)), 'w')
         optns = self.submit_options.split(' ') if self.submit_options else []
-        process = subprocess.Popen(optns + command, env=env, stderr=f, stdout=f)
-        self.jobs[process.pid] = process
-        self.output_files[process.pid] = f
-        if self.resources is not None:
-            self.resource_by_job[process.pid] = env['SHERPA_RESOURCE']
-        return process.pid
+        with self._lock:
+            self._count += 1
+            job_id = self._count
+            output_file = os.path.join(
+                outdir, '{}.out'.format(job_name or job_id))
+            self._queue.append((job_id, optns + command, env, output_file))
+            self._start_queued()
+        return job_id
 
     def get_status(self, job_id):
-        process = self.jobs.get(job_id)
-        if not process:
-            raise ValueError("Job not found.")
-        status = process.poll()
-        if status is None:
-            return _JobStatus.running
-        else:
-            if job_id in self.resource_by_job:
-                resource = self.resource_by_job.pop(job_id)
-                self.resources.append(resource)
-                
-            if job_id in self.output_files:
-                f = self.output_files.pop(process.pid)
-                f.close()
+        with self._lock:
+            if job_id in self._exit_codes:
+                return self.decode_status.get(self._exit_codes[job_id],
+                                              _JobStatus.other)
+            if any(job[0] == job_id for job in self._queue):
+                return _JobStatus.queued
+            process = self.jobs.get(job_id)
+            if not process:
+                raise ValueError("Job not found.")
+            status = process.poll()
+            if status is None:
+                return _JobStatus.running
+            self._release(job_id)
             return self.decode_status.get(status, _JobStatus.other)
 
     def kill_job(self, job_id):
-        process = self.jobs.get(job_id)
-        if not process:
-            raise ValueError("Job not found.")
-        process.terminate()
+        with self._lock:
+            for job in self._queue:
+                if job[0] == job_id:
+                    self._queue.remove(job)
+                    self._exit_codes[job_id] = -15
+                    return
+            process = self.jobs.get(job_id)
+            if not process:
+                raise ValueError("Job not found.")
+            process.terminate()
+
+    def notify_on_status_change(self, event):
+        self._status_event = event
+        return True
+
+    def _fits(self):
+        """
+        Whether the free resources suffice for another job.
+        """
+        return ((self.resources is None
+                 or len(self.resources) >= self.resources_per_trial)
+                and (not self.cores_per_trial
+                     or len(self.cores) >= self.cores_per_trial)
+                and (self.memory is None
+                     or self.memory >= self.memory_per_trial))
+
+    def _start_queued(self):
+        """
+        Starts queued jobs in order while their resources are free.
+        """
+        while self._queue and self._fits():
+            job_id, command, env, output_file = self._queue.popleft()
+            if self.resources is not None:
+                resources = [self.resources.pop()
+                             for _ in range(self.resources_per_trial)]
+                self.resource_by_job[job_id] = resources
+                env['SHERPA_RESOURCE'] = ','.join(str(r) for r in resources)
+            else:
+                env['SHERPA_RESOURCE'] = ''
+            cores = []
+            if self.cores_per_trial:
+                cores = self.cores[:self.cores_per_trial]
+                del self.cores[:self.cores_per_trial]
+                self.cores_by_job[job_id] = cores
+                env['SHERPA_CORES'] = ','.join(str(c) for c in cores)
+            preexec_fn = None
+            if cores and _TASKSET:
+                command = [_TASKSET, '-c', env['SHERPA_CORES']] + command
+            elif cores and hasattr(os, 'sched_setaffinity'):
+                # preexec_fn may deadlock when the runner's threads hold
+                # locks during the fork, so taskset is preferred.
+                preexec_fn = functools.partial(os.sched_setaffinity, 0, cores)
+            if self.memory is not None:
+                self.memory -= self.memory_per_trial
+                self.memory_by_job[job_id] = self.memory_per_trial
+                env['SHERPA_MEMORY'] = str(self.memory_per_trial)
+
+            f = open(output_file, 'w')
+            process = subprocess.Popen(command, env=env, stderr=f, stdout=f,
+                                       preexec_fn=preexec_fn)
+            self.jobs[job_id] = process
+            self.output_files[job_id] = f
+            self._watch(job_id, process)
+
+    def _release(self, job_id):
+        """
+        Gives back the resources of an ended job and starts queued jobs.
+        """
+        if job_id in self.resource_by_job:
+            self.resources.extend(self.resource_by_job.pop(job_id))
+        if job_id in self.cores_by_job:
+            self.cores = sorted(self.cores + self.cores_by_job.pop(job_id))
+        if job_id in self.memory_by_job:
+            self.memory += self.memory_by_job.pop(job_id)
+        if job_id in self.output_files:
+            self.output_files.pop(job_id).close()
+        self._start_queued()
+
+    def _watch(self, job_id, process):
+        """
+        Waits for the process to exit in a daemon thread, then releases its
+        resources and sets the status event.
+        """
+        def wait():
+            process.wait()
+            with self._lock:
+                self._release(job_id)
+            if self._status_event is not None:
+                self._status_event.set()
+        thread = threading.Thread(target=wait)
+        thread.daemon = True
+        thread.start()
+
+
+class LocalPoolScheduler(Scheduler):
+    """
+    Runs trials in a pool of persistent local worker processes.
+
+    Instead of starting a new Python interpreter for every trial, each worker
+    imports the trial function once and then calls it for one trial after
+    another. Modules, models and data that the trial module loads on import
+    or caches in global variables are therefore reused by later trials on
+    the same worker. The trial function gets its trial and sends metrics
+    through ``sherpa.Client`` just like a trial script does; the
+    ``command`` passed to ``submit_job`` is ignored.
+
+    Args:
+        function (str): the trial function as ``'module:function'``, e.g.
+            ``'train:main'``. The module must be importable by the workers,
+            for example from the current working directory.
+        num_workers (int): number of worker processes, defaults to the number
+            of CPUs.
+        output_dir (str): path to directory in which ``stdout`` and ``stderr``
+            of each trial will be written to.
+
+    Where available, workers are started from a ``forkserver`` rather than
+    forked from the busy study process. As with ``multiprocessing``, the
+    script that runs the study must then guard it with
+    ``if __name__ == '__main__':``.
+    """
+    def __init__(self, function, num_workers=None, output_dir=''):
+        self.function = function
+        self._context = _worker_context()
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.output_dir = output_dir
+        self.decode_status = {0: _JobStatus.finished,
+                              -15: _JobStatus.killed}
+        self._lock = threading.Lock()
+        self._count = 0
+        self._workers = []  # worker processes, None if not started.
+        self._tasks = []  # queue of tasks for each worker.
+        self._running = []  # job ID each worker runs, None if idle.
+        self._pending = collections.deque()  # jobs waiting for a worker.
+        self._exit_codes = {}  # job ID to exit code of ended jobs.
+        self._results = None
+        self._reader = None
+        self._status_event = None
+
+    def submit_job(self, command, env={}, job_name=''):
+        outdir = os.path.join(self.output_dir, 'jobs')
+        if not os.path.isdir(outdir):
+            os.mkdir(outdir)
+        with self._lock:
+            self._start()
+            self._count += 1
+            job_id = self._count
+            output_file = os.path.join(
+                outdir, '{}.out'.format(job_name or job_id))
+            self._pending.append((job_id, dict(env), output_file))
+            self._dispatch()
+        return job_id
+
+    def get_status(self, job_id):
+        with self._lock:
+            if job_id in self._exit_codes:
+                return self.decode_status.get(self._exit_codes[job_id],
+                                              _JobStatus.other)
+            if job_id in self._running:
+                return _JobStatus.running
+            if any(task[0] == job_id for task in self._pending):
+                return _JobStatus.queued
+        raise ValueError("Job not found.")
+
+    def kill_job(self, job_id):
+        with self._lock:
+            for task in self._pending:
+                if task[0] == job_id:
+                    self._pending.remove(task)
+                    self._exit_codes[job_id] = -15
+                    return
+            if job_id not in self._running:
+                raise ValueError("Job not found.")
+            # The trial can only be stopped with its worker, so the worker
+            # is replaced by a new one.
+            i = self._running.index(job_id)
+            self._workers[i].terminate()
+            self._workers[i].join()
+            self._end(i, -15)
+            self._start_worker(i)
+            self._dispatch()
+
+    def notify_on_status_change(self, event):
+        self._status_event = event
+        return True
+
+    def close(self):
+        with self._lock:
+            for i, worker in enumerate(self._workers):
+                self._tasks[i].put(None)
+            for worker in self._workers:
+                worker.join(timeout=5)
+                if worker.is_alive():
+                    worker.terminate()
+            self._workers = []
+            if self._results is not None:
+                self._results.put(None)  # stops the reader thread.
+
+    def _start(self):
+        """
+        Starts the workers and the thread that collects their results.
+        """
+        if self._workers:
+            return
+        self._results = self._context.Queue()
+        self._tasks = [self._context.Queue()
+                       for _ in range(self.num_workers)]
+        self._workers = [None] * self.num_workers
+        self._running = [None] * self.num_workers
+        for i in range(self.num_workers):
+            self._start_worker(i)
+        self._reader = threading.Thread(target=self._read_results,
+                                        args=(self._results,))
+        self._reader.daemon = True
+        self._reader.start()
+
+    def _start_worker(self, i):
+        worker = self._context.Process(
+            target=_pool_worker,
+            args=(self.function, self._tasks[i], self._results, i))
+        worker.daemon = True
+        worker.start()
+        self._workers[i] = worker
+
+    def _dispatch(self):
+        """
+        Hands pending jobs to idle workers.
+        """
+        for i, job_id in enumerate(self._running):
+            if not self._pending:
+                break
+            if job_id is None:
+                task = self._pending.popleft()
+                self._running[i] = task[0]
+                self._tasks[i].put(task)
+
+    def _end(self, i, exit_code):
+        self._exit_codes[self._running[i]] = exit_code
+        self._running[i] = None
+        if self._status_event is not None:
+            self._status_event.set()
+
+    def _read_results(self, results):
+        """
+        Records the exit codes that workers report and replaces workers that
+        died during a trial, e.g. from a segmentation fault.
+        """
+        while True:
+            try:
+                result = results.get(timeout=1.)
+            except queue.Empty:
+                result = False
+            if result is None:
+                return
+            with self._lock:
+                if result:
+                    i, job_id, exit_code = result
+                    if self._running[i] == job_id:
+                        self._end(i, exit_code)
+                for i, worker in enumerate(self._workers):
+                    if not worker.is_alive() and self._running[i] is not None:
+                        logger.warning("Worker running job {} died, starting "
+                                       "a new one.".format(self._running[i]))
+                        self._end(i, worker.exitcode)
+                        self._start_worker(i)
+                self._dispatch()
+
+
+def _worker_context():
+    """
+    Returns:
+        the ``multiprocessing`` context for pool workers. Forking a process
+        that runs threads can leave locks held in the child, so workers are
+        started from a ``forkserver`` where the platform has one.
+    """
+    if not hasattr(multiprocessing, 'get_context'):  # python 2
+        return multiprocessing
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def _pool_worker(function, tasks, results, index):
+    """
+    Runs trials for ``LocalPoolScheduler`` until it sends ``None``.
+
+    The trial function is imported on the first trial and kept for the next
+    ones. Output of each trial is redirected to its output file, and its
+    environment variables are removed again once it ends. Since the worker
+    does not exit, Clients the trial leaves open are closed after it
+    returns, which writes their buffered metrics.
+    """
+    from .database import _close_clients
+    trial_function = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        job_id, env, output_file = task
+        environ = dict(os.environ)
+        os.environ.update(env)
+        exit_code = 0
+        with open(output_file, 'w', 1) as f:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            saved = os.dup(1), os.dup(2), sys.stdout, sys.stderr
+            os.dup2(f.fileno(), 1)
+            os.dup2(f.fileno(), 2)
+            sys.stdout = sys.stderr = f
+            try:
+                if trial_function is None:
+                    module_name, function_name = function.split(':')
+                    trial_function = getattr(
+                        importlib.import_module(module_name), function_name)
+                try:
+                    trial_function()
+                finally:
+                    _close_clients()
+            except SystemExit as e:
+                if e.code is None:
+                    exit_code = 0
+                else:
+                    exit_code = e.code if isinstance(e.code, int) else 1
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                f.flush()
+                sys.stdout, sys.stderr = saved[2:]
+                os.dup2(saved[0], 1)
+                os.dup2(saved[1], 2)
+                os.close(saved[0])
+                os.close(saved[1])
+                os.environ.clear()
+                os.environ.update(environ)
+        results.put((index, job_id, exit_code))
+
+
+class _DRMAASession(object):
+    """
+    A DRMAA session that is kept open across scheduler calls.
+
+    The session is opened on first use. If a call fails because the
+    connection to the DRM was lost, the session is opened again and the call
+    is retried once.
+
+    Args:
+        drmaa (module): the ``drmaa`` module.
+
+    Attributes:
+        timings (dict): maps the name of each timed call to a dict with its
+            number of ``calls``, total ``seconds`` and ``max_seconds``.
+    """
+    def __init__(self, drmaa):
+        self.drmaa = drmaa
+        self.timings = {}
+        self._session = None
+
+    def call(self, name, *args):
+        """
+        Calls the session method ``name`` with ``args`` and times it.
+        """
+        with self.timed(name):
+            try:
+                return getattr(self._open(), name)(*args)
+            except (self.drmaa.errors.DrmCommunicationException,
+                    self.drmaa.errors.NoActiveSessionException) as e:
+                logger.warning("DRMAA session lost ({}), "
+                               "reconnecting.".format(e))
+                self.close()
+                return getattr(self._open(), name)(*args)
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        """
+        Adds the time spent in the ``with`` block to ``timings[name]``.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            timing = self.timings.setdefault(
+                name, {'calls': 0, 'seconds': 0., 'max_seconds': 0.})
+            timing['calls'] += 1
+            timing['seconds'] += elapsed
+            timing['max_seconds'] = max(timing['max_seconds'], elapsed)
+
+    def _open(self):
+        if self._session is None:
+            with self.timed('initialize'):
+                session = self.drmaa.Session()
+                try:
+                    session.initialize()
+                except self.drmaa.errors.AlreadyActiveSessionException:
+                    pass  # DRMAA allows one session per process, share it.
+            self._session = session
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            session, self._session = self._session, None
+            try:
+                session.exit()
+            except self.drmaa.errors.DrmaaException:
+                pass
 
 
 class SGEScheduler(Scheduler):
@@ -166,14 +671,26 @@ class SGEScheduler(Scheduler):
         output_dir (str): path to directory in which ``stdout`` and ``stderr``
             will be written to. If not specified this will use the same as
             defined for the study.
+        status_cache_ttl (float): seconds for which job statuses are reused
+            before they are queried again.
+
+    Attributes:
+        timings (dict): maps each kind of call to the cluster, e.g.
+            ``'submit'`` or ``'jobStatus'``, to a dict with its number of
+            ``calls``, total ``seconds`` and ``max_seconds``.
     """
-    def __init__(self, submit_options, environment, output_dir=''):
+    def __init__(self, submit_options, environment, output_dir='',
+                 status_cache_ttl=1.):
         self.count = 0
         self.submit_options = submit_options
         self.environment = environment
         self.output_dir = output_dir
         self.killed_jobs = set()
+        self.status_cache_ttl = status_cache_ttl
+        self._statuses = {}  # job ID to status from the last query.
+        self._statuses_time = 0.  # time of the last query.
         self.drmaa = __import__('drmaa')
+        self._session = _DRMAASession(self.drmaa)
         self.decode_status = {
             self.drmaa.JobState.UNDETERMINED: _JobStatus.other,
             self.drmaa.JobState.QUEUED_ACTIVE: _JobStatus.queued,
@@ -216,19 +733,71 @@ class SGEScheduler(Scheduler):
         assert ' -cwd' not in submit_command
 
         # Submit using subprocess so we can get SGE process ID.
-        job_id = self._submit_job(submit_command, job_script)
+        with self._session.timed('submit'):
+            job_id = self._submit_job(submit_command, job_script)
 
         logger.info('\t{}: job submitted'.format(job_id))
         self.count += 1
 
         return job_id
 
+    def submit_jobs(self, command, envs, job_names):
+        """
+        Submits all jobs as one SGE array job. Each array task exports the
+        environment variables of its job and writes to its own output file.
+
+        Returns:
+            list[str]: the SGE IDs of the array tasks.
+        """
+        if len(envs) == 1:
+            return [self.submit_job(command, env=envs[0],
+                                    job_name=job_names[0])]
+        outdir = os.path.join(self.output_dir, 'jobs')
+        if not os.path.isdir(outdir):
+            os.mkdir(outdir)
+
+        job_script = '#$ -S /bin/bash\n'
+        if self.environment:
+            job_script += 'source %s\n' % self.environment
+        job_script += 'case $SGE_TASK_ID in\n'
+        for task_id, (env, job_name) in enumerate(zip(envs, job_names), 1):
+            sgeoutfile = os.path.join(outdir, '{}.out'.format(job_name))
+            try:
+                os.remove(sgeoutfile)
+            except OSError:
+                pass
+            job_script += '{})\n'.format(task_id)
+            for var_name, var_value in env.items():
+                job_script += '    export {}={}\n'.format(var_name, var_value)
+            job_script += '    exec > {} 2>&1\n    ;;\n'.format(sgeoutfile)
+        job_script += 'esac\n'
+        job_script += 'echo "Running from" ${HOSTNAME}\n'
+        job_script += " ".join(command)
+
+        sgeoutfile = os.path.join(outdir, '{}-array.out'.format(job_names[0]))
+        submit_command = 'qsub -S /bin/bash -wd {} -j y -o {} -e {} -t 1-{} {}'.format(
+            os.getcwd(), sgeoutfile, sgeoutfile, len(envs), self.submit_options)
+        with self._session.timed('submit'):
+            array_id = self._submit_job(submit_command, job_script,
+                                        output_regexp=r'Your job-array (\d+)')
+
+        logger.info('\t{}: array job of {} jobs submitted'.format(
+            array_id, len(envs)))
+        self.count += len(envs)
+        if array_id is None:
+            return [None] * len(envs)
+        return ['{}.{}'.format(array_id, task_id)
+                for task_id in range(1, len(envs) + 1)]
+
     @staticmethod
-    def _submit_job(submit_command, run_command):
+    def _submit_job(submit_command, run_command,
+                    output_regexp=r'Your job (\d+)'):
         """
         Args:
             submit_command (str): e.g. "qsub -N myProject ..."
             run_command (str): e.g. "python nn.py"
+            output_regexp (str): pattern that matches the process ID in the
+                output of the submit command.
 
         Returns:
             str: SGE process ID.
@@ -242,7 +811,6 @@ class SGEScheduler(Scheduler):
         output, std_err = process.communicate(input=run_command)
         # output, std_err = process.communicate()
         process.stdin.close()
-        output_regexp = r'Your job (\d+)'
         # Parse out the process id from text
         match = re.search(output_regexp, output)
         if match:
@@ -259,15 +827,39 @@ class SGEScheduler(Scheduler):
         Returns:
             sherpa.schedulers._JobStatus: The job status.
         """
-        with self.drmaa.Session() as s:
-            try:
-                status = s.jobStatus(str(job_id))
-            except self.drmaa.errors.InvalidJobException:
-                return _JobStatus.finished
-        s = self.decode_status.get(status)
-        if s == _JobStatus.finished and job_id in self.killed_jobs:
-            s = _JobStatus.killed
-        return s
+        return self.get_statuses([job_id])[job_id]
+
+    def get_statuses(self, job_ids):
+        """
+        Queries the statuses of all given jobs. The statuses are reused for
+        ``status_cache_ttl`` seconds.
+
+        Args:
+            job_ids (list[str]): SGE process IDs.
+
+        Returns:
+            dict: maps each job ID to its sherpa.schedulers._JobStatus.
+        """
+        now = time.time()
+        if (now - self._statuses_time > self.status_cache_ttl
+                or any(job_id not in self._statuses for job_id in job_ids)):
+            self._statuses = {}
+            with self._session.timed('get_statuses'):
+                for job_id in job_ids:
+                    try:
+                        status = self.decode_status.get(
+                            self._session.call('jobStatus', str(job_id)))
+                    except self.drmaa.errors.InvalidJobException:
+                        status = _JobStatus.finished
+                    self._statuses[job_id] = status
+            self._statuses_time = now
+        statuses = {}
+        for job_id in job_ids:
+            s = self._statuses[job_id]
+            if s == _JobStatus.finished and job_id in self.killed_jobs:
+                s = _JobStatus.killed
+            statuses[job_id] = s
+        return statuses
 
     def kill_job(self, job_id):
         """
@@ -277,10 +869,18 @@ class SGEScheduler(Scheduler):
             job_id (str): the SGE process ID of the job.
         """
         logger.info("Killing job {}".format(job_id))
-        with self.drmaa.Session() as s:
-            s.control(job_id, self.drmaa.JobControlAction.TERMINATE)
+        self._session.call('control', job_id,
+                           self.drmaa.JobControlAction.TERMINATE)
         # TODO: what happens when job doesn't exist - then we don't want to add
         self.killed_jobs.add(job_id)
+        self._statuses.pop(job_id, None)
+
+    @property
+    def timings(self):
+        return self._session.timings
+
+    def close(self):
+        self._session.close()
 
 
 class SLURMScheduler(Scheduler):
@@ -297,14 +897,26 @@ class SLURMScheduler(Scheduler):
         output_dir (str): path to directory in which ``stdout`` and ``stderr``
             will be written to. If not specified this will use the same as
             defined for the study.
+        status_cache_ttl (float): seconds for which job statuses are reused
+            before they are queried again.
+
+    Attributes:
+        timings (dict): maps each kind of call to the cluster, e.g.
+            ``'submit'`` or ``'jobStatus'``, to a dict with its number of
+            ``calls``, total ``seconds`` and ``max_seconds``.
     """
-    def __init__(self, submit_options, environment, output_dir=''):
+    def __init__(self, submit_options, environment, output_dir='',
+                 status_cache_ttl=1.):
         self.count = 0
         self.submit_options = submit_options
         self.environment = environment
         self.output_dir = output_dir
         self.killed_jobs = set()
+        self.status_cache_ttl = status_cache_ttl
+        self._statuses = {}  # job ID to status from the last query.
+        self._statuses_time = 0.  # time of the last query.
         self.drmaa = __import__('drmaa')
+        self._session = _DRMAASession(self.drmaa)
         self.decode_status = {
             self.drmaa.JobState.UNDETERMINED: _JobStatus.other,
             self.drmaa.JobState.QUEUED_ACTIVE: _JobStatus.queued,
@@ -349,19 +961,71 @@ class SLURMScheduler(Scheduler):
         assert ' -cwd' not in submit_command
 
         # Submit using subprocess so we can get SLURM process ID.
-        job_id = self._submit_job(submit_command, job_script)
+        with self._session.timed('submit'):
+            job_id = self._submit_job(submit_command, job_script)
 
         logger.info('\t{}: job submitted'.format(job_id))
         self.count += 1
 
         return job_id
 
+    def submit_jobs(self, command, envs, job_names):
+        """
+        Submits all jobs as one SLURM array job. Each array task exports the
+        environment variables of its job and writes to its own output file.
+
+        Returns:
+            list[str]: the SLURM IDs of the array tasks.
+        """
+        if len(envs) == 1:
+            return [self.submit_job(command, env=envs[0],
+                                    job_name=job_names[0])]
+        outdir = os.path.join(self.output_dir, 'jobs')
+        if not os.path.isdir(outdir):
+            os.mkdir(outdir)
+
+        job_script = '#!/bin/bash\n'
+        if self.environment:
+            job_script += 'source %s\n' % self.environment
+        job_script += 'case $SLURM_ARRAY_TASK_ID in\n'
+        for task_id, (env, job_name) in enumerate(zip(envs, job_names), 1):
+            slurmoutfile = os.path.join(outdir, '{}.out'.format(job_name))
+            try:
+                os.remove(slurmoutfile)
+            except OSError:
+                pass
+            job_script += '{})\n'.format(task_id)
+            for var_name, var_value in env.items():
+                job_script += '    export {}={}\n'.format(var_name, var_value)
+            job_script += '    exec > {} 2>&1\n    ;;\n'.format(slurmoutfile)
+        job_script += 'esac\n'
+        job_script += 'echo "Running from" ${HOSTNAME}\n'
+        job_script += " ".join(command)
+
+        slurmoutfile = os.path.join(outdir, '{}-array.out'.format(job_names[0]))
+        submit_command = 'sbatch --chdir={} --output={} --error={} --array=1-{} {}'.format(
+            os.getcwd(), slurmoutfile, slurmoutfile, len(envs), self.submit_options)
+        with self._session.timed('submit'):
+            array_id = self._submit_job(submit_command, job_script,
+                                        output_regexp=r'Submitted batch job (\d+)')
+
+        logger.info('\t{}: array job of {} jobs submitted'.format(
+            array_id, len(envs)))
+        self.count += len(envs)
+        if array_id is None:
+            return [None] * len(envs)
+        return ['{}_{}'.format(array_id, task_id)
+                for task_id in range(1, len(envs) + 1)]
+
     @staticmethod
-    def _submit_job(submit_command, run_command):
+    def _submit_job(submit_command, run_command,
+                    output_regexp=r'Submitted batch job (\d+)'):
         """
         Args:
             submit_command (str): e.g. "qsub -N myProject ..."
             run_command (str): e.g. "python nn.py"
+            output_regexp (str): pattern that matches the process ID in the
+                output of the submit command.
 
         Returns:
             str: SLURM process ID.
@@ -375,7 +1039,6 @@ class SLURMScheduler(Scheduler):
         output, std_err = process.communicate(input=run_command)
         # output, std_err = process.communicate()
         process.stdin.close()
-        output_regexp = r'Submitted batch job (\d+)'
         # Parse out the process id from text
         match = re.search(output_regexp, output)
         if match:
@@ -392,15 +1055,39 @@ class SLURMScheduler(Scheduler):
         Returns:
             sherpa.schedulers._JobStatus: The job status.
         """
-        with self.drmaa.Session() as s:
-            try:
-                status = s.jobStatus(str(job_id))
-            except self.drmaa.errors.InvalidJobException:
-                return _JobStatus.finished
-        s = self.decode_status.get(status)
-        if s == _JobStatus.finished and job_id in self.killed_jobs:
-            s = _JobStatus.killed
-        return s
+        return self.get_statuses([job_id])[job_id]
+
+    def get_statuses(self, job_ids):
+        """
+        Queries the statuses of all given jobs. The statuses are reused for
+        ``status_cache_ttl`` seconds.
+
+        Args:
+            job_ids (list[str]): SLURM process IDs.
+
+        Returns:
+            dict: maps each job ID to its sherpa.schedulers._JobStatus.
+        """
+        now = time.time()
+        if (now - self._statuses_time > self.status_cache_ttl
+                or any(job_id not in self._statuses for job_id in job_ids)):
+            self._statuses = {}
+            with self._session.timed('get_statuses'):
+                for job_id in job_ids:
+                    try:
+                        status = self.decode_status.get(
+                            self._session.call('jobStatus', str(job_id)))
+                    except self.drmaa.errors.InvalidJobException:
+                        status = _JobStatus.finished
+                    self._statuses[job_id] = status
+            self._statuses_time = now
+        statuses = {}
+        for job_id in job_ids:
+            s = self._statuses[job_id]
+            if s == _JobStatus.finished and job_id in self.killed_jobs:
+                s = _JobStatus.killed
+            statuses[job_id] = s
+        return statuses
 
     def kill_job(self, job_id):
         """
@@ -410,7 +1097,15 @@ class SLURMScheduler(Scheduler):
             job_id (str): the SLURM process ID of the job.
         """
         logger.info("Killing job {}".format(job_id))
-        with self.drmaa.Session() as s:
-            s.control(job_id, self.drmaa.JobControlAction.TERMINATE)
+        self._session.call('control', job_id,
+                           self.drmaa.JobControlAction.TERMINATE)
         # TODO: what happens when job doesn't exist - then we don't want to add
         self.killed_jobs.add(job_id)
+        self._statuses.pop(job_id, None)
+
+    @property
+    def timings(self):
+        return self._session.timings
+
+    def close(self):
+        self._session.close()
@@ -0,0 +1,281 @@
+"""
+SHERPA is a Python library for hyperparameter tuning of machine learning models.
+Copyright (C) 2018  Lars Hertel, Peter Sadowski, and Julian Collado.
+
+This file is part of SHERPA.
+
+SHERPA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+SHERPA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SHERPA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from __future__ import print_function
+import collections
+import sys
+import time
+import sherpa
+from testing_utils import *
+
+
+# Micro-benchmarks for SHERPA internals. These are not collected by pytest,
+# run e.g. ``python tests/benchmarks.py add_observation`` from the repository
+# root, or without arguments to run all of them.
+
+def benchmark_add_observation(num_rows=1000000, iterations_per_trial=100,
+                              report_every=100000):
+    """
+    Measures per-observation latency of ``Study.add_observation`` as the
+    results table grows. Latency should stay flat up to ``num_rows``.
+    """
+    study = sherpa.Study(parameters=[sherpa.Continuous('a', [0, 1]),
+                                     sherpa.Choice('b', ['x', 'y'])],
+                         algorithm=sherpa.algorithms.RandomSearch(),
+                         lower_is_better=True,
+                         disable_dashboard=True)
+    print("{:>10} {:>20}".format("rows", "usec/observation"))
+    start = time.time()
+    for i in range(num_rows):
+        if i % iterations_per_trial == 0:
+            trial = sherpa.Trial(id=i // iterations_per_trial + 1,
+                                 parameters={'a': 0.5, 'b': 'x'})
+        study.add_observation(trial=trial,
+                              iteration=i % iterations_per_trial,
+                              objective=float(i),
+                              context={'loss': 0.5})
+        if (i + 1) % report_every == 0:
+            now = time.time()
+            print("{:>10} {:>20.2f}".format(i + 1,
+                                            (now - start) / report_every * 1e6))
+            start = now
+
+
+class _InMemoryDatabase(object):
+    """
+    Stands in for ``sherpa.database._Database`` in the runner benchmark and
+    reports one observation per enqueued trial.
+    """
+    port = 0
+
+    def __init__(self):
+        self.pending = []
+
+    def notify_on_new_results(self, event):
+        return False
+
+    def client_env(self):
+        return {}
+
+    def enqueue_trial(self, trial):
+        self.pending.append({'trial_id': trial.id, 'parameters': trial.parameters,
+                             'iteration': 1, 'objective': 0.,
+                             'context': {}})
+
+    def get_new_results(self):
+        results, self.pending = self.pending, []
+        return results
+
+    def add_for_stopping(self, trial_id):
+        pass
+
+
+def benchmark_runner_loop(num_trials=40, max_concurrent=8, trial_seconds=1.):
+    """
+    Compares trials/hour of the runner with a fixed 5 second poll against the
+    event-driven loop, using the LocalScheduler and short trials.
+    """
+    import tempfile
+    import shutil
+    print("{:>12} {:>12} {:>14}".format("mode", "seconds", "trials/hour"))
+    for mode, min_wait, max_wait, events in [('fixed 5s', 5., 5., False),
+                                             ('event', 0.1, 5., True)]:
+        output_dir = tempfile.mkdtemp()
+        try:
+            study = sherpa.Study(
+                parameters=[sherpa.Continuous('a', [0, 1])],
+                algorithm=sherpa.algorithms.RandomSearch(
+                    max_num_trials=num_trials),
+                lower_is_better=True,
+                disable_dashboard=True,
+                output_dir=output_dir)
+            scheduler = sherpa.schedulers.LocalScheduler(
+                output_dir=output_dir)
+            if not events:
+                scheduler.notify_on_status_change = lambda event: False
+            runner = sherpa.core._Runner(
+                study=study,
+                scheduler=scheduler,
+                database=_InMemoryDatabase(),
+                max_concurrent=max_concurrent,
+                command=[sys.executable, '-c',
+                         'import time; time.sleep({})'.format(trial_seconds)],
+                min_wait=min_wait,
+                max_wait=max_wait)
+            start = time.time()
+            runner.run_loop()
+            elapsed = time.time() - start
+        finally:
+            shutil.rmtree(output_dir)
+        print("{:>12} {:>12.1f} {:>14.0f}".format(mode, elapsed,
+                                                 num_trials / elapsed * 3600))
+
+
+def benchmark_local_pool_scheduler(num_trials=40, max_concurrent=4,
+                                   imports='numpy, pandas, sklearn'):
+    """
+    Compares the wall time of short trials that import ``imports`` with the
+    LocalScheduler, which starts a new interpreter per trial, and the
+    LocalPoolScheduler, which imports them once per worker.
+    """
+    import os
+    import tempfile
+    import shutil
+    print("{:>12} {:>12} {:>14}".format("scheduler", "seconds", "trials/hour"))
+    output_dir = tempfile.mkdtemp()
+    with open(os.path.join(output_dir, 'pool_trial.py'), 'w') as f:
+        f.write("import {}\n\n\ndef run():\n    pass\n".format(imports))
+    sys.path.insert(0, output_dir)
+    try:
+        for name, scheduler in [
+                ('local', sherpa.schedulers.LocalScheduler(
+                    output_dir=output_dir)),
+                ('pool', sherpa.schedulers.LocalPoolScheduler(
+                    'pool_trial:run', num_workers=max_concurrent,
+                    output_dir=output_dir))]:
+            study = sherpa.Study(
+                parameters=[sherpa.Continuous('a', [0, 1])],
+                algorithm=sherpa.algorithms.RandomSearch(
+                    max_num_trials=num_trials),
+                lower_is_better=True,
+                disable_dashboard=True,
+                output_dir=output_dir)
+            runner = sherpa.core._Runner(
+                study=study,
+                scheduler=scheduler,
+                database=_InMemoryDatabase(),
+                max_concurrent=max_concurrent,
+                command=[sys.executable, '-c', 'import ' + imports])
+            start = time.time()
+            runner.run_loop()
+            elapsed = time.time() - start
+            scheduler.close()
+            print("{:>12} {:>12.1f} {:>14.0f}".format(
+                name, elapsed, num_trials / elapsed * 3600))
+    finally:
+        sys.path.remove(output_dir)
+        shutil.rmtree(output_dir)
+
+def benchmark_trial_lookup(num_trials=50000, num_lookups=1000):
+    """
+    Measures the latency of ``Client.get_trial`` with ``num_trials`` trials
+    enqueued, with and without the index on ``trial_id``. Needs ``mongod``.
+    """
+    import os
+    import random
+    import tempfile
+    import shutil
+    output_dir = tempfile.mkdtemp()
+    port = sherpa.core._port_finder(27000, 28000)
+    try:
+        with sherpa.database._Database(output_dir, port=port) as db:
+            db.db.trials.insert_many(
+                [{'trial_id': i, 'parameters': {'a': 0.5, 'b': 'x'}}
+                 for i in range(1, num_trials + 1)])
+            client = sherpa.Client(port=port)
+            print("{:>12} {:>18}".format("index", "usec/lookup"))
+            for indexed in (True, False):
+                if not indexed:
+                    db.db.trials.drop_index('trial_id_1')
+                start = time.time()
+                for _ in range(num_lookups):
+                    os.environ['SHERPA_TRIAL_ID'] = str(
+                        random.randint(1, num_trials))
+                    client.get_trial()
+                print("{:>12} {:>18.1f}".format(
+                    str(indexed), (time.time() - start) / num_lookups * 1e6))
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def benchmark_results_format(num_rows=1000000, iterations_per_trial=100):
+    """
+    Compares save time, load time and file size of the binary results
+    snapshot against CSV for a study with ``num_rows`` rows.
+    """
+    import os
+    import tempfile
+    import shutil
+    import pandas
+    from sherpa.results import _ResultsTable
+    table = _ResultsTable(capacity=num_rows)
+    for i in range(num_rows):
+        table.append(collections.OrderedDict([
+            ('Trial-ID', i // iterations_per_trial + 1),
+            ('Status', 'INTERMEDIATE'),
+            ('Iteration', i % iterations_per_trial),
+            ('a', 0.5), ('b', 'x' if i % 2 else 'y'),
+            ('Objective', float(i)), ('loss', 0.5)]))
+    output_dir = tempfile.mkdtemp()
+    try:
+        print("{:>8} {:>10} {:>10} {:>10}".format("format", "save (s)",
+                                                 "load (s)", "size (MB)"))
+        path = os.path.join(output_dir, 'results.npz')
+        start = time.time()
+        with open(path, 'wb') as f:
+            table.to_npz(f)
+        save_time = time.time() - start
+        start = time.time()
+        _ResultsTable.from_npz(path).to_frame()
+        load_time = time.time() - start
+        print("{:>8} {:>10.2f} {:>10.2f} {:>10.1f}".format(
+            "npz", save_time, load_time, os.path.getsize(path) / 1e6))
+
+        path = os.path.join(output_dir, 'results.csv')
+        start = time.time()
+        table.to_frame().to_csv(path, index=False)
+        save_time = time.time() - start
+        start = time.time()
+        _ResultsTable.from_frame(pandas.read_csv(path)).to_frame()
+        load_time = time.time() - start
+        print("{:>8} {:>10.2f} {:>10.2f} {:>10.1f}".format(
+            "csv", save_time, load_time, os.path.getsize(path) / 1e6))
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def benchmark_random_search_batch(num_configs=1000000, num_loop=20000):
+    """
+    Compares sampling ``num_configs`` configurations with
+    ``RandomSearch.get_suggestions`` against calling ``get_suggestion`` once
+    per configuration, timed over ``num_loop`` calls and extrapolated.
+    """
+    parameters = [sherpa.Continuous('lr', [1e-5, 1e-1], scale='log'),
+                  sherpa.Continuous('dropout', [0, 0.5]),
+                  sherpa.Discrete('units', [16, 1024], scale='log'),
+                  sherpa.Discrete('layers', [1, 8]),
+                  sherpa.Choice('activation', ['relu', 'tanh', 'sigmoid'])]
+    print("{:>8} {:>12}".format("mode", "seconds"))
+    rs = sherpa.algorithms.RandomSearch()
+    start = time.time()
+    for _ in range(num_loop):
+        rs.get_suggestion(parameters)
+    print("{:>8} {:>12.2f}".format(
+        "loop", (time.time() - start) * num_configs / num_loop))
+    start = time.time()
+    rs.get_suggestions(parameters, num_configs)
+    print("{:>8} {:>12.2f}".format("batch", time.time() - start))
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or [n[len('benchmark_'):] for n in sorted(globals())
+                             if n.startswith('benchmark_')]
+    for name in names:
+        print("\n" + name)
+        globals()['benchmark_' + name]()
@@ -57,6 +57,30 @@ def test_median_stopping_rule():
                                          lower_is_better=True)
 
 
+@pytest.mark.parametrize("min_iterations,min_trials,expected",
+                         [(2, 1, True), (4, 1, False), (2, 4, False)])
+def test_median_stopping_rule_with_trial_summaries(min_iterations, min_trials,
+                                                   expected):
+    stopper = sherpa.algorithms.MedianStoppingRule(
+        min_iterations=min_iterations, min_trials=min_trials)
+    study = sherpa.Study(parameters=[sherpa.Discrete('a', [1, 2]),
+                                     sherpa.Choice('b', [2, 5, 7])],
+                         algorithm=None,
+                         stopping_rule=stopper,
+                         lower_is_better=True,
+                         disable_dashboard=True)
+    for tid, objective in zip([1, 2, 3], [0.1, 0.2, 0.3]):
+        t = get_test_trial(id=tid)
+        for iteration in [1, 2, 3]:
+            study.add_observation(trial=t, iteration=iteration,
+                                  objective=objective)
+
+    t = get_test_trial(id=3)
+    assert study.should_trial_stop(t) == expected
+    assert stopper.should_trial_stop(trial=t, results=study.results,
+                                     lower_is_better=True) == expected
+
+
 def get_local_search_study_lower_is_better(params, seed):
     alg = sherpa.algorithms.LocalSearch(seed_configuration=seed)
 
@@ -370,6 +394,25 @@ def test_random_search():
         last_config = config
 
 
+def test_random_search_get_suggestions():
+    parameters = [sherpa.Continuous('a', [0, 1]),
+                  sherpa.Discrete('b', [1, 100], scale='log'),
+                  sherpa.Choice('c', ['x', 'y', 'z'])]
+    rs = sherpa.algorithms.RandomSearch(max_num_trials=25)
+
+    configs = rs.get_suggestions(parameters=parameters, n=20)
+    assert list(configs.columns) == ['a', 'b', 'c']
+    assert len(configs) == 20
+    assert configs['a'].between(0, 1).all()
+    assert configs['b'].between(1, 100).all()
+    assert configs['c'].isin(['x', 'y', 'z']).all()
+
+    assert len(rs.get_suggestions(parameters=parameters, n=20)) == 5
+    assert rs.get_suggestions(parameters=parameters,
+                              n=1) == sherpa.AlgorithmState.DONE
+    assert rs.get_suggestion(parameters=parameters) == sherpa.AlgorithmState.DONE
+
+
 def test_repeat_rs():
     parameters = [sherpa.Continuous('a', [0, 1]),
                   sherpa.Choice('b', ['x', 'y', 'z'])]
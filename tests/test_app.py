@@ -0,0 +1,172 @@
+"""
+SHERPA is a Python library for hyperparameter tuning of machine learning models.
+Copyright (C) 2018  Lars Hertel, Peter Sadowski, and Julian Collado.
+
+This file is part of SHERPA.
+
+SHERPA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+SHERPA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SHERPA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import json
+import os
+import numpy
+import pandas
+import pytest
+from sherpa.results import _ResultsChannel
+from testing_utils import *
+
+
+@pytest.fixture
+def dashboard(test_dir):
+    from sherpa.app.app import app
+    channel = _ResultsChannel(path=os.path.join(test_dir, 'channel'))
+    app.set_results_channel(channel)
+    yield channel, app.test_client()
+    channel.close()
+
+
+def _get(client, **args):
+    return json.loads(client.get('/results', query_string=args)
+                      .get_data(as_text=True))
+
+
+def test_results_endpoint_returns_deltas(dashboard):
+    channel, client = dashboard
+    delta = _get(client)
+    assert delta['rows'] == [] and delta['cursor'] == 0
+
+    for i in range(3):
+        channel.append(collections.OrderedDict([
+            ('Trial-ID', 1), ('Status', 'INTERMEDIATE'), ('Iteration', i),
+            ('Objective', numpy.nan if i == 1 else 0.5)]))
+    delta = _get(client, generation=delta['generation'], cursor=0)
+    assert delta['columns'] == ['Trial-ID', 'Status', 'Iteration', 'Objective']
+    assert delta['rows'] == [[1, 'INTERMEDIATE', 0, 0.5],
+                             [1, 'INTERMEDIATE', 1, None],
+                             [1, 'INTERMEDIATE', 2, 0.5]]
+    assert delta['cursor'] == 3
+
+    assert _get(client, generation=delta['generation'],
+                cursor=delta['cursor'])['rows'] == []
+
+    channel.reset(pandas.DataFrame({'Trial-ID': [2]}))
+    reset = _get(client, generation=delta['generation'],
+                 cursor=delta['cursor'])
+    assert reset['generation'] != delta['generation']
+    assert reset['rows'] == [[2]] and reset['cursor'] == 1
+
+
+def test_index_renders_without_rows(dashboard):
+    channel, client = dashboard
+    channel.append(collections.OrderedDict([
+        ('Trial-ID', 1), ('Status', 'INTERMEDIATE'), ('Iteration', 1),
+        ('Objective', 0.123456)]))
+    html = client.get('/index').get_data(as_text=True)
+    assert 'stoptrial1' in html
+    assert '0.123456' not in html
+
+
+def _add_trial(channel, trial_id, num_iterations, finalize=True):
+    for i in range(num_iterations):
+        channel.append(collections.OrderedDict([
+            ('Trial-ID', trial_id), ('Status', 'INTERMEDIATE'),
+            ('Iteration', i + 1), ('a', trial_id / 10.),
+            ('Objective', 1. / (i + 1))]))
+    if finalize:
+        channel.append(collections.OrderedDict([
+            ('Trial-ID', trial_id), ('Status', 'COMPLETED'),
+            ('Iteration', num_iterations), ('a', trial_id / 10.),
+            ('Objective', 1. / num_iterations)]))
+
+
+def test_results_endpoint_finalized_only(dashboard):
+    channel, client = dashboard
+    _add_trial(channel, 1, 5)
+    _add_trial(channel, 2, 3, finalize=False)
+    delta = _get(client, finalized=1)
+    assert delta['rows'] == [[1, 'COMPLETED', 5, 0.1, 0.2]]
+    assert delta['cursor'] == 9
+
+
+def test_summaries_endpoint(dashboard):
+    from sherpa.app.app import app
+    channel, client = dashboard
+    app.parameter_types = {'a': 'float'}
+    _add_trial(channel, 1, 5)
+    _add_trial(channel, 2, 3, finalize=False)
+    summaries = json.loads(client.get('/summaries').get_data(as_text=True))
+    assert summaries['columns'] == ['Trial-ID', 'Status', 'Count',
+                                    'Iteration', 'Objective', 'a']
+    assert summaries['rows'] == [[1, 'COMPLETED', 5, 5, 0.2, 0.1],
+                                 [2, 'INTERMEDIATE', 3, 3, 1. / 3, 0.2]]
+
+    with mock.patch.object(app, 'lower_is_better', False):
+        summaries = json.loads(client.get('/summaries')
+                               .get_data(as_text=True))
+    assert [row[4] for row in summaries['rows']] == [1., 1.]
+
+
+def test_curves_endpoint_downsamples(dashboard):
+    channel, client = dashboard
+    _add_trial(channel, 1, 500)
+    _add_trial(channel, 2, 5)
+    response = _get_curves(client, points=20)
+    curves = response['curves']
+    assert len(curves['1']) == 20
+    assert curves['1'][0] == [1, 1.] and curves['1'][-1] == [500, 1. / 500]
+    assert curves['2'] == [[i + 1, 1. / (i + 1)] for i in range(5)]
+    assert response['cursor'] == 507
+
+
+def _get_curves(client, **query):
+    return json.loads(client.get('/curves', query_string=query)
+                      .get_data(as_text=True))
+
+
+def test_curves_endpoint_is_incremental(dashboard):
+    channel, client = dashboard
+    _add_trial(channel, 1, 5)
+    _add_trial(channel, 2, 3, finalize=False)
+    first = _get_curves(client)
+    assert sorted(first['curves']) == ['1', '2']
+
+    since = {'generation': first['generation'], 'cursor': first['cursor']}
+    assert _get_curves(client, **since)['curves'] == {}
+    channel.append(collections.OrderedDict([
+        ('Trial-ID', 2), ('Status', 'INTERMEDIATE'), ('Iteration', 4),
+        ('a', 0.2), ('Objective', 0.25)]))
+    delta = _get_curves(client, **since)
+    assert list(delta['curves']) == ['2']
+    assert delta['curves']['2'][-1] == [4, 0.25]
+    assert delta['cursor'] == first['cursor'] + 1
+
+    channel.reset(pandas.DataFrame({'Trial-ID': [3], 'Status': ['COMPLETED'],
+                                    'Iteration': [1], 'Objective': [0.5]}))
+    reset = _get_curves(client, generation=delta['generation'],
+                        cursor=delta['cursor'])
+    assert reset['generation'] != delta['generation']
+    assert reset['curves'] == {'3': []}
+
+
+def test_lttb():
+    from sherpa.app.app import _lttb
+    x = numpy.arange(1000.)
+    y = numpy.zeros(1000)
+    y[500] = 10.
+    keep = _lttb(x, y, 50)
+    assert len(keep) == 50
+    assert keep[0] == 0 and keep[-1] == 999
+    assert 500 in keep
+    assert (numpy.diff(keep) > 0).all()
+    assert list(_lttb(x[:10], y[:10], 20)) == list(range(10))
@@ -12,6 +12,9 @@ except ImportError:
 import logging
 import time
 import warnings
+import numpy
+import pandas
+import pymongo
 from testing_utils import *
 
 
@@ -57,6 +60,78 @@ def test_database(test_dir):
             #     client.get_trial()
 
 
+def test_database_get_new_results_is_incremental(test_dir):
+    db_port = sherpa.core._port_finder(27000, 28000)
+    with sherpa.database._Database(test_dir, port=db_port) as db:
+        assert db.get_new_results() == []
+
+        client = sherpa.Client(port=db_port,
+                               connectTimeoutMS=100,
+                               serverSelectionTimeoutMS=1000)
+        t = get_test_trial()
+        client.send_metrics(trial=t, iteration=1, objective=0.1)
+        client.send_metrics(trial=t, iteration=2, objective=0.2)
+        assert [r['iteration'] for r in db.get_new_results()] == [1, 2]
+        assert db.get_new_results() == []
+
+        client.send_metrics(trial=t, iteration=3, objective=0.3)
+        assert [r['iteration'] for r in db.get_new_results()] == [3]
+        assert db.db.results.options().get('capped')
+
+        # A dead cursor resumes after the last result read.
+        db._results_cursor.close()
+        client.send_metrics(trial=t, iteration=4, objective=0.4)
+        assert [r['iteration'] for r in db.get_new_results()] == [4]
+
+
+def test_database_logs_overwritten_results(test_dir, caplog):
+    db_port = sherpa.core._port_finder(27000, 28000)
+    with sherpa.database._Database(test_dir, port=db_port,
+                                   results_size=4096) as db:
+        client = sherpa.Client(port=db_port,
+                               connectTimeoutMS=100,
+                               serverSelectionTimeoutMS=1000)
+        t = get_test_trial()
+        client.send_metrics(trial=t, iteration=1, objective=0.1)
+        assert len(db.get_new_results()) == 1
+        db._results_cursor.close()
+        for i in range(2, 100):
+            client.send_metrics(trial=t, iteration=i, objective=0.1)
+        iterations = [r['iteration'] for r in db.get_new_results()]
+        assert iterations == sorted(iterations) and iterations[-1] == 99
+        assert 'overwritten' in caplog.text
+
+
+def test_database_results_cursor_resumes_by_id(test_dir, caplog):
+    db = sherpa.database._Database(test_dir)
+    db.db = mock.MagicMock()
+    db._last_result_id = 'b'
+    resumed = iter([{'_id': 'b'}, {'_id': 'c'}])
+    db.db.results.find.side_effect = [iter([{'_id': 'a'}, {'_id': 'b'}]),
+                                      resumed]
+    assert db._open_results_cursor() is resumed
+    assert db.db.results.find.call_args[1]['skip'] == 1
+    assert 'overwritten' not in caplog.text
+
+    # The last result read was overwritten, reading restarts at the oldest.
+    oldest = iter([{'_id': 'd'}])
+    db.db.results.find.side_effect = [iter([{'_id': 'd'}]), oldest]
+    assert db._open_results_cursor() is oldest
+    assert 'skip' not in db.db.results.find.call_args[1]
+    assert 'overwritten' in caplog.text
+
+
+def test_database_creates_indexes(test_dir):
+    db_port = sherpa.core._port_finder(27000, 28000)
+    with sherpa.database._Database(test_dir, port=db_port) as db:
+        def keys(collection):
+            return [index['key'] for index in
+                    collection.index_information().values()]
+        assert [('trial_id', 1)] in keys(db.db.trials)
+        assert [('trial_id', 1), ('iteration', 1)] in keys(db.db.results)
+        assert [('trial_id', 1)] in keys(db.db.stop)
+
+
 def test_database_args(test_dir):
     custom_port = 26999
     testlogger.debug(test_dir)
@@ -97,3 +172,288 @@ def test_client_test_mode_keras_send_metrics_does_nothing():
     callback = client.keras_send_metrics(trial=trial, objective_name='val_acc',
                                          context_names=['val_loss', 'loss',
                                                         'acc'])
+
+
+def test_client_batches_metrics():
+    with mock.patch('sherpa.database.MongoClient'):
+        client = sherpa.Client(port=27000, batch_size=3)
+    results = client.db.results
+    t = get_test_trial()
+    for i in range(4):
+        client.send_metrics(trial=t, iteration=i + 1, objective=0.1)
+    assert not results.insert_one.called
+    assert results.insert_many.call_count == 1
+    assert [r['iteration'] for r in results.insert_many.call_args[0][0]] \
+        == [1, 2, 3]
+
+    client.close()
+    results.with_options.assert_called_with(
+        write_concern=pymongo.write_concern.WriteConcern(w=1, j=True))
+    assert [r['iteration'] for r in
+            results.with_options().insert_many.call_args[0][0]] == [4]
+
+
+def test_client_unacknowledged_holds_back_last_metric():
+    with mock.patch('sherpa.database.MongoClient'):
+        client = sherpa.Client(port=27000, batch_size=2, acknowledge=False)
+    client._results = unacknowledged = mock.MagicMock()
+    acknowledged = client.db.results.with_options.return_value
+    t = get_test_trial()
+    for i in range(2):
+        client.send_metrics(trial=t, iteration=i + 1, objective=0.1)
+    assert [r['iteration'] for r in
+            unacknowledged.insert_many.call_args[0][0]] == [1]
+
+    client.close()
+    assert [r['iteration'] for r in
+            acknowledged.insert_many.call_args[0][0]] == [2]
+
+
+def test_background_sender_retries_with_backoff():
+    sent = []
+    failures = [pymongo.errors.AutoReconnect('down')] * 2
+
+    def send(items, final):
+        if failures:
+            raise failures.pop()
+        sent.append((list(items), final))
+
+    sender = sherpa.database._BackgroundSender(
+        send, retry_exceptions=(pymongo.errors.ConnectionFailure,),
+        backoff=0.01)
+    sender.put(1)
+    sender.flush()
+    sender.put(2)
+    sender.close()
+    assert [item for items, _ in sent for item in items] == [1, 2]
+    assert [final for _, final in sent] == [False] * (len(sent) - 1) + [True]
+    with pytest.raises(RuntimeError):
+        sender.put(3)
+
+
+def test_client_asynchronous_send_metrics():
+    with mock.patch('sherpa.database.MongoClient'):
+        client = sherpa.Client(port=27000, asynchronous=True)
+    results = client.db.results
+    results.insert_many.side_effect = [pymongo.errors.AutoReconnect('down'),
+                                       None, None]
+    t = get_test_trial()
+    client.send_metrics(trial=t, iteration=1, objective=0.1)
+    client.flush()
+    assert [r['iteration'] for r in
+            results.insert_many.call_args[0][0]] == [1]
+    assert results.insert_many.call_count == 2
+
+    client.send_metrics(trial=t, iteration=2, objective=0.1)
+    client.close()
+    journaled = results.with_options.return_value
+    written = (results.insert_many.call_args_list[1:]
+               + journaled.insert_many.call_args_list)
+    assert sorted(r['iteration'] for c in written for r in c[0][0]) == [1, 2]
+
+
+def test_client_reopens_after_close():
+    with mock.patch('sherpa.database.MongoClient'):
+        buffered = sherpa.Client(port=27000, batch_size=3)
+    with mock.patch('sherpa.database.MongoClient'):
+        queued = sherpa.Client(port=27000, asynchronous=True)
+    t = get_test_trial()
+    for client in (buffered, queued):
+        assert client not in sherpa.database._open_clients
+        client.send_metrics(trial=t, iteration=1, objective=0.1)
+        client.close()
+        assert client not in sherpa.database._open_clients
+        client.send_metrics(trial=t, iteration=2, objective=0.1)
+        assert client in sherpa.database._open_clients
+
+    sherpa.database._close_clients()
+    assert not sherpa.database._open_clients
+    written = buffered.db.results.with_options.return_value.insert_many
+    assert [r['iteration'] for c in written.call_args_list
+            for r in c[0][0]] == [1, 2]
+
+
+def test_client_get_trial_waits_on_change_stream():
+    with mock.patch('sherpa.database.MongoClient'):
+        client = sherpa.Client(port=27000)
+    trials = client.db.trials
+    trials.find_one.return_value = None
+    stream = trials.watch.return_value
+    stream.try_next.side_effect = [
+        None, {'fullDocument': {'trial_id': 3, 'parameters': {'a': 1}}}]
+    with mock.patch.dict(os.environ, {'SHERPA_TRIAL_ID': '3'}):
+        t = client.get_trial()
+    assert t.id == 3 and t.parameters == {'a': 1}
+    assert stream.try_next.call_count == 2
+
+
+def test_client_get_trial_polls_without_change_stream():
+    with mock.patch('sherpa.database.MongoClient'):
+        client = sherpa.Client(port=27000)
+    trials = client.db.trials
+    trials.watch.side_effect = pymongo.errors.OperationFailure('no replset')
+    trials.find_one.side_effect = [None, None, {'trial_id': 3,
+                                                'parameters': {'a': 1}}]
+    with mock.patch.dict(os.environ, {'SHERPA_TRIAL_ID': '3'}):
+        t = client.get_trial()
+    assert t.id == 3 and t.parameters == {'a': 1}
+
+    trials.find_one.side_effect = None
+    trials.find_one.return_value = None
+    with mock.patch.dict(os.environ, {'SHERPA_TRIAL_ID': '3'}):
+        with pytest.raises(RuntimeError):
+            client.get_trial(timeout=0.05)
+
+
+def test_sqlite_database(test_dir):
+    path = os.path.join(test_dir, 'sherpa.db')
+    with sherpa.database._SQLiteDatabase(path) as db:
+        assert db.get_new_results() == []
+        db.enqueue_trial(get_test_trial())
+        assert db.client_env() == {'SHERPA_DB_PATH': path}
+
+        client = sherpa.Client(path=path)
+        with mock.patch.dict(os.environ, {'SHERPA_TRIAL_ID': '1'}):
+            t = client.get_trial()
+        assert t.id == 1
+        assert t.parameters == {'a': 1, 'b': 2}
+
+        client.send_metrics(trial=t, iteration=1,
+                            objective=0.1, context={'other_metric': 0.2})
+        assert db.get_new_results() == [{'context': {'other_metric': 0.2},
+                                         'iteration': 1,
+                                         'objective': 0.1,
+                                         'parameters': {'a': 1, 'b': 2},
+                                         'trial_id': 1}]
+        assert db.get_new_results() == []
+
+        batched = sherpa.Client(path=path, batch_size=2)
+        batched.send_metrics(trial=t, iteration=2, objective=0.2)
+        assert db.get_new_results() == []
+        batched.send_metrics(trial=t, iteration=3, objective=numpy.float32(0.3))
+        assert [r['iteration'] for r in db.get_new_results()] == [2, 3]
+        db.add_for_stopping(1)
+
+    with sherpa.database._SQLiteDatabase(path, reinstantiated=True) as db:
+        assert db.get_new_results() == []
+
+
+def test_client_uses_sqlite_path_from_environment(test_dir):
+    path = os.path.join(test_dir, 'sherpa.db')
+    with mock.patch.dict(os.environ, {'SHERPA_DB_PATH': path}):
+        assert sherpa.Client().path == path
+        with mock.patch('sherpa.database.MongoClient'):
+            assert sherpa.Client(port=27000).path is None
+
+
+sqlite_trial_script = """import sys
+sys.path.insert(0, {root!r})
+import sherpa
+client = sherpa.Client()
+trial = client.get_trial()
+for i in range(3):
+    client.send_metrics(trial=trial, iteration=i + 1,
+                        objective=trial.parameters['a'] / (i + 1))
+"""
+
+
+def test_optimize_with_sqlite_storage(test_dir):
+    filename = os.path.join(test_dir, 'trial.py')
+    with open(filename, 'w') as f:
+        f.write(sqlite_trial_script.format(
+            root=os.path.dirname(os.path.dirname(os.path.abspath(
+                sherpa.__file__)))))
+    best = sherpa.optimize(
+        parameters=[sherpa.Continuous('a', [1, 2])],
+        algorithm=sherpa.algorithms.RandomSearch(max_num_trials=3),
+        lower_is_better=True,
+        scheduler=sherpa.schedulers.LocalScheduler(output_dir=test_dir),
+        filename=filename,
+        output_dir=test_dir,
+        max_concurrent=3,
+        disable_dashboard=True,
+        storage='sqlite')
+    assert best['Iteration'] == 3
+    assert os.path.exists(os.path.join(test_dir, 'sherpa.db'))
+
+
+def test_optimize_with_local_pool_scheduler(test_dir):
+    with open(os.path.join(test_dir, 'pool_trial.py'), 'w') as f:
+        f.write("import sherpa\n\n\ndef run():\n"
+                + "\n".join("    " + line for line in
+                            sqlite_trial_script.splitlines()[2:]) + "\n")
+    sys.path.insert(0, test_dir)
+    try:
+        best = sherpa.optimize(
+            parameters=[sherpa.Continuous('a', [1, 2])],
+            algorithm=sherpa.algorithms.RandomSearch(max_num_trials=4),
+            lower_is_better=True,
+            scheduler=sherpa.schedulers.LocalPoolScheduler('pool_trial:run',
+                                                           num_workers=2),
+            output_dir=test_dir,
+            max_concurrent=2,
+            disable_dashboard=True,
+            storage='sqlite')
+    finally:
+        sys.path.remove(test_dir)
+    assert best['Iteration'] == 3
+    results = sherpa.core._ResultsJournal.load(test_dir)
+    assert (results['Status'] == 'COMPLETED').sum() == 4
+
+
+def test_optimize_resumes_with_load(test_dir):
+    filename = os.path.join(test_dir, 'trial.py')
+    with open(filename, 'w') as f:
+        f.write(sqlite_trial_script.format(
+            root=os.path.dirname(os.path.dirname(os.path.abspath(
+                sherpa.__file__)))))
+    kwargs = dict(parameters=[sherpa.Continuous('a', [1, 2])],
+                  lower_is_better=True,
+                  scheduler=sherpa.schedulers.LocalScheduler(
+                      output_dir=test_dir),
+                  filename=filename,
+                  output_dir=test_dir,
+                  max_concurrent=2,
+                  disable_dashboard=True,
+                  storage='sqlite')
+    best = sherpa.optimize(
+        algorithm=sherpa.algorithms.RandomSearch(max_num_trials=2), **kwargs)
+    results = sherpa.core._ResultsJournal.load(test_dir)
+
+    # The saved algorithm is done, so no trial runs again.
+    with mock.patch.object(sherpa.schedulers.LocalScheduler,
+                           'submit_job') as submit_job:
+        resumed = sherpa.optimize(
+            algorithm=sherpa.algorithms.RandomSearch(max_num_trials=10),
+            load=True, **kwargs)
+    assert not submit_job.called
+    assert resumed['Trial-ID'] == best['Trial-ID']
+    pandas.testing.assert_frame_equal(
+        sherpa.core._ResultsJournal.load(test_dir), results)
+
+
+def test_database_start_waits_until_ready(test_dir):
+    with mock.patch('sherpa.database.MongoClient') as mongo_client, \
+            mock.patch('sherpa.database.subprocess.Popen') as popen:
+        process = popen.return_value
+        process.pid = 123
+        process.poll.return_value = None
+        server_status = mongo_client.return_value.admin.command
+        server_status.side_effect = [
+            pymongo.errors.ServerSelectionTimeoutError('not up'),
+            {'pid': 456},  # someone else's server on the port.
+            {'pid': 123}]
+        db = sherpa.database._Database(test_dir, port=27000)
+        db.start()
+        assert server_status.call_count == 3
+
+        process.poll.return_value = 48
+        server_status.side_effect = None
+        with pytest.raises(OSError):
+            db.start()
+
+        process.poll.return_value = None
+        server_status.return_value = {'pid': 456}
+        db.start_timeout = 0.05
+        with pytest.raises(OSError):
+            db.start()
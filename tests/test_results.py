@@ -0,0 +1,293 @@
+"""
+SHERPA is a Python library for hyperparameter tuning of machine learning models.
+Copyright (C) 2018  Lars Hertel, Peter Sadowski, and Julian Collado.
+
+This file is part of SHERPA.
+
+SHERPA is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+SHERPA is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with SHERPA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import multiprocessing
+import os
+import threading
+import numpy
+import pandas
+import pytest
+from sherpa.results import _ResultsTable, _ResultsChannel, _ResultsJournal
+from testing_utils import *
+
+
+def _row(**kwargs):
+    return collections.OrderedDict(sorted(kwargs.items()))
+
+
+def test_results_table_empty():
+    table = _ResultsTable()
+    assert len(table) == 0
+    assert table.to_frame().empty
+
+
+def test_results_table_grows_and_keeps_dtypes():
+    table = _ResultsTable(capacity=2)
+    for i in range(10):
+        table.append(collections.OrderedDict([('Trial-ID', i),
+                                              ('Status', 'INTERMEDIATE'),
+                                              ('Objective', i / 10.)]))
+    df = table.to_frame()
+    assert len(df) == 10
+    assert list(df.columns) == ['Trial-ID', 'Status', 'Objective']
+    assert df['Trial-ID'].dtype == numpy.int64
+    assert df['Status'].dtype == object
+    assert df['Objective'].dtype == numpy.float64
+    assert list(df['Trial-ID']) == list(range(10))
+
+
+def test_results_table_upcasts_like_pandas():
+    table = _ResultsTable()
+    table.append(_row(a=1, b=1, c='x'))
+    table.append(_row(a=1.5, c=2, d=3))
+    df = table.to_frame()
+    assert list(df.columns) == ['a', 'b', 'c', 'd']
+    assert df['a'].dtype == numpy.float64
+    assert df['b'].dtype == numpy.float64 and numpy.isnan(df['b'][1])
+    assert df['c'].dtype == object and list(df['c']) == ['x', 2]
+    assert numpy.isnan(df['d'][0]) and df['d'][1] == 3
+
+
+def test_results_table_frame_is_cached():
+    table = _ResultsTable()
+    table.append(_row(a=1))
+    df = table.to_frame()
+    assert table.to_frame() is df
+    table.append(_row(a=2))
+    assert table.to_frame() is not df
+    assert len(df) == 1
+
+
+def test_results_table_from_frame():
+    df = pandas.DataFrame(collections.OrderedDict([('Trial-ID', [1, 2]),
+                                                   ('Objective', [0.1, 0.2])]))
+    table = _ResultsTable.from_frame(df)
+    table.append(_row(**{'Trial-ID': 3, 'Objective': 0.3}))
+    assert list(table.to_frame()['Trial-ID']) == [1, 2, 3]
+    assert table.row(2)['Objective'] == 0.3
+    with pytest.raises(IndexError):
+        table.row(3)
+
+
+def test_study_results_setter():
+    s = get_mock_study()
+    s.results = pandas.DataFrame({'Trial-ID': [1], 'Iteration': [1],
+                                  'Status': ['INTERMEDIATE'], 'a': [1],
+                                  'b': [2], 'Objective': [0.5]})
+    assert len(s.results) == 1
+    s.add_observation(trial=sherpa.Trial(2, {'a': 1, 'b': 2}), objective=0.1)
+    assert list(s.results['Trial-ID']) == [1, 2]
+
+
+def test_results_table_trial_index():
+    table = _ResultsTable()
+    table.append(_row(**{'Trial-ID': 1, 'Iteration': 1}))
+    table.append(_row(**{'Trial-ID': 2, 'Iteration': 1}))
+    table.append(_row(**{'Trial-ID': 1, 'Iteration': 2}))
+    assert table.has_trial(1) and not table.has_trial(3)
+    assert table.has_observation(1, 2)
+    assert not table.has_observation(2, 2)
+    assert table.trial_rows(1) == [0, 2]
+    assert table.trial_rows(3) == []
+
+    loaded = _ResultsTable.from_frame(table.to_frame())
+    assert loaded.has_observation(2, 1)
+    assert loaded.trial_rows(1) == [0, 2]
+
+
+def _read_channel_in_child(channel, queue):
+    queue.put(channel.read().to_dict('list'))
+
+
+def test_results_channel(test_dir):
+    channel = _ResultsChannel(path=os.path.join(test_dir, 'channel'))
+    assert channel.read().empty
+    channel.append(_row(**{'Trial-ID': 1, 'Objective': 0.5}))
+    channel.append(_row(**{'Trial-ID': 2, 'Objective': 0.1}))
+    df = channel.read()
+    assert list(df['Trial-ID']) == [1, 2]
+    assert channel.read() is df
+
+    queue = multiprocessing.Queue()
+    reader = multiprocessing.Process(target=_read_channel_in_child,
+                                     args=(channel, queue))
+    reader.start()
+    assert queue.get(timeout=10) == {'Objective': [0.5, 0.1],
+                                     'Trial-ID': [1, 2]}
+    reader.join()
+
+    channel.reset(pandas.DataFrame({'Trial-ID': [3], 'Objective': [0.3]}))
+    channel.append(_row(**{'Trial-ID': 4, 'Objective': 0.4}))
+    assert list(channel.read()['Trial-ID']) == [3, 4]
+
+    channel.close()
+    assert not os.path.exists(channel.path)
+
+
+def test_results_channel_concurrent_readers(test_dir):
+    channel = _ResultsChannel(path=os.path.join(test_dir, 'channel'))
+    for i in range(20000):
+        channel.append(_row(**{'Trial-ID': i, 'Status': 'INTERMEDIATE',
+                               'Objective': 0.5}))
+    barrier = threading.Barrier(4)
+    sizes, errors = [], []
+
+    def read():
+        try:
+            barrier.wait()
+            _, cursor, rows = channel.rows_since(None, 0)
+            with channel.read_table() as (_, table):
+                sizes.append((cursor, len(rows), len(table)))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert sizes == [(20000, 20000, 20000)] * 4
+    channel.close()
+
+
+def test_results_journal(test_dir):
+    table = _ResultsTable()
+    journal = _ResultsJournal(test_dir, min_compact_rows=4)
+    snapshot = os.path.join(test_dir, 'results.npz')
+    for i in range(3):
+        table.append(_row(**{'Trial-ID': i, 'Objective': i / 10.}))
+    journal.save(table, compact=None)  # first save writes a snapshot.
+    assert len(_ResultsTable.from_npz(snapshot)) == 3
+
+    for i in range(3, 6):
+        table.append(_row(**{'Trial-ID': i, 'Objective': i / 10.}))
+        journal.save(table, compact=None)
+    assert len(_ResultsTable.from_npz(snapshot)) == 3
+    assert list(_ResultsJournal.load(test_dir)['Trial-ID']) == list(range(6))
+
+    table.append(_row(**{'Trial-ID': 6, 'Objective': 0.6}))
+    journal.save(table, compact=None)  # journal reached the snapshot size.
+    assert len(_ResultsTable.from_npz(snapshot)) == 7
+    assert os.path.getsize(os.path.join(test_dir, 'results.journal')) == 0
+    journal.close()
+
+
+def test_results_journal_load_tolerates_crashes(test_dir):
+    table = _ResultsTable()
+    journal = _ResultsJournal(test_dir)
+    table.append(_row(**{'Trial-ID': 1, 'Objective': 0.1}))
+    journal.save(table)
+    table.append(_row(**{'Trial-ID': 2, 'Objective': 0.2}))
+    table.append(_row(**{'Trial-ID': 3, 'Objective': 0.3}))
+    journal.save(table, compact=False)
+    journal.close()
+
+    path = os.path.join(test_dir, 'results.journal')
+    with open(path, 'rb') as f:
+        records = f.read()
+    # A record repeating a row already in the snapshot, e.g. from a crash
+    # during compaction, and a cut-off last record are skipped.
+    with open(path, 'wb') as f:
+        f.write(records[:len(records) // 2 + 1])
+    loaded = _ResultsJournal.load(test_dir)
+    assert list(loaded['Trial-ID']) == [1, 2]
+
+    table.append(_row(**{'Trial-ID': 4, 'Objective': 0.4}))
+    journal.save(table, compact=True)
+    with open(path, 'ab') as f:
+        f.write(records)
+    assert list(_ResultsJournal.load(test_dir)['Trial-ID']) == [1, 2, 3, 4]
+
+
+def test_study_save_and_load_results(test_dir):
+    s = get_mock_study()
+    t = sherpa.Trial(1, {'a': 1, 'b': 2})
+    for i in range(3):
+        s.add_observation(trial=t, iteration=i + 1, objective=0.1 * i)
+        s.save(test_dir, compact=None)
+    s.finalize(t)
+    s.save(test_dir, compact=None)
+    loaded = _ResultsJournal.load(test_dir)
+    assert list(loaded['Iteration']) == [1, 2, 3, 3]
+    assert list(loaded['Status'])[-1] == 'COMPLETED'
+
+
+def test_results_table_npz_keeps_dtypes(test_dir):
+    table = _ResultsTable()
+    for i in range(3):
+        table.append(collections.OrderedDict([
+            ('Trial-ID', i), ('Status', 'INTERMEDIATE'), ('Iteration', i),
+            ('b', ['x', 2, 0.5][i]), ('c', i % 2 == 0),
+            ('Objective', i / 10.)]))
+    path = os.path.join(test_dir, 'results.npz')
+    with open(path, 'wb') as f:
+        table.to_npz(f)
+    loaded = _ResultsTable.from_npz(path)
+    df, expected = loaded.to_frame(), table.to_frame()
+    assert list(df.columns) == list(expected.columns)
+    assert (df.dtypes == expected.dtypes).all()
+    assert df['Trial-ID'].dtype == numpy.int64
+    assert list(df['b']) == ['x', 2, 0.5]
+    assert loaded.has_observation(2, 2)
+    loaded.append(_row(**{'Trial-ID': 3}))
+    assert len(loaded) == 4
+
+    # Object columns are stored as codes and labels, without pickling.
+    with numpy.load(path, allow_pickle=False) as data:
+        assert all(data[key].dtype != object for key in data.files)
+
+
+def test_results_table_npz_keeps_objects(test_dir):
+    table = _ResultsTable()
+    values = [[1, 2], None, 'x', [1, 2], numpy.int64(3)]
+    for i, value in enumerate(values):
+        table.append(_row(**{'Trial-ID': i, 'b': value}))
+    path = os.path.join(test_dir, 'results.npz')
+    with open(path, 'wb') as f:
+        table.to_npz(f)
+    b = list(_ResultsTable.from_npz(path).to_frame()['b'])
+    assert b[0] == b[3] == [1, 2] and b[2] == 'x' and b[4] == 3
+    assert numpy.isnan(b[1])
+
+
+def test_results_journal_reads_csv_snapshot(test_dir):
+    pandas.DataFrame({'Trial-ID': [1, 2]}).to_csv(
+        os.path.join(test_dir, 'results.csv'), index=False)
+    assert list(_ResultsJournal.load(test_dir)['Trial-ID']) == [1, 2]
+
+
+def test_results_table_reindex_matches_incremental_summaries():
+    table = _ResultsTable()
+    rows = [(1, 1, 'INTERMEDIATE', 0.5), (2, 1, 'INTERMEDIATE', float('nan')),
+            (1, 2, 'INTERMEDIATE', 0.2), (1, 3, 'INTERMEDIATE', 0.9),
+            (2, 2, 'INTERMEDIATE', 0.7), (1, 3, 'COMPLETED', 0.2),
+            (3, 1, 'INTERMEDIATE', 'n/a'), (4, 1, 'COMPLETED', 0.1)]
+    for trial_id, iteration, status, objective in rows:
+        table.append(_row(**{'Trial-ID': trial_id, 'Iteration': iteration,
+                             'Status': status, 'Objective': objective}))
+    loaded = _ResultsTable.from_frame(table.to_frame())
+    assert list(loaded.trial_summaries()) == [1, 2, 3, 4]
+    for trial_id, expected in table.trial_summaries().items():
+        summary = loaded.trial_summary(trial_id)
+        for attr in expected.__slots__:
+            a, b = getattr(summary, attr), getattr(expected, attr)
+            assert a == b or (numpy.isnan(a) and numpy.isnan(b)), attr
+        assert loaded.trial_rows(trial_id) == table.trial_rows(trial_id)
@@ -1,3 +1,5 @@
+import threading
+import time
 import sherpa
 import sherpa.core
 import sherpa.schedulers
@@ -51,10 +53,12 @@ def test_runner_update_active_trials():
     r._all_trials[t.id] = {'trial': t, 'job_id': None}
     r._active_trials.append(t.id)
 
-    mock_scheduler.get_status.return_value = sherpa.schedulers._JobStatus.running
+    mock_scheduler.get_statuses.return_value = {
+        None: sherpa.schedulers._JobStatus.running}
     r.update_active_trials()
 
-    mock_scheduler.get_status.return_value = sherpa.schedulers._JobStatus.finished
+    mock_scheduler.get_statuses.return_value = {
+        None: sherpa.schedulers._JobStatus.finished}
     r.update_active_trials()
 
     mock_study.finalize.assert_called_with(trial=t, status='COMPLETED')
@@ -87,7 +91,7 @@ def test_runner_stop_bad_performers():
 
 def test_runner_submit_new_trials():
     mock_scheduler = mock.MagicMock()
-    mock_scheduler.submit_job.side_effect = ['job1', 'job2', 'job3']
+    mock_scheduler.submit_jobs.return_value = ['job1', 'job2', 'job3']
     mock_study = mock.MagicMock()
     mock_study.get_suggestion.side_effect = [get_test_trial(1),
                                              get_test_trial(2),
@@ -97,12 +101,152 @@ def test_runner_submit_new_trials():
                       scheduler=mock_scheduler,
                       database=mock.MagicMock(),
                       max_concurrent=3,
-                      command=["python", "test.py"])
+                      command=["python", "test.py"],
+                      submit_workers=0)
 
     r.submit_new_trials()
 
-    mock_scheduler.submit_job.has_calls([mock.call(["python", "test.py"]),
-                                         mock.call(["python", "test.py"]),
-                                         mock.call(["python", "test.py"])])
+    # One bulk submission for all trials.
+    assert mock_scheduler.submit_jobs.call_count == 1
+    kwargs = mock_scheduler.submit_jobs.call_args[1]
+    assert kwargs['command'] == ["python", "test.py"]
+    assert kwargs['job_names'] == ['trial_1', 'trial_2', 'trial_3']
+    assert [env['SHERPA_TRIAL_ID'] for env in kwargs['envs']] == ['1', '2', '3']
     assert len(r._active_trials) == 3
-    assert len(r._all_trials) == 3
\ No newline at end of file
+    assert len(r._all_trials) == 3
+    assert r._all_trials[3]['job_id'] == 'job3'
+
+
+def test_runner_run_loop_backs_off_without_events():
+    mock_scheduler = mock.MagicMock()
+    mock_scheduler.notify_on_status_change.return_value = False
+    mock_scheduler.submit_jobs.return_value = ['job1']
+    mock_scheduler.get_statuses.return_value = {
+        'job1': sherpa.schedulers._JobStatus.running}
+    mock_study = mock.MagicMock()
+    mock_study.get_suggestion.side_effect = [get_test_trial(1),
+                                             sherpa.AlgorithmState.DONE]
+    mock_db = mock.MagicMock()
+    mock_db.notify_on_new_results.return_value = False
+    mock_db.get_new_results.return_value = []
+
+    r = sherpa.core._Runner(study=mock_study,
+                            scheduler=mock_scheduler,
+                            database=mock_db,
+                            max_concurrent=1,
+                            command=["python", "test.py"],
+                            min_wait=0.01, max_wait=0.04,
+                            submit_workers=0)
+    r._wakeup = mock.MagicMock()
+
+    def finish_after_waits(timeout):
+        if r._wakeup.wait.call_count == 4:
+            mock_scheduler.get_statuses.return_value = {
+                'job1': sherpa.schedulers._JobStatus.finished}
+    r._wakeup.wait.side_effect = finish_after_waits
+    r.run_loop()
+
+    waits = [c[0][0] for c in r._wakeup.wait.call_args_list]
+    assert waits[:4] == [0.01, 0.02, 0.04, 0.04]
+    assert waits[-1] == 0.01
+    assert mock_study.finalize.called
+    # Events are cleared before each iteration, never after a wait.
+    calls = [c[0] for c in r._wakeup.method_calls if c[0] != 'set']
+    assert calls[:4] == ['clear', 'wait', 'clear', 'wait']
+
+
+def test_runner_save_and_load():
+    mock_study = mock.MagicMock()
+    mock_scheduler = mock.MagicMock()
+    mock_scheduler.submit_jobs.return_value = ['job1', 'job2']
+    mock_study.get_suggestion.side_effect = [get_test_trial(1),
+                                             get_test_trial(2)]
+    r = sherpa.core._Runner(study=mock_study,
+                            scheduler=mock_scheduler,
+                            database=mock.MagicMock(),
+                            max_concurrent=2,
+                            command=["python", "test.py"],
+                            submit_workers=0)
+    r.submit_new_trials()
+    # Trial 3 is dispatched but its submission has not completed.
+    r._suggestions.append(get_test_trial(3))
+    r.max_concurrent = 3
+    r._submitter = mock.MagicMock()
+    r.submit_new_trials()
+    r.save()
+
+    state = {}
+    for c in mock_study.save.call_args_list:
+        for key, item, value in c[1]['runner_updates']:
+            if value is None:
+                state.setdefault(key, {}).pop(item)
+            else:
+                state.setdefault(key, {})[item] = value
+    assert list(state['active_trials']) == [1, 2]
+    assert state['all_trials'][2]['job_id'] == 'job2'
+    assert state['all_trials'][3]['job_id'] is None
+
+    # job1 is unknown to the new scheduler, job2 is still running.
+    new_scheduler = mock.MagicMock()
+    new_scheduler.get_status.side_effect = [
+        ValueError("Job not found."), sherpa.schedulers._JobStatus.running]
+    resumed = sherpa.core._Runner(study=mock.MagicMock(),
+                                  scheduler=new_scheduler,
+                                  database=mock.MagicMock(),
+                                  max_concurrent=2,
+                                  command=["python", "test.py"])
+    resumed.load(state)
+    assert resumed.study.add_trial.call_args_list == [
+        mock.call(state['all_trials'][3]['trial']),
+        mock.call(state['all_trials'][1]['trial'])]
+    assert resumed._active_trials == [2]
+    assert set(resumed._all_trials) == {1, 2, 3}
+
+
+def test_runner_submits_in_background():
+    suggested = threading.Event()
+    release = threading.Event()
+    mock_study = mock.MagicMock()
+    trials = [get_test_trial(i) for i in range(1, 5)]
+
+    def get_suggestion():
+        suggested.set()
+        return trials.pop(0) if trials else sherpa.AlgorithmState.DONE
+    mock_study.get_suggestion.side_effect = get_suggestion
+    mock_scheduler = mock.MagicMock()
+
+    def submit_jobs(command, envs, job_names):
+        release.wait(10)
+        return ['job' + env['SHERPA_TRIAL_ID'] for env in envs]
+    mock_scheduler.submit_jobs.side_effect = submit_jobs
+
+    r = sherpa.core._Runner(study=mock_study,
+                            scheduler=mock_scheduler,
+                            database=mock.MagicMock(),
+                            max_concurrent=2,
+                            command=["python", "test.py"],
+                            prefetch=1)
+    r.submit_new_trials()
+    assert suggested.wait(10)
+
+    def submit_until(condition):
+        for _ in range(100):
+            r.submit_new_trials()
+            if condition():
+                return
+            time.sleep(0.05)
+        raise AssertionError("Timed out.")
+
+    # While the first two trials are being submitted, the next suggestion
+    # is prefetched.
+    submit_until(lambda: r._submitting and len(r._suggestions) == 1)
+    assert r._active_trials == []
+    release.set()
+    submit_until(lambda: len(r._active_trials) == 2)
+    assert r._all_trials[2]['job_id'] == 'job2'
+    assert mock_scheduler.submit_jobs.call_count == 1
+
+    # Ended trials are refilled from the prefetched suggestion.
+    r._active_trials = []
+    submit_until(lambda: r._done)
+    assert sorted(r._all_trials) == [1, 2, 3, 4]
@@ -23,7 +23,11 @@ import sherpa.schedulers
 import tempfile
 import time
 import itertools
+import threading
 import shutil
+import subprocess
+import sys
+import pytest
 from testing_utils import *
 
 
@@ -86,7 +90,7 @@ def test_local_scheduler(test_dir):
     with open(os.path.join(test_dir, "test.py"), 'w') as f:
         f.write(trial_script)
 
-    s = sherpa.schedulers.LocalScheduler()
+    s = sherpa.schedulers.LocalScheduler(output_dir=test_dir)
 
     job_id = s.submit_job(["python", "{}/test.py".format(test_dir)],
                           env={'SHERPA_TRIAL_ID': '3'})
@@ -120,7 +124,8 @@ def test_local_scheduler_resources(test_dir):
         
         lst = range(4)
         resources = list(itertools.chain.from_iterable(itertools.repeat(x, multiple) for x in lst))
-        s = sherpa.schedulers.LocalScheduler(resources=resources)
+        s = sherpa.schedulers.LocalScheduler(output_dir=test_dir,
+                                             resources=resources)
 
         job_ids = []
         for id, gpu in zip(range(4), reversed(range(4))):
@@ -139,4 +144,301 @@ def test_local_scheduler_resources(test_dir):
         for id in job_ids:
             assert s.get_status(id) in [sherpa.schedulers._JobStatus.finished, sherpa.schedulers._JobStatus.other]
         
-        assert len(s.resources) == 4*multiple
\ No newline at end of file
+        assert len(s.resources) == 4*multiple
+
+
+def test_local_scheduler_notifies_on_exit(test_dir):
+    s = sherpa.schedulers.LocalScheduler(output_dir=test_dir)
+    event = threading.Event()
+    assert s.notify_on_status_change(event)
+
+    job_id = s.submit_job(["python", "-c", "import time; time.sleep(1)"])
+    assert not event.is_set()
+    assert s.get_status(job_id) == sherpa.schedulers._JobStatus.running
+
+    assert event.wait(10)
+    assert s.get_status(job_id) == sherpa.schedulers._JobStatus.finished
+
+
+def _mock_drmaa(states):
+    """
+    A stand-in for the drmaa module whose sessions report the job states in
+    ``states``, a dict of job ID to state name.
+    """
+    drmaa = mock.MagicMock()
+    for name in ['DrmaaException', 'InvalidJobException',
+                 'DrmCommunicationException', 'NoActiveSessionException',
+                 'AlreadyActiveSessionException']:
+        setattr(drmaa.errors, name, type(name, (Exception,), {}))
+    for name in ['UNDETERMINED', 'QUEUED_ACTIVE', 'SYSTEM_ON_HOLD',
+                 'USER_ON_HOLD', 'USER_SYSTEM_ON_HOLD', 'RUNNING',
+                 'SYSTEM_SUSPENDED', 'USER_SUSPENDED', 'DONE', 'FAILED']:
+        setattr(drmaa.JobState, name, name)
+
+    def job_status(job_id):
+        if job_id not in states:
+            raise drmaa.errors.InvalidJobException(job_id)
+        return states[job_id]
+    drmaa.Session.return_value.jobStatus.side_effect = job_status
+    return drmaa
+
+
+@pytest.mark.parametrize('scheduler_class',
+                         [sherpa.schedulers.SGEScheduler,
+                          sherpa.schedulers.SLURMScheduler])
+def test_drmaa_scheduler_batches_status_queries(scheduler_class):
+    states = {'1': 'RUNNING', '2': 'QUEUED_ACTIVE', '3': 'DONE'}
+    drmaa = _mock_drmaa(states)
+    with mock.patch.dict(sys.modules, {'drmaa': drmaa}):
+        s = scheduler_class(submit_options='', environment='',
+                            status_cache_ttl=60.)
+    statuses = s.get_statuses(['1', '2', '3', '4'])
+    assert statuses == {'1': sherpa.schedulers._JobStatus.running,
+                        '2': sherpa.schedulers._JobStatus.queued,
+                        '3': sherpa.schedulers._JobStatus.finished,
+                        '4': sherpa.schedulers._JobStatus.finished}
+    session = drmaa.Session.return_value
+    assert session.jobStatus.call_count == 4
+
+    # Statuses are served from the cache until it expires.
+    states['1'] = 'DONE'
+    assert s.get_status('1') == sherpa.schedulers._JobStatus.running
+    assert session.jobStatus.call_count == 4
+    s.kill_job('2')
+    del states['2']
+    assert s.get_status('2') == sherpa.schedulers._JobStatus.killed
+    s.status_cache_ttl = 0.
+    assert s.get_status('1') == sherpa.schedulers._JobStatus.finished
+    assert session.jobStatus.call_count == 6
+
+
+@pytest.mark.parametrize('scheduler_class',
+                         [sherpa.schedulers.SGEScheduler,
+                          sherpa.schedulers.SLURMScheduler])
+def test_drmaa_scheduler_reuses_session(scheduler_class):
+    drmaa = _mock_drmaa({'1': 'RUNNING'})
+    with mock.patch.dict(sys.modules, {'drmaa': drmaa}):
+        s = scheduler_class(submit_options='', environment='',
+                            status_cache_ttl=0.)
+    session = drmaa.Session.return_value
+    for _ in range(3):
+        assert s.get_status('1') == sherpa.schedulers._JobStatus.running
+    s.kill_job('1')
+    assert session.initialize.call_count == 1
+
+    # A lost connection opens a new session and retries the call.
+    session.jobStatus.side_effect = [
+        drmaa.errors.DrmCommunicationException('lost'), 'RUNNING']
+    assert s.get_status('1') == sherpa.schedulers._JobStatus.running
+    assert session.exit.call_count == 1
+    assert session.initialize.call_count == 2
+
+    assert s.timings['jobStatus']['calls'] == 4
+    assert s.timings['control']['calls'] == 1
+    assert s.timings['initialize']['calls'] == 2
+    s.close()
+    assert session.exit.call_count == 2
+
+
+@pytest.mark.parametrize('scheduler_class,task_variable,separator',
+                         [(sherpa.schedulers.SGEScheduler, 'SGE_TASK_ID', '.'),
+                          (sherpa.schedulers.SLURMScheduler,
+                           'SLURM_ARRAY_TASK_ID', '_')])
+def test_drmaa_scheduler_submits_array_job(test_dir, scheduler_class,
+                                           task_variable, separator):
+    with mock.patch.dict(sys.modules, {'drmaa': _mock_drmaa({})}):
+        s = scheduler_class(submit_options='-q test', environment='',
+                            output_dir=test_dir)
+    with mock.patch.object(scheduler_class, '_submit_job',
+                           return_value='42') as submit_job:
+        job_ids = s.submit_jobs(
+            command=['echo', '$SHERPA_TRIAL_ID'],
+            envs=[{'SHERPA_TRIAL_ID': '7'}, {'SHERPA_TRIAL_ID': '8'}],
+            job_names=['trial_7', 'trial_8'])
+    assert job_ids == ['42{}1'.format(separator), '42{}2'.format(separator)]
+    assert submit_job.call_count == 1
+    submit_command, job_script = submit_job.call_args[0]
+    assert '1-2' in submit_command and '-q test' in submit_command
+
+    # Each array task runs with the environment of its trial.
+    for task_id, trial_id in [('1', '7'), ('2', '8')]:
+        env = dict(os.environ, **{task_variable: task_id})
+        subprocess.check_call(['bash', '-c', job_script], env=env)
+        with open(os.path.join(test_dir, 'jobs',
+                               'trial_{}.out'.format(trial_id))) as f:
+            assert f.read().splitlines()[-1] == trial_id
+
+
+pool_trial_module = """import os
+import sys
+import time
+calls = []
+
+
+def run():
+    calls.append(os.environ['SHERPA_TRIAL_ID'])
+    print(os.getpid(), len(calls))
+    if os.environ['SHERPA_TRIAL_ID'] == 'fail':
+        raise RuntimeError('trial failed')
+    if os.environ['SHERPA_TRIAL_ID'] == 'sleep':
+        time.sleep(60)
+    if os.environ['SHERPA_TRIAL_ID'] == 'client':
+        import sherpa
+        client = sherpa.Client(batch_size=10)
+        client.send_metrics(trial=sherpa.Trial(1, {}), iteration=1,
+                            objective=0.5)
+    if os.environ['SHERPA_TRIAL_ID'] == 'exit':
+        print('SHERPA_DB_PATH' in os.environ)
+        sys.exit()
+"""
+
+
+def test_local_pool_scheduler(test_dir):
+    with open(os.path.join(test_dir, 'pool_trial.py'), 'w') as f:
+        f.write(pool_trial_module)
+    sys.path.insert(0, test_dir)
+    s = sherpa.schedulers.LocalPoolScheduler('pool_trial:run', num_workers=2,
+                                             output_dir=test_dir)
+    event = threading.Event()
+    assert s.notify_on_status_change(event)
+    try:
+        job_ids = [s.submit_job([], env={'SHERPA_TRIAL_ID': str(i)},
+                                job_name='trial_{}'.format(i))
+                   for i in range(6)]
+        failed = s.submit_job([], env={'SHERPA_TRIAL_ID': 'fail'},
+                              job_name='trial_fail')
+        finished = sherpa.schedulers._JobStatus.finished
+        for _ in range(100):
+            if all(s.get_status(job_id) == finished for job_id in job_ids):
+                break
+            time.sleep(0.1)
+        assert event.is_set()
+        assert s.get_status(failed) == sherpa.schedulers._JobStatus.other
+
+        # Workers run many trials, importing the trial module only once.
+        outputs = []
+        for i in range(6):
+            with open(os.path.join(test_dir, 'jobs',
+                                   'trial_{}.out'.format(i))) as f:
+                outputs.append(f.read().split())
+        assert len(set(pid for pid, _ in outputs)) <= 2
+        assert max(int(count) for _, count in outputs) >= 3
+        with open(os.path.join(test_dir, 'jobs', 'trial_fail.out')) as f:
+            assert 'RuntimeError: trial failed' in f.read()
+
+        sleeping = s.submit_job([], env={'SHERPA_TRIAL_ID': 'sleep'})
+        time.sleep(0.5)
+        assert s.get_status(sleeping) == sherpa.schedulers._JobStatus.running
+        s.kill_job(sleeping)
+        assert s.get_status(sleeping) == sherpa.schedulers._JobStatus.killed
+        with pytest.raises(ValueError):
+            s.get_status(1000)
+    finally:
+        s.close()
+        sys.path.remove(test_dir)
+
+
+def test_local_pool_scheduler_closes_clients(test_dir):
+    with open(os.path.join(test_dir, 'pool_trial.py'), 'w') as f:
+        f.write(pool_trial_module)
+    sys.path.insert(0, test_dir)
+    db = sherpa.database._SQLiteDatabase(os.path.join(test_dir, 'sherpa.db'))
+    db.start()
+    s = sherpa.schedulers.LocalPoolScheduler('pool_trial:run', num_workers=1,
+                                             output_dir=test_dir)
+    try:
+        env = dict(db.client_env(), SHERPA_TRIAL_ID='client')
+        job_id = s.submit_job([], env=env)
+        for _ in range(100):
+            if s.get_status(job_id) != sherpa.schedulers._JobStatus.running:
+                break
+            time.sleep(0.1)
+        assert s.get_status(job_id) == sherpa.schedulers._JobStatus.finished
+        # The worker keeps running, the trial's buffered metric is written.
+        assert [r['objective'] for r in db.get_new_results()] == [0.5]
+
+        # The next trial on the worker does not see the last one's
+        # environment, and a plain sys.exit() is a success.
+        job_id = s.submit_job([], env={'SHERPA_TRIAL_ID': 'exit'},
+                              job_name='exit')
+        for _ in range(100):
+            if s.get_status(job_id) != sherpa.schedulers._JobStatus.running:
+                break
+            time.sleep(0.1)
+        assert s.get_status(job_id) == sherpa.schedulers._JobStatus.finished
+        with open(os.path.join(test_dir, 'jobs', 'exit.out')) as f:
+            assert f.read().split()[-1] == 'False'
+    finally:
+        s.close()
+        db.close()
+        sys.path.remove(test_dir)
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_getaffinity'),
+                    reason="needs CPU affinity")
+@pytest.mark.parametrize('taskset', [True, False])
+def test_local_scheduler_pins_before_command_runs(test_dir, monkeypatch,
+                                                  taskset):
+    if not taskset:
+        monkeypatch.setattr(sherpa.schedulers, '_TASKSET', None)
+    elif sherpa.schedulers._TASKSET is None:
+        pytest.skip("needs taskset")
+    core = sorted(os.sched_getaffinity(0))[-1]
+    s = sherpa.schedulers.LocalScheduler(output_dir=test_dir, cores=[core],
+                                         cores_per_trial=1)
+    job_id = s.submit_job(
+        [sys.executable, '-c',
+         'import os; print(sorted(os.sched_getaffinity(0)))'],
+        job_name='pinned')
+    s.jobs[job_id].wait()
+    assert (s.jobs[job_id].args[0] == sherpa.schedulers._TASKSET) == taskset
+    with open(os.path.join(test_dir, 'jobs', 'pinned.out')) as f:
+        assert f.read().strip() == str([core])
+
+
+def test_local_scheduler_packs_jobs_by_resources(test_dir):
+    script = ("import os, sys, time\n"
+              "print(os.environ['SHERPA_RESOURCE'], "
+              "os.environ['SHERPA_CORES'], os.environ['SHERPA_MEMORY'], "
+              "sorted(os.sched_getaffinity(0)) "
+              "if hasattr(os, 'sched_getaffinity') else None)\n"
+              "time.sleep(float(sys.argv[1]))\n")
+    with open(os.path.join(test_dir, 'test.py'), 'w') as f:
+        f.write(script)
+    cores = (sorted(os.sched_getaffinity(0))
+             if hasattr(os, 'sched_getaffinity') else [0])
+    # Two slots on one core, so that the test runs on a single CPU.
+    s = sherpa.schedulers.LocalScheduler(
+        output_dir=test_dir, resources=['gpu0', 'gpu1', 'gpu2'],
+        resources_per_trial=2, cores=cores[:1] * 2, cores_per_trial=1,
+        memory=10., memory_per_trial=4.)
+    event = threading.Event()
+    s.notify_on_status_change(event)
+
+    # Only one job fits the resources, the second one waits for it.
+    first = s.submit_job([sys.executable, os.path.join(test_dir, 'test.py'),
+                          '1'], job_name='first')
+    second = s.submit_job([sys.executable, os.path.join(test_dir, 'test.py'),
+                           '0'], job_name='second')
+    assert s.get_status(first) == sherpa.schedulers._JobStatus.running
+    assert s.get_status(second) == sherpa.schedulers._JobStatus.queued
+    assert s.memory == 6. and s.resources == ['gpu0']
+    third = s.submit_job(["python", "-c", "pass"])
+    s.kill_job(third)
+    assert s.get_status(third) == sherpa.schedulers._JobStatus.killed
+
+    # The second job starts when the first exits, without polling.
+    assert event.wait(10)
+    for _ in range(100):
+        if second in s.jobs and s.jobs[second].poll() is not None:
+            break
+        time.sleep(0.1)
+    assert s.get_status(second) == sherpa.schedulers._JobStatus.finished
+    assert s.get_status(first) == sherpa.schedulers._JobStatus.finished
+    assert s.memory == 10. and sorted(s.resources) == ['gpu0', 'gpu1', 'gpu2']
+
+    with open(os.path.join(test_dir, 'jobs', 'first.out')) as f:
+        output = f.read().split(' ', 3)
+    assert output[:3] == ['gpu2,gpu1', str(cores[0]), '4.0']
+    if hasattr(os, 'sched_getaffinity'):
+        assert output[3].strip() == str([cores[0]])
@@ -17,6 +17,7 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with SHERPA.  If not, see <http://www.gnu.org/licenses/>.
 """
+import os
 import pytest
 import sherpa
 import sherpa.core
@@ -24,6 +25,7 @@ import sherpa.schedulers
 import sherpa.database
 import pandas
 import collections
+import threading
 try:
     import unittest.mock as mock
 except ImportError:
@@ -49,6 +51,22 @@ def test_parameters():
     assert all(ch.sample() in [1, 10] for _ in range(10))
 
 
+def test_parameters_sample_size():
+    c, cl, d, dl, ch = get_test_parameters()
+    for p in (c, cl, d, dl):
+        values = p.sample(size=100)
+        assert values.shape == (100,)
+        assert ((1 <= values) & (values <= p.range[1])).all()
+    assert d.sample(size=5).dtype.kind == dl.sample(size=5).dtype.kind == 'i'
+    assert set(ch.sample(size=100)) <= {1, 10}
+
+    mixed = sherpa.Choice('e', ['x', 1, [2, 3]])
+    values = mixed.sample(size=50)
+    assert values.dtype == object
+    assert all(v in mixed.range for v in values)
+    assert set(sherpa.Ordinal('f', ['s', 'm']).sample(size=10)) <= {'s', 'm'}
+
+
 
 
 
@@ -118,3 +136,127 @@ def test_study_finalize():
     ))
 
     assert s.results.equals(expected_df)
+
+
+def test_study_get_trial_summaries():
+    s = get_mock_study()
+    t1 = sherpa.Trial(1, {'a': 1, 'b': 2})
+    t2 = sherpa.Trial(2, {'a': 2, 'b': 5})
+    s.add_observation(trial=t1, iteration=1, objective=0.3)
+    s.add_observation(trial=t1, iteration=2, objective=float('nan'))
+    s.add_observation(trial=t1, iteration=3, objective=0.2)
+    s.add_observation(trial=t2, iteration=1, objective=0.5)
+    s.finalize(trial=t1, status='COMPLETED')
+
+    summaries = s.get_trial_summaries()
+    assert list(summaries.index) == [1, 2]
+    assert summaries.loc[1, 'Objective'] == 0.2
+    assert summaries.loc[1, 'Iteration'] == 3
+    assert summaries.loc[1, 'Count'] == 3
+    assert summaries.loc[1, 'NaN-Count'] == 1
+    assert summaries.loc[1, 'Status'] == 'COMPLETED'
+    assert summaries.loc[2, 'Status'] == 'INTERMEDIATE'
+
+    completed = s.results.query("Status == 'COMPLETED'")
+    assert list(completed['Objective']) == [0.2]
+    assert list(completed['Iteration']) == [3]
+
+
+def test_study_finalize_only_nans():
+    s = get_mock_study()
+    t = s.get_suggestion()
+    s.add_observation(trial=t, iteration=1, objective=float('nan'))
+    with pytest.warns(RuntimeWarning):
+        s.finalize(trial=t, status='COMPLETED')
+    assert len(s.results) == 1
+
+
+def test_study_save_and_load(test_dir):
+    parameters = [sherpa.Continuous('a', [0, 1]),
+                  sherpa.Choice('b', ['x', 'y'])]
+    algorithm = sherpa.algorithms.SuccessiveHalving(r=1, R=3, eta=3)
+    s = sherpa.Study(parameters=parameters, algorithm=algorithm,
+                     lower_is_better=True, disable_dashboard=True,
+                     output_dir=test_dir)
+    trials = [s.get_suggestion() for _ in range(3)]
+    for t in trials:
+        s.add_observation(trial=t, iteration=1, objective=t.parameters['a'])
+        s.finalize(t)
+    s.add_trial(trials[0])
+    s.save(runner_state={'active_trials': [3]})
+
+    loaded = sherpa.Study(parameters=parameters,
+                          algorithm=sherpa.algorithms.SuccessiveHalving(),
+                          lower_is_better=True, disable_dashboard=True,
+                          output_dir=test_dir)
+    assert loaded.load() == {'active_trials': [3]}
+    assert loaded.num_trials == 3
+    assert loaded.algorithm.promoted_trials == algorithm.promoted_trials
+    assert loaded.algorithm.config_counter == algorithm.config_counter
+    assert loaded.get_suggestion().id == trials[0].id
+    pandas.testing.assert_frame_equal(loaded.results, s.results)
+
+    # The resumed study makes the same suggestions the saved one would have.
+    assert s.get_suggestion().id == trials[0].id
+    expected = s.get_suggestion()
+    loaded.load()
+    loaded.get_suggestion()
+    actual = loaded.get_suggestion()
+    assert (actual.id, actual.parameters) == (expected.id, expected.parameters)
+
+
+def test_study_saves_runner_updates_incrementally(test_dir):
+    s = get_mock_study()
+    s.output_dir = test_dir
+    s.save(runner_state={'all_trials': {}, 'active_trials': {}})
+    journal = os.path.join(test_dir, 'runner.journal')
+    snapshot = os.path.getsize(os.path.join(test_dir, 'runner.pkl'))
+    s.save(runner_updates=[('all_trials', 1, 'a'), ('active_trials', 1, True)])
+    s.save(runner_updates=[('all_trials', 2, 'b'), ('active_trials', 1, None)])
+    assert os.path.getsize(os.path.join(test_dir, 'runner.pkl')) == snapshot
+    with open(journal, 'ab') as f:
+        f.write(b'\x80')  # a record cut short by a crash.
+
+    loaded = get_mock_study()
+    loaded.output_dir = test_dir
+    assert loaded.load() == {'all_trials': {1: 'a', 2: 'b'},
+                             'active_trials': {}}
+    assert os.path.getsize(journal) == 0
+
+    # The journal is folded into the snapshot once it is large enough.
+    loaded.save(runner_updates=[('all_trials', i, i) for i in range(1000)])
+    assert os.path.getsize(journal) == 0
+    assert len(loaded.load()['all_trials']) == 1000
+
+
+def _objective(trial):
+    if trial.id == 2:
+        raise RuntimeError("Trial failed.")
+    return trial.parameters['a'], {'double': 2 * trial.parameters['a']}
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_study_run(test_dir, executor):
+    s = sherpa.Study(parameters=[sherpa.Continuous('a', [0, 1])],
+                     algorithm=sherpa.algorithms.RandomSearch(max_num_trials=6),
+                     lower_is_better=True, disable_dashboard=True,
+                     output_dir=test_dir)
+    best = s.run(_objective, max_concurrent=3, executor=executor)
+    completed = s.results.query("Status == 'COMPLETED'")
+    assert sorted(completed['Trial-ID']) == [1, 3, 4, 5, 6]
+    assert (completed['double'] == 2 * completed['Objective']).all()
+    assert best['Objective'] == completed['Objective'].min()
+    assert os.path.exists(os.path.join(test_dir, 'results.csv'))
+
+
+def test_study_run_evaluates_trials_concurrently():
+    s = sherpa.Study(parameters=[sherpa.Continuous('a', [0, 1])],
+                     algorithm=sherpa.algorithms.RandomSearch(max_num_trials=4),
+                     lower_is_better=True, disable_dashboard=True)
+    barrier = threading.Barrier(2, timeout=10)
+
+    def objective(trial):
+        barrier.wait()  # only passes if two trials run at the same time.
+        return trial.parameters['a']
+    s.run(objective, max_concurrent=2)
+    assert len(s.results.query("Status == 'COMPLETED'")) == 4
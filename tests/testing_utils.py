@@ -40,6 +40,7 @@ def get_mock_study():
     mock_algorithm = mock.MagicMock()
     mock_algorithm.get_suggestion.return_value = {'a': 1, 'b': 2}
     mock_stopping_rule = mock.MagicMock()
+    mock_stopping_rule.uses_trial_summaries = False
 
     return sherpa.Study(parameters=[sherpa.Discrete('a', [1,2]),
                                     sherpa.Choice('b', [2,5,7])],